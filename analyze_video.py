@@ -0,0 +1,295 @@
+#!/usr/bin/env python3
+"""Score recorded workout videos offline.
+
+Usage:
+    python analyze_video.py squats session1.mp4 session2.mp4 --out-dir results
+"""
+
+import argparse
+import csv
+import os
+import queue
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import cv2
+import numpy as np
+
+from cpu_budget import INFERENCE_THREADS
+from exercise_engine import REP_GOOD, REP_NONE, ExerciseEngine
+from joint_angles import JOINT_NAMES, NUM_LANDMARKS, compute_angles, landmarks_to_array
+from landmark_tracking import LandmarkTracker, tracking_image
+from pose_roi import RegionOfInterest
+from threaded_pose import ThreadedPose
+from workout_sessions import WorkoutSession
+
+# Decoded frames buffered ahead of inference
+DECODE_QUEUE_SIZE = 8
+
+
+def _decode_frames(capture, frames, stop):
+    """Read, timestamp and colour-convert frames on a background thread"""
+    index = 0
+    try:
+        while not stop.is_set():
+            ok, frame = capture.read()
+            if not ok:
+                break
+            timestamp = capture.get(cv2.CAP_PROP_POS_MSEC) / 1000.0
+            rgb_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+
+            # Block while the queue is full, but give up once inference stops
+            while not stop.is_set():
+                try:
+                    frames.put((index, timestamp, rgb_frame), timeout=0.1)
+                    break
+                except queue.Full:
+                    pass
+            index += 1
+    finally:
+        capture.release()
+        if not stop.is_set():
+            frames.put(None)
+
+
+def _infer_landmarks(pose, rgb_frame, roi=None):
+    """Landmark array of the pose in a frame, or None"""
+    def process(image):
+        results = pose.process(image)
+        if not results.pose_landmarks:
+            return None
+        return landmarks_to_array(results.pose_landmarks.landmark)
+
+    if roi is None:
+        return process(rgb_frame)
+    # Frames arrive converted already, the window only crops and shrinks them
+    return roi.locate(rgb_frame, process, code=None)
+
+
+def analyze_video(path, exercise, engine=None, model_complexity=1, keyframes=False, roi=False,
+                  num_threads=INFERENCE_THREADS):
+    """Run a video through pose inference and the exercise engine.
+
+    Returns a dict of per-frame columns (frame, time, detected, landmarks,
+    angles, stage, reps, good_reps, rep_event) plus a summary. Frames without
+    a detected pose have NaN landmarks and angles. With ``keyframes`` pose
+    inference only runs on keyframes and landmarks are tracked in between.
+    With ``roi`` inference runs on a crop around the previous frame's pose.
+    Inference runs on ``num_threads`` threads, like a server session's.
+    """
+    engine = engine or ExerciseEngine.from_file()
+    if exercise not in engine:
+        raise ValueError(f"Unknown exercise: {exercise}")
+
+    capture = cv2.VideoCapture(path)
+    if not capture.isOpened():
+        raise ValueError(f"Could not open video: {path}")
+
+    # Hold timers start at the first frame's video time, not the wall clock
+    state = WorkoutSession(os.path.basename(path), exercise, stage=engine.initial_stage(exercise))
+
+    columns = {key: [] for key in (
+        'frame', 'time', 'detected', 'landmarks', 'angles',
+        'stage', 'reps', 'good_reps', 'rep_event'
+    )}
+    missing_points = np.full((NUM_LANDMARKS, 4), np.nan, dtype=np.float32)
+    missing_angles = np.full(len(JOINT_NAMES), np.nan, dtype=np.float32)
+    tracker = LandmarkTracker() if keyframes else None
+    roi = RegionOfInterest() if roi else None
+
+    frames = queue.Queue(maxsize=DECODE_QUEUE_SIZE)
+    stop = threading.Event()
+    decoder = threading.Thread(target=_decode_frames, args=(capture, frames, stop), daemon=True)
+    started = time.monotonic()
+    decoder.start()
+
+    try:
+        with ThreadedPose(num_threads, static_image_mode=False, model_complexity=model_complexity,
+                          min_detection_confidence=0.5, min_tracking_confidence=0.5) as pose:
+            while True:
+                item = frames.get()
+                if item is None:
+                    break
+                index, timestamp, rgb_frame = item
+
+                if tracker is None:
+                    points = _infer_landmarks(pose, rgb_frame, roi)
+                else:
+                    image = tracking_image(rgb_frame, cv2.COLOR_RGB2GRAY)
+                    points, _ = tracker.update(image, timestamp, lambda: _infer_landmarks(pose, rgb_frame, roi))
+
+                rep_event = REP_NONE
+                detected = points is not None
+                if detected:
+                    if roi is not None:
+                        roi.update(points)
+                    angles = compute_angles(points)
+                    rep_event = engine.update(state, points, angles, now=timestamp)
+                else:
+                    points, angles = missing_points, missing_angles
+
+                columns['frame'].append(index)
+                columns['time'].append(timestamp)
+                columns['detected'].append(detected)
+                columns['landmarks'].append(points)
+                columns['angles'].append(angles)
+                columns['stage'].append(state.stage)
+                columns['reps'].append(state.counter)
+                columns['good_reps'].append(state.good_reps)
+                columns['rep_event'].append(rep_event)
+    finally:
+        # Unblock the decoder if it is waiting on a full queue
+        stop.set()
+        while decoder.is_alive():
+            try:
+                frames.get(timeout=0.1)
+            except queue.Empty:
+                pass
+
+    elapsed = time.monotonic() - started
+    result = {
+        'frame': np.array(columns['frame'], dtype=np.int32),
+        'time': np.array(columns['time'], dtype=np.float64),
+        'detected': np.array(columns['detected'], dtype=bool),
+        'landmarks': np.array(columns['landmarks'], dtype=np.float32).reshape(-1, NUM_LANDMARKS, 4),
+        'angles': np.array(columns['angles'], dtype=np.float32).reshape(-1, len(JOINT_NAMES)),
+        'stage': np.array(columns['stage'], dtype=str),
+        'reps': np.array(columns['reps'], dtype=np.int32),
+        'good_reps': np.array(columns['good_reps'], dtype=np.int32),
+        'rep_event': np.array(columns['rep_event'], dtype=np.int8),
+    }
+    result['summary'] = {
+        'video': path,
+        'exercise': exercise,
+        'frames': len(result['frame']),
+        'detected_frames': int(result['detected'].sum()),
+        'reps': state.counter,
+        'good_reps': state.good_reps,
+        'duration': float(result['time'][-1]) if len(result['time']) else 0.0,
+        'processing_fps': len(result['frame']) / elapsed if elapsed > 0 else 0.0,
+    }
+    if tracker is not None:
+        result['summary']['tracking'] = tracker.stats()
+    return result
+
+
+def rep_events(result):
+    """List the frames at which reps were counted"""
+    indices = np.flatnonzero(result['rep_event'] != REP_NONE)
+    return [
+        {
+            'frame': int(result['frame'][i]),
+            'time': float(result['time'][i]),
+            'rep': int(result['reps'][i]),
+            'good': bool(result['rep_event'][i] == REP_GOOD)
+        }
+        for i in indices
+    ]
+
+
+def save_npz(result, path):
+    """Write the per-frame columns as a compressed NumPy archive"""
+    columns = {key: value for key, value in result.items() if key != 'summary'}
+    np.savez_compressed(path, joint_names=np.array(JOINT_NAMES), **columns)
+
+
+def save_csv(result, path):
+    """Write one row per frame with flattened angles and landmarks"""
+    header = ['frame', 'time', 'detected', 'stage', 'reps', 'good_reps', 'rep_event']
+    header += [f'angle_{name}' for name in JOINT_NAMES]
+    header += [f'lm{i}_{field}' for i in range(NUM_LANDMARKS) for field in 'xyzv']
+
+    landmarks = result['landmarks'].reshape(len(result['frame']), -1)
+    with open(path, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(header)
+        for i in range(len(result['frame'])):
+            writer.writerow(
+                [result['frame'][i], f"{result['time'][i]:.3f}", int(result['detected'][i]),
+                 result['stage'][i], result['reps'][i], result['good_reps'][i], result['rep_event'][i]]
+                + [f'{v:.2f}' for v in result['angles'][i]]
+                + [f'{v:.5f}' for v in landmarks[i]]
+            )
+
+
+def output_names(paths):
+    """Distinct output file stems for the videos, after their paths below the common directory"""
+    paths = [os.path.abspath(path) for path in paths]
+    common = os.path.commonpath([os.path.dirname(path) for path in paths])
+    names = []
+    for index, path in enumerate(paths):
+        name = os.path.splitext(os.path.relpath(path, common))[0].replace(os.sep, '__')
+        if name in names:
+            # Same name apart from the extension
+            name = f'{name}-{index}'
+        names.append(name)
+    return names
+
+
+def _analyze_to_file(path, exercise, base, fmt, model_complexity, keyframes, roi):
+    """Analyse one video and write its output file next to ``base`` (runs in a worker process)"""
+    result = analyze_video(path, exercise, model_complexity=model_complexity,
+                           keyframes=keyframes, roi=roi)
+    if fmt == 'csv':
+        output = base + '.csv'
+        save_csv(result, output)
+    else:
+        output = base + '.npz'
+        save_npz(result, output)
+
+    summary = result['summary']
+    summary['output'] = output
+    return summary
+
+
+def analyze_videos(paths, exercise, out_dir, fmt='npz', workers=None, model_complexity=1,
+                   keyframes=False, roi=False):
+    """Analyse several videos in parallel, one process per video at a time"""
+    os.makedirs(out_dir, exist_ok=True)
+    workers = workers or min(len(paths), os.cpu_count() or 1)
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = {
+            executor.submit(_analyze_to_file, path, exercise, os.path.join(out_dir, name), fmt,
+                            model_complexity, keyframes, roi): path
+            for path, name in zip(paths, output_names(paths))
+        }
+        summaries = []
+        for future, path in futures.items():
+            try:
+                summaries.append(future.result())
+            except Exception as e:
+                print(f"Error analysing {path}: {e}")
+                summaries.append({'video': path, 'error': str(e)})
+    return summaries
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Score recorded workout videos offline")
+    parser.add_argument('exercise', help="Exercise to score, as named in exercise_specs.json")
+    parser.add_argument('videos', nargs='+', help="Video files to analyse")
+    parser.add_argument('--out-dir', default='analysis', help="Directory for the output files")
+    parser.add_argument('--format', choices=('npz', 'csv'), default='npz')
+    parser.add_argument('--workers', type=int, default=None, help="Worker processes (default: one per core)")
+    parser.add_argument('--model-complexity', type=int, choices=(0, 1, 2), default=1)
+    parser.add_argument('--keyframes', action='store_true',
+                        help="Infer on adaptive keyframes and track landmarks in between")
+    parser.add_argument('--roi', action='store_true',
+                        help="Infer on a crop around the previous frame's pose")
+    args = parser.parse_args()
+
+    summaries = analyze_videos(args.videos, args.exercise, args.out_dir,
+                               fmt=args.format, workers=args.workers,
+                               model_complexity=args.model_complexity,
+                               keyframes=args.keyframes, roi=args.roi)
+    for summary in summaries:
+        if 'error' in summary:
+            print(f"{summary['video']}: failed ({summary['error']})")
+        else:
+            print(f"{summary['video']}: {summary['reps']} reps, {summary['good_reps']} good, "
+                  f"{summary['frames']} frames at {summary['processing_fps']:.1f} fps -> {summary['output']}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,262 @@
+#!/usr/bin/env python3
+"""Offline stage-level benchmarks of the pose server pipeline.
+
+Every stage of handle_video_frame is timed in isolation against the frames and
+landmark sequences in benchmarks/fixtures, with no camera or network. Results
+are written as JSON and compared against the baseline in benchmarks/baseline.json:
+
+    python benchmarks/bench_stages.py --save-baseline
+    python benchmarks/bench_stages.py            # exits 1 on regressions or without a baseline
+"""
+
+import argparse
+import base64
+import json
+import os
+import platform
+import re
+import sys
+import time
+
+import cv2
+import mediapipe as mp
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from cpu_budget import INFERENCE_THREADS
+from exercise_engine import ExerciseEngine
+from frame_codec import decode_buffer, encode_frame, image_buffer
+from joint_angles import compute_angles, landmarks_to_array
+from landmark_tracking import LandmarkTracker, OneEuroFilter, tracking_image
+from motion_gate import MotionGate, motion_thumbnail
+from multi_person import PersonTracker
+from pose_pool import POSE_MODELS, model_available
+from pose_roi import RegionOfInterest
+from threaded_pose import ThreadedPose
+from workout_sessions import WorkoutSession
+
+FIXTURES_DIR = os.path.join(ROOT, 'benchmarks', 'fixtures')
+DEFAULT_BASELINE = os.path.join(ROOT, 'benchmarks', 'baseline.json')
+
+mp_drawing = mp.solutions.drawing_utils
+mp_pose = mp.solutions.pose
+
+
+def time_stage(fn, iterations, warmup, items=1):
+    """Per-call latencies in seconds, divided by the items each call handles"""
+    for _ in range(warmup):
+        fn()
+
+    samples = np.empty(iterations)
+    clock = time.perf_counter
+    for i in range(iterations):
+        started = clock()
+        fn()
+        samples[i] = clock() - started
+    return samples / items
+
+
+def stage_stats(samples):
+    """Latency percentiles and throughput of one stage"""
+    return {
+        'iterations': int(samples.size),
+        'mean_ms': float(1000.0 * samples.mean()),
+        'p50_ms': float(1000.0 * np.percentile(samples, 50)),
+        'p95_ms': float(1000.0 * np.percentile(samples, 95)),
+        'p99_ms': float(1000.0 * np.percentile(samples, 99)),
+        'throughput_per_s': float(1.0 / samples.mean()) if samples.mean() > 0 else 0.0,
+    }
+
+
+def load_fixtures():
+    frames = {}
+    for name in sorted(os.listdir(FIXTURES_DIR)):
+        match = re.match(r'frame_(\d+x\d+)\.jpg$', name)
+        if match:
+            with open(os.path.join(FIXTURES_DIR, name), 'rb') as f:
+                frames[match.group(1)] = f.read()
+
+    sequences = {}
+    for name in sorted(os.listdir(FIXTURES_DIR)):
+        if name.startswith('landmarks_') and name.endswith('.npz'):
+            data = np.load(os.path.join(FIXTURES_DIR, name))
+            sequences[str(data['exercise'])] = (data['time'], data['landmarks'])
+    return frames, sequences
+
+
+def build_stages(frames, sequences, iterations):
+    """Map stage name -> (callable, iterations, items per call)"""
+    stages = {}
+    engine = ExerciseEngine.from_file()
+
+    for size, jpeg in frames.items():
+        data_url = 'data:image/jpeg;base64,' + base64.b64encode(jpeg).decode('ascii')
+        buffer = np.frombuffer(jpeg, np.uint8)
+        frame = decode_buffer(buffer)
+        rgb_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+
+        stages[f'base64_decode/{size}'] = (lambda u=data_url: image_buffer(u), iterations, 1)
+        stages[f'jpeg_decode/{size}'] = (lambda b=buffer: decode_buffer(b), iterations, 1)
+        stages[f'color_convert/{size}'] = (lambda f=frame: cv2.cvtColor(f, cv2.COLOR_BGR2RGB), iterations, 1)
+        stages[f'jpeg_encode/{size}'] = (lambda f=frame: encode_frame(f, binary=True), iterations, 1)
+        stages[f'base64_encode/{size}'] = (lambda f=frame: encode_frame(f, binary=False), iterations, 1)
+        stages[f'tracking_image/{size}'] = (lambda f=frame: tracking_image(f), iterations, 1)
+
+        # Thumbnail decode and comparison the motion gate runs before the full decode
+        gate = MotionGate(max_skipped=float('inf'))
+        gate.remember(motion_thumbnail(buffer), None, None)
+        stages[f'motion_gate/{size}'] = (lambda g=gate, b=buffer: g.static(motion_thumbnail(b)), iterations, 1)
+
+        # Inference in tracking mode on INFERENCE_THREADS threads, the way the server runs it
+        results = None
+        for complexity in POSE_MODELS:
+            if not model_available(complexity):
+                print(f"Skipping inference/c{complexity}: {POSE_MODELS[complexity]} is not installed")
+                continue
+            pose = ThreadedPose(INFERENCE_THREADS, static_image_mode=False, model_complexity=complexity)
+            results = pose.process(rgb_frame)
+            stages[f'inference/c{complexity}/{size}'] = (
+                lambda p=pose, f=rgb_frame: p.process(f), max(iterations // 10, 20), 1
+            )
+
+        if results is not None and results.pose_landmarks:
+            landmark_list = results.pose_landmarks.landmark
+            stages['landmarks_to_array'] = (lambda l=landmark_list: landmarks_to_array(l), iterations, 1)
+
+            # Optical flow step of keyframe mode on an unchanged frame
+            tracker = LandmarkTracker()
+            image = tracking_image(frame)
+            tracker.keyframe(image, landmarks_to_array(landmark_list), 0.0)
+            stages[f'optical_flow/{size}'] = (lambda t=tracker, i=image: t.track(i, 0.0), iterations, 1)
+
+            # Crop, shrink and convert around the detected trainee instead of color_convert
+            roi = RegionOfInterest()
+            roi.prepare(frame)
+            roi.update(landmarks_to_array(landmark_list))
+            stages[f'roi_prepare/{size}'] = (lambda r=roi, f=frame: r.prepare(f), iterations, 1)
+
+            def annotate(f=frame, r=results):
+                annotated = f.copy()
+                mp_drawing.draw_landmarks(annotated, r.pose_landmarks, mp_pose.POSE_CONNECTIONS)
+                cv2.putText(annotated, "Good form!", (10, 30), cv2.FONT_HERSHEY_SIMPLEX,
+                            0.7, (0, 255, 0), 2, cv2.LINE_AA)
+            stages[f'annotate/{size}'] = (annotate, iterations, 1)
+
+    for exercise, (timestamps, landmarks) in sequences.items():
+        angles = compute_angles(landmarks)
+        points = landmarks[0]
+        stages['joint_angles/frame'] = (lambda p=points: compute_angles(p), iterations, 1)
+        stages['joint_angles/batch'] = (lambda l=landmarks: compute_angles(l), max(iterations // 10, 10), len(landmarks))
+
+        def smooth(l=landmarks, t=timestamps):
+            one_euro = OneEuroFilter()
+            for i in range(len(t)):
+                one_euro(l[i], t[i])
+        stages['one_euro/frame'] = (smooth, max(iterations // 20, 5), len(timestamps))
+
+        # ID assignment for four people side by side, each replaying the recording
+        crowd = np.repeat(landmarks[:, None], 4, axis=1)
+        crowd[..., 0] = (crowd[..., 0] + np.arange(4)[None, :, None]) / 4
+
+        def track_people(c=crowd):
+            tracker = PersonTracker(lambda person_id: None)
+            for frame_people in c:
+                tracker.update(frame_people)
+        stages['person_tracking/4'] = (track_people, max(iterations // 20, 5), len(crowd))
+
+        # Replays the whole recording through every exercise's rules
+        for name in engine.exercises:
+            def replay(name=name, l=landmarks, a=angles, t=timestamps):
+                state = WorkoutSession('bench', name, stage=engine.initial_stage(name))
+                for i in range(len(t)):
+                    engine.update(state, l[i], a[i], t[i])
+            stages[f'exercise/{name}'] = (replay, max(iterations // 20, 5), len(timestamps))
+
+    return stages
+
+
+def compare(results, baseline, tolerance):
+    """Stages whose p50 latency regressed past the tolerance"""
+    regressions = []
+    for stage, stats in results['stages'].items():
+        previous = baseline.get('stages', {}).get(stage)
+        if not previous or previous['p50_ms'] <= 0:
+            continue
+        ratio = stats['p50_ms'] / previous['p50_ms']
+        if ratio > 1.0 + tolerance:
+            regressions.append((stage, previous['p50_ms'], stats['p50_ms'], ratio))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark each stage of the pose pipeline")
+    parser.add_argument('--iterations', type=int, default=200)
+    parser.add_argument('--warmup', type=int, default=10)
+    parser.add_argument('--runs', type=int, default=3,
+                        help="Time every stage this many times and keep the run with the lowest p50")
+    parser.add_argument('--stages', default=None, help="Regex selecting the stages to run")
+    parser.add_argument('--output', default=None, help="Write results JSON here")
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE)
+    parser.add_argument('--save-baseline', action='store_true', help="Store the results as the new baseline")
+    parser.add_argument('--tolerance', type=float, default=0.25, help="Allowed p50 slowdown (0.25 = 25%%)")
+    args = parser.parse_args()
+
+    # Single-threaded OpenCV keeps stage numbers comparable between machines
+    cv2.setNumThreads(1)
+
+    frames, sequences = load_fixtures()
+    stages = build_stages(frames, sequences, args.iterations)
+    if args.stages:
+        stages = {name: stage for name, stage in stages.items() if re.search(args.stages, name)}
+
+    results = {
+        'meta': {
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'numpy': np.__version__,
+            'opencv': cv2.__version__,
+            'mediapipe': mp.__version__,
+        },
+        'stages': {},
+    }
+
+    for name, (fn, iterations, items) in stages.items():
+        # The fastest run is the least disturbed by other load on the machine
+        runs = [stage_stats(time_stage(fn, iterations, args.warmup, items)) for _ in range(max(1, args.runs))]
+        stats = min(runs, key=lambda run: run['p50_ms'])
+        results['stages'][name] = stats
+        print(f"{name:32s} p50 {stats['p50_ms']:9.4f} ms  p95 {stats['p95_ms']:9.4f} ms  "
+              f"p99 {stats['p99_ms']:9.4f} ms  {stats['throughput_per_s']:12.1f}/s")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+    if args.save_baseline:
+        with open(args.baseline, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f"Saved baseline to {args.baseline}")
+        return 0
+
+    if not os.path.exists(args.baseline):
+        print(f"No baseline at {args.baseline}, run with --save-baseline to create one")
+        return 1
+
+    with open(args.baseline) as f:
+        regressions = compare(results, json.load(f), args.tolerance)
+    if regressions:
+        print(f"\nREGRESSION: {len(regressions)} stage(s) slower than baseline by more than {args.tolerance:.0%}")
+        for stage, before, after, ratio in regressions:
+            print(f"  {stage:32s} {before:9.4f} ms -> {after:9.4f} ms  (x{ratio:.2f})")
+        return 1
+
+    print("\nNo regressions against baseline")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
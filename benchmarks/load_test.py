@@ -0,0 +1,357 @@
+#!/usr/bin/env python3
+"""Replay a recorded clip through many simulated trainees against a local pose server.
+
+Each simulated client calls /start_workout, streams the clip as binary
+video_frame events at a fixed rate, and calls /end_workout. The harness then
+reports round-trip latency, delivered FPS per client, error events and the
+server's CPU and RSS. With --ramp it steps up the client count until the
+server saturates. Sessions start with the motion gate off, as the default
+input is one repeated fixture frame that the gate would answer without
+inference; the share of frames it skipped is reported either way.
+
+    python benchmarks/load_test.py --spawn --clients 8 --fps 15
+    python benchmarks/load_test.py --spawn --ramp 1,2,4,8,16,32 --output load.json
+
+Needs the Socket.IO client extras: pip install "python-socketio[client]"
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+import urllib.parse
+import urllib.request
+
+import cv2
+import numpy as np
+
+try:
+    import socketio
+    socketio.Client  # noqa: B018, fails on the server-only package layout
+except (ImportError, AttributeError):
+    sys.exit('load_test.py needs the Socket.IO client: pip install "python-socketio[client]"')
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_FRAME = os.path.join(ROOT, 'benchmarks', 'fixtures', 'frame_640x360.jpg')
+LOCAL_HOSTS = ('localhost', '127.0.0.1', '::1')
+
+
+def load_frames(video, max_frames, max_width):
+    """JPEG-encoded frames of the clip, or the fixture frame if no clip is given"""
+    if not video:
+        with open(DEFAULT_FRAME, 'rb') as f:
+            return [f.read()]
+
+    capture = cv2.VideoCapture(video)
+    frames = []
+    while len(frames) < max_frames:
+        ok, frame = capture.read()
+        if not ok:
+            break
+        if frame.shape[1] > max_width:
+            scale = max_width / frame.shape[1]
+            frame = cv2.resize(frame, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+        frames.append(cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, 80])[1].tobytes())
+    capture.release()
+
+    if not frames:
+        raise SystemExit(f"Could not read any frames from {video}")
+    return frames
+
+
+def post_json(url, payload):
+    request = urllib.request.Request(
+        url, data=json.dumps(payload).encode(), headers={'Content-Type': 'application/json'}
+    )
+    with urllib.request.urlopen(request, timeout=30) as response:
+        return json.loads(response.read())
+
+
+def frame_counters(url):
+    """Frame counters of the server's /metrics, empty if it cannot be read"""
+    try:
+        with urllib.request.urlopen(url + '/metrics?format=json', timeout=5) as response:
+            return json.loads(response.read()).get('frames', {})
+    except (OSError, ValueError):
+        return {}
+
+
+class ProcessSampler(threading.Thread):
+    """Samples CPU utilisation and RSS of the server process"""
+
+    def __init__(self, pid, interval=0.5):
+        super().__init__(daemon=True)
+        self.pid = pid
+        self.interval = interval
+        self.samples = []  # (cpu_percent, rss_bytes)
+        self._stop_event = threading.Event()
+        self._ticks = os.sysconf('SC_CLK_TCK')
+        self._page = os.sysconf('SC_PAGE_SIZE')
+
+    def _read(self):
+        with open(f'/proc/{self.pid}/stat') as f:
+            fields = f.read().rsplit(')', 1)[1].split()
+        cpu_seconds = (int(fields[11]) + int(fields[12])) / self._ticks
+        rss_bytes = int(fields[21]) * self._page
+        return cpu_seconds, rss_bytes
+
+    def run(self):
+        try:
+            previous_cpu, _ = self._read()
+            previous_time = time.monotonic()
+            while not self._stop_event.wait(self.interval):
+                cpu, rss = self._read()
+                now = time.monotonic()
+                self.samples.append((100.0 * (cpu - previous_cpu) / (now - previous_time), rss))
+                previous_cpu, previous_time = cpu, now
+        except (FileNotFoundError, ProcessLookupError):
+            pass
+
+    def reset(self):
+        self.samples = []
+
+    def stats(self):
+        if not self.samples:
+            return {}
+        cpu = np.array([s[0] for s in self.samples])
+        rss = np.array([s[1] for s in self.samples])
+        return {
+            'cpu_percent_mean': float(cpu.mean()),
+            'cpu_percent_max': float(cpu.max()),
+            'rss_mb_max': float(rss.max() / 2 ** 20),
+        }
+
+    def stop(self):
+        self._stop_event.set()
+
+
+class SimulatedClient(threading.Thread):
+    """One trainee streaming frames at a fixed rate"""
+
+    def __init__(self, index, url, exercise, frames, fps, duration, options=None):
+        super().__init__(daemon=True)
+        self.index = index
+        self.url = url
+        self.exercise = exercise
+        self.frames = frames
+        self.fps = fps
+        self.duration = duration
+        self.options = options or {}
+
+        self.sent = 0
+        self.received = 0
+        self.quality_levels = []
+        self.max_fps = None
+        self.errors = []
+        self.rtts = []
+        self.summary = None
+        self._sent_at = {}
+        self._lock = threading.Lock()
+
+    def _on_analysis(self, data):
+        now = time.perf_counter()
+        with self._lock:
+            sent_at = self._sent_at.pop(data.get('frame_id'), None)
+            self.received += 1
+            self.quality_levels.append(data.get('metrics', {}).get('quality_level'))
+            if sent_at is not None:
+                self.rtts.append(now - sent_at)
+
+    def _on_quality_level(self, data):
+        # Follow the server's accepted frame rate like a real client would
+        self.max_fps = data.get('max_fps')
+
+    def _on_error(self, data):
+        self.errors.append(data.get('message') if isinstance(data, dict) else str(data))
+
+    def run(self):
+        client = socketio.Client(reconnection=False)
+        client.on('pose_analysis', self._on_analysis)
+        client.on('error', self._on_error)
+        client.on('quality_level', self._on_quality_level)
+
+        try:
+            session_id = f'load-{os.getpid()}-{self.index}-{time.monotonic_ns()}'
+            post_json(self.url + '/start_workout',
+                      dict(self.options, exercise=self.exercise, session_id=session_id))
+            client.connect(self.url, transports=['websocket'])
+
+            started = time.monotonic()
+            next_send = started
+            frame_id = 0
+            while time.monotonic() - started < self.duration:
+                with self._lock:
+                    self._sent_at[frame_id] = time.perf_counter()
+                client.emit('video_frame', {
+                    'session_id': session_id,
+                    'frame_id': frame_id,
+                    'ts': time.time() * 1000.0,
+                    'image': self.frames[frame_id % len(self.frames)]
+                })
+                self.sent += 1
+                frame_id += 1
+
+                next_send += 1.0 / min(self.fps, self.max_fps or self.fps)
+                delay = next_send - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+
+            # Give in-flight frames a moment to come back
+            time.sleep(min(1.0, 5.0 / self.fps))
+            self.summary = post_json(self.url + '/end_workout', {'session_id': session_id}).get('summary')
+        except Exception as e:
+            self.errors.append(f'{type(e).__name__}: {e}')
+        finally:
+            if client.connected:
+                client.disconnect()
+
+
+def run_level(num_clients, args, frames, sampler):
+    """Run a fixed number of clients and aggregate their results"""
+    if sampler:
+        sampler.reset()
+    counters = frame_counters(args.url)
+
+    clients = [
+        SimulatedClient(i, args.url, args.exercise, frames, args.fps, args.duration,
+                        {'keyframes': args.keyframes, 'motion_gate': args.motion_gate})
+        for i in range(num_clients)
+    ]
+    for client in clients:
+        client.start()
+        time.sleep(args.stagger)
+    for client in clients:
+        client.join(args.duration + 60)
+
+    # Frames answered without inference, from the server's counters over this level
+    after = frame_counters(args.url)
+    processed = after.get('processed', 0) - counters.get('processed', 0)
+    skipped = after.get('motion_skipped', 0) - counters.get('motion_skipped', 0)
+
+    rtts = np.array([rtt for client in clients for rtt in client.rtts]) * 1000.0
+    delivered_fps = np.array([client.received / args.duration for client in clients])
+    result = {
+        'clients': num_clients,
+        'target_fps': args.fps,
+        'frames_sent': sum(client.sent for client in clients),
+        'frames_answered': sum(client.received for client in clients),
+        'server_dropped': sum((client.summary or {}).get('frames', {}).get('dropped', 0) for client in clients),
+        'errors': sum(len(client.errors) for client in clients),
+        'error_samples': sorted({e for client in clients for e in client.errors})[:5],
+        'delivered_fps_mean': float(delivered_fps.mean()) if delivered_fps.size else 0.0,
+        'delivered_fps_min': float(delivered_fps.min()) if delivered_fps.size else 0.0,
+        'motion_skipped': skipped,
+        'skip_rate': skipped / processed if processed else 0.0,
+        'final_quality_levels': [client.quality_levels[-1] if client.quality_levels else None for client in clients],
+    }
+    if rtts.size:
+        result.update({
+            'rtt_p50_ms': float(np.percentile(rtts, 50)),
+            'rtt_p95_ms': float(np.percentile(rtts, 95)),
+            'rtt_p99_ms': float(np.percentile(rtts, 99)),
+        })
+    if sampler:
+        result.update(sampler.stats())
+    return result
+
+
+def saturated(result, args):
+    """Whether a level missed the latency, frame-rate or error budget"""
+    return (
+        result['errors'] > 0
+        or result.get('rtt_p95_ms', float('inf')) > args.max_latency_ms
+        or result['delivered_fps_mean'] < args.fps * args.min_fps_ratio
+    )
+
+
+def wait_for_server(url, timeout):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with urllib.request.urlopen(url + '/health', timeout=2):
+                return
+        except OSError:
+            time.sleep(0.5)
+    raise SystemExit(f"Server at {url} did not come up within {timeout}s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load-test the pose server with simulated trainees")
+    parser.add_argument('--url', default='http://127.0.0.1:3001')
+    parser.add_argument('--spawn', action='store_true', help="Start pose_estimation_server.py for the run")
+    parser.add_argument('--server-pid', type=int, default=None, help="Sample CPU/RSS of a running server")
+    parser.add_argument('--video', default=None, help="Recorded clip to replay (default: fixture frame)")
+    parser.add_argument('--max-frames', type=int, default=300)
+    parser.add_argument('--max-width', type=int, default=640)
+    parser.add_argument('--exercise', default='bicep_curl')
+    parser.add_argument('--keyframes', action='store_true', help="Start sessions in keyframe mode")
+    parser.add_argument('--motion-gate', action='store_true',
+                        help="Leave the motion gate on, static frames then skip inference")
+    parser.add_argument('--clients', type=int, default=4)
+    parser.add_argument('--ramp', default=None, help="Comma-separated client counts, e.g. 1,2,4,8")
+    parser.add_argument('--fps', type=float, default=15.0)
+    parser.add_argument('--duration', type=float, default=20.0, help="Seconds per level")
+    parser.add_argument('--stagger', type=float, default=0.05, help="Seconds between client starts")
+    parser.add_argument('--max-latency-ms', type=float, default=250.0, help="p95 budget for --ramp")
+    parser.add_argument('--min-fps-ratio', type=float, default=0.9, help="Delivered/target FPS budget for --ramp")
+    parser.add_argument('--output', default=None, help="Write results JSON here")
+    args = parser.parse_args()
+
+    host = urllib.parse.urlparse(args.url).hostname
+    if host not in LOCAL_HOSTS:
+        raise SystemExit(f"Refusing to load-test non-local host {host}")
+
+    frames = load_frames(args.video, args.max_frames, args.max_width)
+    server = None
+    pid = args.server_pid
+    if args.spawn:
+        server = subprocess.Popen([sys.executable, os.path.join(ROOT, 'pose_estimation_server.py')], cwd=ROOT)
+        pid = server.pid
+
+    sampler = None
+    try:
+        wait_for_server(args.url, 60)
+        if pid and os.path.exists(f'/proc/{pid}/stat'):
+            sampler = ProcessSampler(pid)
+            sampler.start()
+
+        levels = [int(n) for n in args.ramp.split(',')] if args.ramp else [args.clients]
+        results = []
+        saturation = None
+        for num_clients in levels:
+            result = run_level(num_clients, args, frames, sampler)
+            results.append(result)
+            print(f"{num_clients:4d} clients: {result['delivered_fps_mean']:6.1f} fps/client "
+                  f"(min {result['delivered_fps_min']:.1f}), p50 {result.get('rtt_p50_ms', 0):7.1f} ms, "
+                  f"p95 {result.get('rtt_p95_ms', 0):7.1f} ms, skipped {100 * result['skip_rate']:3.0f}%, "
+                  f"errors {result['errors']}, "
+                  f"cpu {result.get('cpu_percent_mean', 0):5.0f}%, rss {result.get('rss_mb_max', 0):6.0f} MB")
+
+            if args.ramp and saturated(result, args):
+                saturation = num_clients
+                break
+
+        report = {'config': vars(args), 'levels': results}
+        if args.ramp:
+            healthy = [r['clients'] for r in results if not saturated(r, args)]
+            report['saturation_clients'] = saturation
+            report['max_healthy_clients'] = max(healthy) if healthy else 0
+            print(f"Max healthy clients: {report['max_healthy_clients']}"
+                  + (f", saturated at {saturation}" if saturation else ", not saturated"))
+
+        if args.output:
+            with open(args.output, 'w') as f:
+                json.dump(report, f, indent=2)
+    finally:
+        if sampler:
+            sampler.stop()
+        if server:
+            server.terminate()
+            server.wait(10)
+
+
+if __name__ == '__main__':
+    main()
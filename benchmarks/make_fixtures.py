@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+"""Regenerate the benchmark fixtures from the photos in attached_assets.
+
+Writes sample JPEG frames at the resolutions clients typically send, and a
+landmark sequence of bicep curls built by sweeping the detected left forearm
+around the elbow. Run from the repository root:
+
+    python benchmarks/make_fixtures.py
+"""
+
+import os
+import sys
+
+import cv2
+import mediapipe as mp
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from joint_angles import LANDMARK, landmarks_to_array
+
+FIXTURES_DIR = os.path.join(ROOT, 'benchmarks', 'fixtures')
+SOURCE_IMAGE = os.path.join(
+    ROOT, 'attached_assets', 'WhatsApp Image 2025-08-23 at 6.53.13 PM_1755955430648.jpeg'
+)
+FRAME_SIZES = ((640, 360), (1280, 720))
+
+# Recorded sequence: 30 fps, 10 curls of 2 s each
+SEQUENCE_FPS = 30
+SEQUENCE_REPS = 10
+REP_SECONDS = 2.0
+FOREARM_LANDMARKS = [LANDMARK[name] for name in ('left_wrist', 'left_pinky', 'left_index', 'left_thumb')]
+
+
+def detect(image):
+    with mp.solutions.pose.Pose(static_image_mode=True) as pose:
+        results = pose.process(cv2.cvtColor(image, cv2.COLOR_BGR2RGB))
+    if not results.pose_landmarks:
+        raise RuntimeError("No pose detected in the source image")
+    return landmarks_to_array(results.pose_landmarks.landmark)
+
+
+def curl_sequence(points, rng):
+    """Rotate the forearm from straight (about 175 deg) to curled (about 20 deg)"""
+    frames = int(SEQUENCE_FPS * REP_SECONDS * SEQUENCE_REPS)
+    t = np.arange(frames) / SEQUENCE_FPS
+    flexion = np.radians(155.0) * 0.5 * (1.0 - np.cos(2.0 * np.pi * t / REP_SECONDS))
+
+    # Image y points down, flip the sign depending on which side the arm bends
+    elbow = points[LANDMARK['left_elbow'], :2]
+    sequence = np.repeat(points[None], frames, axis=0)
+    for i, theta in enumerate(flexion):
+        c, s = np.cos(theta), np.sin(theta)
+        rotation = np.array([[c, s], [-s, c]], dtype=np.float32)
+        offsets = points[FOREARM_LANDMARKS, :2] - elbow
+        sequence[i, FOREARM_LANDMARKS, :2] = elbow + offsets @ rotation.T
+
+    # Landmark jitter comparable to the tracker's
+    sequence[..., :3] += rng.normal(0.0, 0.002, sequence[..., :3].shape).astype(np.float32)
+    return t, sequence.astype(np.float32)
+
+
+def main():
+    image = cv2.imread(SOURCE_IMAGE)
+    os.makedirs(FIXTURES_DIR, exist_ok=True)
+
+    for width, height in FRAME_SIZES:
+        frame = cv2.resize(image, (width, height), interpolation=cv2.INTER_AREA)
+        path = os.path.join(FIXTURES_DIR, f'frame_{width}x{height}.jpg')
+        cv2.imwrite(path, frame, [cv2.IMWRITE_JPEG_QUALITY, 85])
+        print(f"Wrote {path}")
+
+    t, sequence = curl_sequence(detect(image), np.random.default_rng(7))
+    path = os.path.join(FIXTURES_DIR, 'landmarks_bicep_curl.npz')
+    np.savez_compressed(path, time=t, landmarks=sequence, exercise='bicep_curl', reps=SEQUENCE_REPS)
+    print(f"Wrote {path} ({len(t)} frames)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+"""CPU budget of the pose server and admission of inference sessions against it.
+
+The defaults come from benchmarks/load_test.py --ramp on one core, with
+clients sending 640x360 frames at 15 fps. A session inferring every frame
+on one thread costs about 55% of a core and two of them saturate it, while
+sessions the motion gate finds static cost under 20% each, three of them
+staying within the latency budget. Trainees rest between sets, so a core
+is budgeted for two sessions, and the latency SLO sheds quality when they
+all move at once. More inference threads per session lower the latency of
+one frame but not the cost of it, so sessions get one thread each.
+"""
+
+import os
+import threading
+
+import cv2
+
+# Cores the pose server may use in total, 0 uses every core the process may run on
+CPU_BUDGET = int(os.environ.get('CPU_BUDGET', '0'))
+
+# Threads each session's Pose instance runs its graph and inference on
+INFERENCE_THREADS = int(os.environ.get('INFERENCE_THREADS', '1'))
+
+# Inference sessions sharing one core's worth of the budget, see the module docstring for the default
+SESSIONS_PER_CORE = float(os.environ.get('SESSIONS_PER_CORE', '2'))
+
+# Threads OpenCV may use within one call, frames already run in parallel on the frame workers
+CV2_THREADS = int(os.environ.get('CV2_THREADS', '1'))
+
+# Pin each worker process to its own slice of the cores
+CPU_AFFINITY = os.environ.get('CPU_AFFINITY', '0') == '1'
+
+
+def available_cores():
+    """Cores this process is allowed to run on"""
+    try:
+        return sorted(os.sched_getaffinity(0))
+    except AttributeError:
+        return list(range(os.cpu_count() or 1))
+
+
+class CpuBudget:
+    """Owns a process's share of the CPU and admits sessions against it.
+
+    The budget is split evenly between the worker processes of
+    start_pose_server.py. A worker's share buys inference slots of
+    INFERENCE_THREADS threads each, and every session running inference on
+    the server holds one slot until it ends, so a full worker turns new
+    sessions away instead of slowing down the ones it has. Sessions sending
+    their own landmarks need no slot. The frame workers get one thread per
+    stage of every slot that can run at a time and OpenCV is kept from
+    spawning threads of its own, so the threads in use stay within the share.
+    """
+
+    def __init__(self, budget=CPU_BUDGET, inference_threads=INFERENCE_THREADS,
+                 sessions_per_core=SESSIONS_PER_CORE, worker_index=None, num_workers=1):
+        cores = available_cores()
+        total = budget or len(cores)
+        self.inference_threads = max(1, inference_threads)
+        self.cores = total / max(1, num_workers)
+        self.capacity = max(1, int(self.cores * sessions_per_core / self.inference_threads))
+
+        # The worker's own slice of the allowed cores, for pinning
+        cores = cores[:total]
+        if worker_index is None:
+            self.pinned = cores
+        else:
+            per_worker = len(cores) / max(1, num_workers)
+            self.pinned = (cores[round(worker_index * per_worker):round((worker_index + 1) * per_worker)]
+                           or [cores[worker_index % len(cores)]])
+
+        self.affinity = False
+        self._sessions = set()
+        self._lock = threading.Lock()
+
+    def apply(self, affinity=CPU_AFFINITY):
+        """Limit OpenCV's threads and optionally pin the process, before any worker thread starts"""
+        cv2.setNumThreads(CV2_THREADS)
+        if affinity and hasattr(os, 'sched_setaffinity'):
+            os.sched_setaffinity(0, self.pinned)
+            self.affinity = True
+
+    def frame_threads(self, stages=1):
+        """Frame worker threads for the sessions that can run at a time, each with ``stages`` in flight"""
+        return max(1, round(self.cores / self.inference_threads)) * stages
+
+    def has_room(self, session_id=None):
+        """Whether a session could be admitted, a session holding a slot already always can"""
+        with self._lock:
+            return session_id in self._sessions or len(self._sessions) < self.capacity
+
+    def admit(self, session_id):
+        """Give a session a slot, also past capacity for sessions taken over from another worker"""
+        with self._lock:
+            self._sessions.add(session_id)
+
+    def release(self, session_id):
+        """Free a session's slot, if it held one"""
+        with self._lock:
+            self._sessions.discard(session_id)
+
+    def stats(self):
+        """Slots in use and the share they come out of"""
+        return {
+            'cores': self.cores,
+            'inference_threads': self.inference_threads,
+            'capacity': self.capacity,
+            'sessions': len(self._sessions),
+            'pinned': self.pinned if self.affinity else None
+        }
+
+    def __len__(self):
+        return len(self._sessions)
+
+    def __contains__(self, session_id):
+        return session_id in self._sessions
@@ -0,0 +1,281 @@
+#!/usr/bin/env python3
+
+import json
+import os
+import time
+
+import numpy as np
+
+from joint_angles import JOINT, JOINT_NAMES, LANDMARK
+from rep_analytics import RepAnalytics
+
+EXERCISE_SPECS_PATH = os.environ.get(
+    'EXERCISE_SPECS_PATH',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'exercise_specs.json')
+)
+
+GOOD_FORM_MESSAGE = "Good form!"
+
+# Outcome of a single frame for rep-based exercises
+REP_NONE = 0
+REP_GOOD = 1
+REP_BAD = 2
+
+# Comparison operators usable in thresholds: (strict, sign)
+_OPERATORS = {
+    'above': (True, 1.0),
+    'below': (True, -1.0),
+    'at_least': (False, 1.0),
+    'at_most': (False, -1.0),
+}
+_AXES = {'dx': 0, 'dy': 1}
+_ANY_STAGE = -1
+_OTHER_STAGE = -2
+
+
+class SpecError(ValueError):
+    """Raised when an exercise spec cannot be compiled"""
+
+
+def _parse_threshold(spec, where):
+    """Return (strict, sign, value) for the single operator in a spec entry"""
+    found = [op for op in _OPERATORS if op in spec]
+    if len(found) != 1:
+        raise SpecError(f"{where}: expected exactly one of {', '.join(_OPERATORS)}")
+    strict, sign = _OPERATORS[found[0]]
+    return strict, sign, float(spec[found[0]])
+
+
+def _crossed(value, threshold):
+    strict, sign, limit = threshold
+    return sign * value > sign * limit if strict else sign * value >= sign * limit
+
+
+class CompiledExercise:
+    """An exercise spec compiled into flat lookup arrays"""
+
+    def __init__(self, name, spec):
+        self.name = name
+        self.hold = bool(spec.get('hold', False))
+        self.initial_stage = spec.get('initial_stage', 'ready' if self.hold else 'down')
+        self.ok_message = spec.get('ok_message', GOOD_FORM_MESSAGE)
+
+        # Stage names map to small integers so rule gating is an array compare
+        self.stage_ids = {}
+
+        self.counter_joint = None
+        if not self.hold:
+            counter = spec.get('counter')
+            if not counter:
+                raise SpecError(f"{name}: rep exercises need a counter")
+            self.counter_joint = self._joint(counter['joint'], name)
+            self.rest_stage = counter['rest']['stage']
+            self.active_stage = counter['active']['stage']
+            self.rest_threshold = _parse_threshold(counter['rest'], f"{name}.counter.rest")
+            self.active_threshold = _parse_threshold(counter['active'], f"{name}.counter.active")
+            self._stage_id(self.rest_stage)
+            self._stage_id(self.active_stage)
+
+            # Stage the muscle shortens towards, for concentric and eccentric tempo
+            concentric = counter.get('concentric', self.active_stage)
+            if concentric not in (self.rest_stage, self.active_stage):
+                raise SpecError(f"{name}.counter.concentric: must be '{self.rest_stage}' or '{self.active_stage}'")
+            self.concentric_to_active = concentric == self.active_stage
+
+        rules = spec.get('rules', [])
+        self.messages = []
+        angle_pos, angle_idx = [], []
+        offset_pos, offset_a, offset_b, offset_axis, offset_abs = [], [], [], [], []
+        rule_stage, rule_strict, rule_sign, rule_limit = [], [], [], []
+
+        for i, rule in enumerate(rules):
+            where = f"{name}.rules[{i}]"
+            if 'angle' in rule:
+                angle_pos.append(i)
+                angle_idx.append(self._joint(rule['angle'], where))
+            else:
+                axis = next((key for key in _AXES if key in rule), None)
+                if axis is None:
+                    raise SpecError(f"{where}: rule needs an angle, dx or dy metric")
+                a, b = rule[axis]
+                offset_pos.append(i)
+                offset_a.append(self._landmark(a, where))
+                offset_b.append(self._landmark(b, where))
+                offset_axis.append(_AXES[axis])
+                offset_abs.append(bool(rule.get('abs', False)))
+
+            strict, sign, limit = _parse_threshold(rule, where)
+            rule_strict.append(strict)
+            rule_sign.append(sign)
+            rule_limit.append(sign * limit)
+            rule_stage.append(self._stage_id(rule['stage']) if 'stage' in rule else _ANY_STAGE)
+            self.messages.append(rule['message'])
+
+        self.num_rules = len(rules)
+        self._angle_pos = np.array(angle_pos, dtype=np.intp)
+        self._angle_idx = np.array(angle_idx, dtype=np.intp)
+        self._offset_pos = np.array(offset_pos, dtype=np.intp)
+        self._offset_a = np.array(offset_a, dtype=np.intp)
+        self._offset_b = np.array(offset_b, dtype=np.intp)
+        self._offset_axis = np.array(offset_axis, dtype=np.intp)
+        self._offset_abs = np.array(offset_abs, dtype=bool)
+        self._rule_stage = np.array(rule_stage, dtype=np.intp)
+        self._rule_strict = np.array(rule_strict, dtype=bool)
+        self._rule_sign = np.array(rule_sign, dtype=np.float32)
+        self._rule_limit = np.array(rule_limit, dtype=np.float32)
+
+    def violations(self, points, angles):
+        """Boolean mask of the rules broken in this frame, ignoring stages"""
+        values = np.empty(self.num_rules, dtype=np.float32)
+        values[self._angle_pos] = angles[self._angle_idx]
+        if self._offset_pos.size:
+            offsets = (points[self._offset_a, self._offset_axis]
+                       - points[self._offset_b, self._offset_axis])
+            values[self._offset_pos] = np.where(self._offset_abs, np.abs(offsets), offsets)
+
+        signed = values * self._rule_sign
+        return np.where(self._rule_strict, signed > self._rule_limit, signed >= self._rule_limit)
+
+    def stage_mask(self, stage):
+        """Rules that apply while the exercise is in the given stage"""
+        stage_id = self.stage_ids.get(stage, _OTHER_STAGE)
+        return (self._rule_stage == _ANY_STAGE) | (self._rule_stage == stage_id)
+
+    def feedback(self, broken):
+        """Messages of the broken rules, or the ok message"""
+        if not broken.any():
+            return [self.ok_message]
+        return [self.messages[i] for i in np.flatnonzero(broken)]
+
+    def _stage_id(self, stage):
+        return self.stage_ids.setdefault(stage, len(self.stage_ids))
+
+    @staticmethod
+    def _joint(name, where):
+        if name not in JOINT:
+            raise SpecError(f"{where}: unknown joint '{name}'")
+        return JOINT[name]
+
+    @staticmethod
+    def _landmark(name, where):
+        if name not in LANDMARK:
+            raise SpecError(f"{where}: unknown landmark '{name}'")
+        return LANDMARK[name]
+
+
+class ExerciseEngine:
+    """Rep counting and form checking driven by declarative exercise specs.
+
+    Each spec names the joint whose angle drives a two-stage rep counter, the
+    thresholds that enter the active stage (counting a rep) and return to the
+    rest stage, and a list of form rules over joint angles or landmark offsets.
+    Specs are compiled once into a dispatch table, and each frame evaluates all
+    rules of the current exercise in one vectorized comparison.
+    """
+
+    def __init__(self, specs):
+        self.exercises = {name: CompiledExercise(name, spec) for name, spec in specs.items()}
+
+    @classmethod
+    def from_file(cls, path=EXERCISE_SPECS_PATH):
+        """Load and compile specs from a JSON file"""
+        with open(path) as f:
+            return cls(json.load(f))
+
+    def __contains__(self, exercise):
+        return exercise in self.exercises
+
+    def initial_stage(self, exercise):
+        """Stage a new session of this exercise starts in"""
+        compiled = self.exercises.get(exercise)
+        return compiled.initial_stage if compiled else 'down'
+
+    def is_timed(self, exercise):
+        """Whether the exercise is scored by hold time rather than reps"""
+        compiled = self.exercises.get(exercise)
+        return bool(compiled and compiled.hold)
+
+    def rep_analytics(self, exercise):
+        """Per-rep analytics for a session of this exercise, None for holds"""
+        compiled = self.exercises.get(exercise)
+        if compiled is None or compiled.hold:
+            return None
+        return RepAnalytics(compiled.counter_joint, len(JOINT_NAMES), compiled.concentric_to_active)
+
+    def messages(self, exercise):
+        """Every feedback message the exercise can give, the ok message first"""
+        compiled = self.exercises.get(exercise)
+        if compiled is None:
+            return [GOOD_FORM_MESSAGE]
+        return list(dict.fromkeys([compiled.ok_message] + compiled.messages))
+
+    def update(self, state, points, angles, now=None):
+        """Advance a session by one frame and return REP_NONE, REP_GOOD or REP_BAD.
+
+        ``state`` needs stage, counter, good_reps, feedback and start_time
+        attributes. ``now`` defaults to the wall clock and drives hold timers.
+        A RepAnalytics in ``state.analytics``, if any, follows every frame,
+        and a SessionLog in ``state.log`` gets a record of it.
+        """
+        compiled = self.exercises.get(state.exercise)
+        if compiled is None:
+            return REP_NONE
+
+        now = time.time() if now is None else now
+        violations = compiled.violations(points, angles)
+        if compiled.hold:
+            outcome = self._update_hold(compiled, state, violations, now)
+        else:
+            outcome = self._update_reps(compiled, state, angles, violations, now)
+
+        log = getattr(state, 'log', None)
+        if log is not None:
+            log.append(now, points, angles, state, outcome)
+        return outcome
+
+    @staticmethod
+    def _update_reps(compiled, state, angles, violations, now):
+        # Feedback is judged against the stage the frame started in
+        state.feedback = compiled.feedback(violations & compiled.stage_mask(state.stage))
+
+        angle = angles[compiled.counter_joint]
+        in_rest = _crossed(angle, compiled.rest_threshold)
+        in_active = _crossed(angle, compiled.active_threshold)
+        outcome = REP_NONE
+        if in_rest:
+            state.stage = compiled.rest_stage
+        if in_active and state.stage == compiled.rest_stage:
+            state.stage = compiled.active_stage
+            state.counter += 1
+
+            # The rep is good if nothing is broken in the stage it ends in
+            if (violations & compiled.stage_mask(compiled.active_stage)).any():
+                outcome = REP_BAD
+            else:
+                state.good_reps += 1
+                outcome = REP_GOOD
+
+        analytics = getattr(state, 'analytics', None)
+        if analytics is not None:
+            analytics.update(angles, now, in_rest, in_active,
+                             counted=outcome != REP_NONE, good=outcome == REP_GOOD)
+        return outcome
+
+    @staticmethod
+    def _update_hold(compiled, state, violations, now):
+        # For holds, we track time held rather than reps
+        if state.start_time is None:
+            state.start_time = now
+
+        hold_time = int(now - state.start_time)
+        state.counter = hold_time
+
+        if violations.any():
+            state.feedback = compiled.feedback(violations)
+        else:
+            state.feedback = [compiled.ok_message]
+            if hold_time > state.good_reps:
+                state.good_reps += 1
+
+        state.stage = f"Hold: {hold_time}s"
+        return REP_NONE
@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+
+import base64
+import os
+
+import cv2
+import numpy as np
+
+# Largest frame the server wants from clients, bigger uploads only cost bandwidth
+FRAME_MAX_WIDTH = int(os.environ.get('FRAME_MAX_WIDTH', '640'))
+FRAME_MAX_HEIGHT = int(os.environ.get('FRAME_MAX_HEIGHT', '480'))
+FRAME_JPEG_QUALITY = int(os.environ.get('FRAME_JPEG_QUALITY', '95'))
+
+DATA_URL_PREFIX = 'data:image/jpeg;base64,'
+
+# Landmarks per frame and values per landmark (x, y, z, visibility)
+LANDMARK_SHAPE = (33, 4)
+
+# Largest batch of client landmark frames accepted in one request
+MAX_LANDMARK_BATCH = int(os.environ.get('MAX_LANDMARK_BATCH', '10000'))
+
+# libjpeg can scale by these factors while decoding, far cheaper than a resize afterwards
+_DECODE_FLAGS = {
+    1: cv2.IMREAD_COLOR,
+    2: cv2.IMREAD_REDUCED_COLOR_2,
+    4: cv2.IMREAD_REDUCED_COLOR_4,
+    8: cv2.IMREAD_REDUCED_COLOR_8,
+}
+
+
+def is_binary(image):
+    """Whether a frame arrived as a binary attachment rather than a data URL"""
+    return isinstance(image, (bytes, bytearray, memoryview))
+
+
+def image_buffer(image):
+    """JPEG bytes of a frame sent as raw bytes or as a base64 data URL"""
+    if is_binary(image):
+        # Wrap the received buffer directly, no intermediate copies
+        return np.frombuffer(image, np.uint8)
+    if isinstance(image, str):
+        return np.frombuffer(base64.b64decode(image.partition(',')[2] or image), np.uint8)
+    raise ValueError(f"Unsupported image payload: {type(image).__name__}")
+
+
+def decode_buffer(buffer, reduction=1):
+    """Decode JPEG bytes into a BGR frame, optionally at 1/2, 1/4 or 1/8 scale"""
+    frame = cv2.imdecode(buffer, _DECODE_FLAGS[reduction])
+    if frame is None:
+        raise ValueError("Could not decode image")
+    return frame
+
+
+def decode_reduction(width, height, max_size):
+    """Largest decode scale-down that keeps the longest side at least ``max_size``"""
+    reduction = 1
+    while reduction < 8 and max(width, height) >= 2 * reduction * max_size:
+        reduction *= 2
+    return reduction
+
+
+def encode_frame(frame, binary, quality=FRAME_JPEG_QUALITY):
+    """Encode a BGR frame as JPEG bytes, or as a data URL for legacy clients"""
+    ok, buffer = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, quality])
+    if not ok:
+        raise ValueError("Could not encode image")
+
+    if binary:
+        return buffer.tobytes()
+    return DATA_URL_PREFIX + base64.b64encode(buffer).decode('ascii')
+
+
+def decode_landmarks(landmarks):
+    """Landmark frames sent by a client as an (N, 33, 4) float32 array.
+
+    Accepts packed little-endian float32 bytes, the same bytes base64
+    encoded, or nested lists. One frame or a batch of frames.
+    """
+    if is_binary(landmarks):
+        array = np.frombuffer(landmarks, dtype='<f4')
+    elif isinstance(landmarks, str):
+        array = np.frombuffer(base64.b64decode(landmarks), dtype='<f4')
+    elif isinstance(landmarks, (list, tuple)):
+        try:
+            array = np.asarray(landmarks, dtype=np.float32)
+        except TypeError:
+            # Items such as dicts or None, callers only expect ValueError
+            raise ValueError("landmarks must be numeric") from None
+    else:
+        raise ValueError(f"Unsupported landmarks payload: {type(landmarks).__name__}")
+
+    values = LANDMARK_SHAPE[0] * LANDMARK_SHAPE[1]
+    if array.size == 0 or array.size % values:
+        raise ValueError(f"Expected a multiple of {values} landmark values, got {array.size}")
+    if array.size // values > MAX_LANDMARK_BATCH:
+        raise ValueError(f"At most {MAX_LANDMARK_BATCH} landmark frames per batch")
+    return array.reshape(-1, *LANDMARK_SHAPE)
+
+
+def landmarks_format():
+    """Layout of the packed landmarks sent in pose_analysis and accepted in landmarks_frame"""
+    return {'dtype': 'float32', 'shape': list(LANDMARK_SHAPE), 'fields': ['x', 'y', 'z', 'visibility']}
+
+
+def input_format():
+    """Frame format clients should send, advertised on connect and at start"""
+    return {
+        'max_width': FRAME_MAX_WIDTH,
+        'max_height': FRAME_MAX_HEIGHT,
+        'encoding': 'jpeg',
+        'transports': ['binary', 'data_url'],
+        # Capture time of the frame, client clock in milliseconds since the epoch
+        'timestamp': 'ts'
+    }
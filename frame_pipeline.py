@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+
+import os
+import queue
+import time
+
+# Frames waiting between two stages of a session's pipeline
+PIPELINE_QUEUE_SIZE = int(os.environ.get('PIPELINE_QUEUE_SIZE', '1'))
+
+# Seconds a stage blocked on a queue waits before checking whether the pipeline was closed
+PIPELINE_POLL_INTERVAL = 0.5
+
+
+class FrameJob:
+    """One video frame on its way through a session's stages"""
+
+    __slots__ = (
+        'data', 'captured', 'sid', 'started', 'timings', 'settings',
+        'thumbnail', 'static', 'frame', 'points', 'angles', 'payload', 'error',
+    )
+
+    def __init__(self, data, captured, sid):
+        self.data = data
+        self.captured = captured
+        self.sid = sid
+        self.started = time.perf_counter()
+        self.timings = {}
+        self.settings = None
+        self.thumbnail = None
+        self.static = False
+        self.frame = None
+        self.points = None
+        self.angles = None
+        self.payload = None
+        self.error = None
+
+
+class FramePipeline:
+    """Overlaps the stages of consecutive frames of one session.
+
+    Every stage has its own green thread, runs its work on a native thread
+    through ``run`` and hands the job to the next stage through a small
+    bounded queue. While one frame is in inference, the next can be decoding
+    and the previous one encoding, so a session's throughput approaches its
+    slowest stage instead of the sum of all of them. Each stage takes jobs
+    one at a time in the order they were submitted, which keeps the replies
+    in order. ``deliver`` gets every job last, on its green thread, so it may
+    emit. A job whose stage raised keeps the exception in ``error`` and skips
+    the remaining stages.
+
+    ``submit`` blocks while the first stage is busy and its queue is full,
+    which leaves the session's one-slot mailbox replacing stale frames.
+    """
+
+    __slots__ = ('closed', '_queues')
+
+    def __init__(self, stages, deliver, run, create_queue, start_task, depth=PIPELINE_QUEUE_SIZE):
+        self.closed = False
+        # Inbox of every stage, then of deliver
+        self._queues = [create_queue(depth) for _ in range(len(stages) + 1)]
+        for index, stage in enumerate(stages):
+            start_task(self._run_stage, stage, index, run)
+        start_task(self._run_deliver, deliver)
+
+    def submit(self, job):
+        """Queue a job for the first stage, False once the pipeline is closed"""
+        return self._put(self._queues[0], job)
+
+    def close(self):
+        """Stop the stages, jobs still in flight are dropped"""
+        self.closed = True
+
+    def _put(self, jobs, job):
+        # Block while the queue is full, but give up once the pipeline closes
+        while not self.closed:
+            try:
+                jobs.put(job, timeout=PIPELINE_POLL_INTERVAL)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def _get(self, jobs):
+        while not self.closed:
+            try:
+                return jobs.get(timeout=PIPELINE_POLL_INTERVAL)
+            except queue.Empty:
+                pass
+        return None
+
+    def _run_stage(self, stage, index, run):
+        inbox, outbox = self._queues[index], self._queues[index + 1]
+        while True:
+            job = self._get(inbox)
+            if job is None:
+                return
+            if job.error is None:
+                try:
+                    run(stage, job)
+                except Exception as e:
+                    job.error = e
+            if not self._put(outbox, job):
+                return
+
+    def _run_deliver(self, deliver):
+        while True:
+            job = self._get(self._queues[-1])
+            if job is None:
+                return
+            deliver(job)
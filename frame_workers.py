@@ -0,0 +1,42 @@
+#!/usr/bin/env python3
+
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+# Number of OS threads running decode, inference and encode, 0 lets the server size them by its CPU budget
+FRAME_WORKER_THREADS = int(os.environ.get('FRAME_WORKER_THREADS', '0'))
+
+
+class FrameWorkers:
+    """Runs the CPU-heavy stages of frame processing on native threads.
+
+    cv2 and MediaPipe release the GIL, so several sessions make progress in
+    parallel while the Socket.IO loop stays free for events and heartbeats.
+    Under eventlet the work goes through eventlet's native thread pool so the
+    calling green thread yields instead of blocking the hub.
+    """
+
+    def __init__(self, async_mode, num_threads=FRAME_WORKER_THREADS):
+        self.num_threads = num_threads or os.cpu_count() or 4
+        self._executor = None
+
+        if async_mode == 'eventlet':
+            from eventlet import tpool
+            tpool.set_num_threads(self.num_threads)
+            self._tpool = tpool
+        else:
+            self._tpool = None
+            self._executor = ThreadPoolExecutor(self.num_threads, thread_name_prefix='frame-worker')
+
+    def run(self, fn, *args):
+        """Run fn on a worker thread and wait for its result"""
+        if self._tpool is not None:
+            return self._tpool.execute(fn, *args)
+        return self._executor.submit(fn, *args).result()
+
+    def shutdown(self):
+        """Stop the worker threads"""
+        if self._tpool is not None:
+            self._tpool.killall()
+        else:
+            self._executor.shutdown(wait=False)
@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+
+import numpy as np
+
+# Landmark indices of the 33-point BlazePose topology used by MediaPipe Pose
+NUM_LANDMARKS = 33
+LEFT_SHOULDER, RIGHT_SHOULDER = 11, 12
+LEFT_ELBOW, RIGHT_ELBOW = 13, 14
+LEFT_WRIST, RIGHT_WRIST = 15, 16
+LEFT_HIP, RIGHT_HIP = 23, 24
+LEFT_KNEE, RIGHT_KNEE = 25, 26
+LEFT_ANKLE, RIGHT_ANKLE = 27, 28
+LEFT_FOOT_INDEX, RIGHT_FOOT_INDEX = 31, 32
+
+LANDMARK_NAMES = (
+    'nose', 'left_eye_inner', 'left_eye', 'left_eye_outer', 'right_eye_inner',
+    'right_eye', 'right_eye_outer', 'left_ear', 'right_ear', 'mouth_left',
+    'mouth_right', 'left_shoulder', 'right_shoulder', 'left_elbow',
+    'right_elbow', 'left_wrist', 'right_wrist', 'left_pinky', 'right_pinky',
+    'left_index', 'right_index', 'left_thumb', 'right_thumb', 'left_hip',
+    'right_hip', 'left_knee', 'right_knee', 'left_ankle', 'right_ankle',
+    'left_heel', 'right_heel', 'left_foot_index', 'right_foot_index',
+)
+LANDMARK = {name: i for i, name in enumerate(LANDMARK_NAMES)}
+
+# Joint angles measured at the middle landmark of each triplet
+JOINT_TRIPLETS = (
+    ('left_elbow', LEFT_SHOULDER, LEFT_ELBOW, LEFT_WRIST),
+    ('right_elbow', RIGHT_SHOULDER, RIGHT_ELBOW, RIGHT_WRIST),
+    ('left_shoulder', LEFT_ELBOW, LEFT_SHOULDER, LEFT_HIP),
+    ('right_shoulder', RIGHT_ELBOW, RIGHT_SHOULDER, RIGHT_HIP),
+    ('left_hip', LEFT_SHOULDER, LEFT_HIP, LEFT_KNEE),
+    ('right_hip', RIGHT_SHOULDER, RIGHT_HIP, RIGHT_KNEE),
+    ('left_knee', LEFT_HIP, LEFT_KNEE, LEFT_ANKLE),
+    ('right_knee', RIGHT_HIP, RIGHT_KNEE, RIGHT_ANKLE),
+    ('left_ankle', LEFT_KNEE, LEFT_ANKLE, LEFT_FOOT_INDEX),
+    ('right_ankle', RIGHT_KNEE, RIGHT_ANKLE, RIGHT_FOOT_INDEX),
+)
+
+JOINT_NAMES = tuple(name for name, _, _, _ in JOINT_TRIPLETS)
+JOINT = {name: i for i, name in enumerate(JOINT_NAMES)}
+
+_END_A = np.array([a for _, a, _, _ in JOINT_TRIPLETS])
+_VERTEX = np.array([b for _, _, b, _ in JOINT_TRIPLETS])
+_END_C = np.array([c for _, _, _, c in JOINT_TRIPLETS])
+
+
+def landmarks_to_array(landmarks):
+    """Convert MediaPipe landmarks to a (33, 4) float32 x, y, z, visibility array"""
+    return np.array(
+        [(lm.x, lm.y, lm.z, lm.visibility) for lm in landmarks],
+        dtype=np.float32
+    )
+
+
+def compute_angles(points):
+    """Angles in degrees of every joint in JOINT_TRIPLETS.
+
+    Takes a (33, 4) landmark array for one frame, or an (N, 33, 4) batch,
+    and returns a (len(JOINT_TRIPLETS),) or (N, len(JOINT_TRIPLETS)) array
+    ordered like JOINT_NAMES. Angles are folded into [0, 180].
+    """
+    xy = points[..., :2]
+    vertex = xy[..., _VERTEX, :]
+
+    # Both rays of every joint go through a single arctan2 call
+    rays = np.stack((xy[..., _END_C, :] - vertex, xy[..., _END_A, :] - vertex))
+    headings = np.arctan2(rays[..., 1], rays[..., 0])
+
+    angles = np.abs(np.degrees(headings[0] - headings[1]))
+    return np.where(angles > 180.0, 360.0 - angles, angles)
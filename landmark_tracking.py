@@ -0,0 +1,217 @@
+#!/usr/bin/env python3
+
+import math
+import os
+
+import cv2
+import numpy as np
+
+# Inference runs at least every KEYFRAME_MAX_INTERVAL frames, more often while tracking drifts
+KEYFRAME_MIN_INTERVAL = int(os.environ.get('KEYFRAME_MIN_INTERVAL', '1'))
+KEYFRAME_MAX_INTERVAL = int(os.environ.get('KEYFRAME_MAX_INTERVAL', '4'))
+
+# Median landmark drift (normalized image units) tolerated before keyframes get denser
+KEYFRAME_DRIFT_TOLERANCE = float(os.environ.get('KEYFRAME_DRIFT_TOLERANCE', '0.02'))
+
+# Optical flow runs on a downscaled grayscale copy of the frame
+TRACKING_WIDTH = int(os.environ.get('TRACKING_WIDTH', '320'))
+
+# One-Euro filter parameters for normalized coordinates over seconds
+ONE_EURO_MIN_CUTOFF = float(os.environ.get('ONE_EURO_MIN_CUTOFF', '3.0'))
+ONE_EURO_BETA = float(os.environ.get('ONE_EURO_BETA', '30.0'))
+ONE_EURO_D_CUTOFF = float(os.environ.get('ONE_EURO_D_CUTOFF', '1.0'))
+
+# Landmarks below this visibility are neither tracked nor used to judge drift
+VISIBILITY_THRESHOLD = 0.5
+
+# Tracking gives up, forcing inference, when more visible landmarks are lost
+MAX_LOST_FRACTION = 0.3
+
+_LK_PARAMS = dict(
+    winSize=(15, 15), maxLevel=2,
+    criteria=(cv2.TERM_CRITERIA_EPS | cv2.TERM_CRITERIA_COUNT, 10, 0.03)
+)
+
+
+def tracking_image(frame, code=cv2.COLOR_BGR2GRAY):
+    """Downscaled grayscale copy of a frame for optical flow"""
+    height, width = frame.shape[:2]
+    if width > TRACKING_WIDTH:
+        scale = TRACKING_WIDTH / width
+        frame = cv2.resize(frame, (TRACKING_WIDTH, max(1, round(height * scale))),
+                           interpolation=cv2.INTER_AREA)
+    return cv2.cvtColor(frame, code)
+
+
+class OneEuroFilter:
+    """One-Euro low-pass filter over a whole landmark array.
+
+    Slow movement is smoothed hard, which removes the jitter that flips stages
+    near a threshold, while the cutoff rises with speed to keep lag low during
+    a rep. Only x, y and z are filtered, visibility passes through.
+    """
+
+    __slots__ = ('min_cutoff', 'beta', 'd_cutoff', 'value', 'derivative', 'timestamp')
+
+    def __init__(self, min_cutoff=ONE_EURO_MIN_CUTOFF, beta=ONE_EURO_BETA, d_cutoff=ONE_EURO_D_CUTOFF):
+        self.min_cutoff = min_cutoff
+        self.beta = beta
+        self.d_cutoff = d_cutoff
+        self.reset()
+
+    def reset(self):
+        self.value = None
+        self.derivative = None
+        self.timestamp = None
+
+    @staticmethod
+    def _alpha(cutoff, dt):
+        return 1.0 / (1.0 + 1.0 / (2.0 * math.pi * cutoff * dt))
+
+    def __call__(self, points, timestamp):
+        """Filter one frame of (33, 4) landmarks taken at ``timestamp`` seconds"""
+        coords = points[:, :3]
+        if self.value is None:
+            self.value = coords.copy()
+            self.derivative = np.zeros_like(coords)
+            self.timestamp = timestamp
+            return points.copy()
+
+        dt = timestamp - self.timestamp
+        if dt > 0:
+            derivative = (coords - self.value) / dt
+            self.derivative += self._alpha(self.d_cutoff, dt) * (derivative - self.derivative)
+
+            # Per-landmark cutoff from its speed, so a moving wrist does not lag a still hip
+            speed = np.linalg.norm(self.derivative, axis=1, keepdims=True)
+            alpha = self._alpha(self.min_cutoff + self.beta * speed, dt)
+            self.value += alpha * (coords - self.value)
+            self.timestamp = timestamp
+
+        filtered = points.copy()
+        filtered[:, :3] = self.value
+        return filtered
+
+
+class LandmarkTracker:
+    """Keyframe scheduler that propagates landmarks between inference runs.
+
+    Pose inference only runs on keyframes. In between, the previous landmarks
+    are carried to the new frame by pyramidal Lucas-Kanade optical flow, which
+    costs a fraction of a millisecond. On every keyframe the propagated
+    landmarks are compared with the inferred ones: while tracking stays within
+    the drift tolerance the keyframe interval grows, otherwise it halves.
+    Every output, tracked or inferred, goes through a One-Euro filter.
+    """
+
+    __slots__ = (
+        'min_interval', 'max_interval', 'drift_tolerance', 'interval',
+        'since_keyframe', 'image', 'points', 'filter', 'keyframes', 'tracked', 'last_drift',
+    )
+
+    def __init__(self, min_interval=KEYFRAME_MIN_INTERVAL, max_interval=KEYFRAME_MAX_INTERVAL,
+                 drift_tolerance=KEYFRAME_DRIFT_TOLERANCE, **filter_options):
+        self.min_interval = max(1, min_interval)
+        self.max_interval = max(self.min_interval, max_interval)
+        self.drift_tolerance = drift_tolerance
+        self.filter = OneEuroFilter(**filter_options)
+        self.keyframes = 0
+        self.tracked = 0
+        self.last_drift = None
+        self.reset()
+
+    def reset(self):
+        """Forget the tracked pose, the next frame becomes a keyframe"""
+        self.interval = self.min_interval
+        self.since_keyframe = 0
+        self.image = None
+        self.points = None
+        self.filter.reset()
+
+    def needs_keyframe(self):
+        """Whether the next frame has to run pose inference"""
+        return self.points is None or self.since_keyframe + 1 >= self.interval
+
+    def track(self, image, timestamp):
+        """Propagate the landmarks to a new frame without inference.
+
+        Returns filtered (33, 4) landmarks, or None when too many visible
+        landmarks were lost and the frame needs inference instead.
+        """
+        points = self._propagate(image)
+        if points is None:
+            self.interval = self.min_interval
+            return None
+
+        self.image = image
+        self.points = points
+        self.since_keyframe += 1
+        self.tracked += 1
+        return self.filter(points, timestamp)
+
+    def keyframe(self, image, points, timestamp):
+        """Adopt freshly inferred landmarks and adapt the keyframe interval"""
+        predicted = self._propagate(image) if self.points is not None else None
+        if predicted is not None:
+            visible = points[:, 3] >= VISIBILITY_THRESHOLD
+            if visible.any():
+                errors = np.linalg.norm(predicted[visible, :2] - points[visible, :2], axis=1)
+                self.last_drift = float(np.median(errors))
+                if self.last_drift <= self.drift_tolerance:
+                    self.interval = min(self.interval + 1, self.max_interval)
+                else:
+                    self.interval = max(self.min_interval, self.interval // 2)
+
+        self.image = image
+        self.points = points
+        self.since_keyframe = 0
+        self.keyframes += 1
+        return self.filter(points, timestamp)
+
+    def update(self, image, timestamp, infer):
+        """Landmarks of a frame, calling ``infer()`` only when it is a keyframe.
+
+        ``infer`` returns raw (33, 4) landmarks or None when no pose was found.
+        Returns (landmarks or None, whether inference ran).
+        """
+        if not self.needs_keyframe():
+            points = self.track(image, timestamp)
+            if points is not None:
+                return points, False
+
+        raw = infer()
+        if raw is None:
+            self.reset()
+            return None, True
+        return self.keyframe(image, raw, timestamp), True
+
+    def stats(self):
+        """Keyframe counters of the tracker"""
+        return {
+            'keyframes': self.keyframes,
+            'tracked': self.tracked,
+            'interval': self.interval,
+            'drift': self.last_drift
+        }
+
+    def _propagate(self, image):
+        """Carry the current landmarks into ``image`` with optical flow"""
+        if self.image is None or self.image.shape != image.shape:
+            return None
+
+        height, width = image.shape[:2]
+        scale = np.array([width, height], dtype=np.float32)
+        visible = self.points[:, 3] >= VISIBILITY_THRESHOLD
+        if not visible.any():
+            return None
+
+        previous = (self.points[visible, :2] * scale).reshape(-1, 1, 2)
+        moved, status, _ = cv2.calcOpticalFlowPyrLK(self.image, image, previous, None, **_LK_PARAMS)
+        found = status.ravel().astype(bool)
+        if (~found).sum() > MAX_LOST_FRACTION * found.size:
+            return None
+
+        points = self.points.copy()
+        indices = np.flatnonzero(visible)[found]
+        points[indices, :2] = moved.reshape(-1, 2)[found] / scale
+        return points
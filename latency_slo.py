@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+
+import os
+import threading
+
+from frame_codec import FRAME_JPEG_QUALITY
+from pose_pool import model_available
+
+# End-to-end budget from client capture to pose_analysis
+LATENCY_TARGET_MS = float(os.environ.get('LATENCY_TARGET_MS', '100'))
+
+# Latency targets a session may ask for, below the minimum no frame can be scored in time
+MIN_LATENCY_TARGET_MS = 20.0
+MAX_LATENCY_TARGET_MS = 5000.0
+
+# Frames per latency evaluation, and p90 below this fraction of the target counts as headroom
+SLO_WINDOW = int(os.environ.get('SLO_WINDOW', '15'))
+SLO_HEADROOM = float(os.environ.get('SLO_HEADROOM', '0.6'))
+
+# Healthy windows in a row before stepping back up a level
+SLO_RECOVERY_WINDOWS = 3
+
+# Expired frames skipped in a row before one is processed anyway, so a session never starves
+MAX_EXPIRED_STREAK = 2
+
+# The lite model is only used when installed, MediaPipe would download it on the hot path
+_FAST_MODEL = 0 if model_available(0) else 1
+
+# Quality levels from best to cheapest. input_size is the longest side frames
+# are decoded down to, max_fps the frame rate a session is accepted at.
+QUALITY_LADDER = (
+    {'model_complexity': 1, 'input_size': None, 'annotate': True, 'jpeg_quality': FRAME_JPEG_QUALITY, 'max_fps': None},
+    {'model_complexity': 1, 'input_size': 480, 'annotate': True, 'jpeg_quality': 75, 'max_fps': None},
+    {'model_complexity': 1, 'input_size': 320, 'annotate': False, 'jpeg_quality': 60, 'max_fps': None},
+    {'model_complexity': _FAST_MODEL, 'input_size': 320, 'annotate': False, 'jpeg_quality': 60, 'max_fps': 20},
+    {'model_complexity': _FAST_MODEL, 'input_size': 256, 'annotate': False, 'jpeg_quality': 50, 'max_fps': 12},
+    {'model_complexity': _FAST_MODEL, 'input_size': 256, 'annotate': False, 'jpeg_quality': 50, 'max_fps': 6},
+)
+
+
+class LatencyController:
+    """Holds a latency target by stepping along the quality ladder.
+
+    Every SLO_WINDOW observed frames the window's p90 latency is compared
+    with the target: over budget steps one level down the ladder at once,
+    while SLO_RECOVERY_WINDOWS windows in a row under SLO_HEADROOM of the
+    target step one level back up.
+
+    Client capture timestamps are mapped onto the server clock with the
+    smallest receive delay seen so far, which absorbs clock skew between the
+    two at the price of leaving out the fastest network transit.
+    """
+
+    __slots__ = (
+        'target', 'level', 'samples', 'healthy_windows', 'clock_offset',
+        'expired_streak', 'last_accepted', 'source_size', 'lock',
+    )
+
+    def __init__(self, target_ms=LATENCY_TARGET_MS, level=0):
+        self.target = target_ms / 1000.0
+        self.level = level
+        self.samples = []
+        self.healthy_windows = 0
+        self.clock_offset = None
+        self.expired_streak = 0
+        self.last_accepted = None
+        # Full-resolution (width, height) of the session's frames
+        self.source_size = None
+        self.lock = threading.Lock()
+
+    @property
+    def quality(self):
+        """Settings of the current quality level"""
+        return QUALITY_LADDER[self.level]
+
+    def capture_time(self, ts, received):
+        """Server-clock capture time of a frame sent at client time ``ts`` (ms)"""
+        if ts is None:
+            return received
+        try:
+            captured = float(ts) / 1000.0
+        except (TypeError, ValueError):
+            return received
+
+        offset = received - captured
+        if self.clock_offset is None or offset < self.clock_offset:
+            self.clock_offset = offset
+        return captured + self.clock_offset
+
+    def accept(self, now):
+        """Whether a frame arriving now fits the level's frame rate"""
+        max_fps = self.quality['max_fps']
+        if max_fps and self.last_accepted is not None and now - self.last_accepted < 1.0 / max_fps:
+            return False
+        self.last_accepted = now
+        return True
+
+    def expired(self, captured, now):
+        """Whether a frame is already past its deadline and should be skipped"""
+        if now - captured <= self.target or self.expired_streak >= MAX_EXPIRED_STREAK:
+            self.expired_streak = 0
+            return False
+        self.expired_streak += 1
+        return True
+
+    def observe(self, latency):
+        """Record one frame's end-to-end latency, returns True if the level changed"""
+        with self.lock:
+            self.samples.append(latency)
+            if len(self.samples) < SLO_WINDOW:
+                return False
+
+            self.samples.sort()
+            p90 = self.samples[int(0.9 * (len(self.samples) - 1))]
+            self.samples = []
+
+            if p90 > self.target:
+                self.healthy_windows = 0
+                if self.level < len(QUALITY_LADDER) - 1:
+                    self.level += 1
+                    return True
+                return False
+
+            if p90 < SLO_HEADROOM * self.target:
+                self.healthy_windows += 1
+                if self.healthy_windows >= SLO_RECOVERY_WINDOWS and self.level > 0:
+                    self.healthy_windows = 0
+                    self.level -= 1
+                    return True
+            else:
+                self.healthy_windows = 0
+            return False
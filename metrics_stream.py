@@ -0,0 +1,153 @@
+#!/usr/bin/env python3
+
+import math
+import os
+import time
+
+# Metrics updates a subscribed client gets per second at most, 0 sends every change
+METRICS_RATE = float(os.environ.get('METRICS_RATE', '10'))
+
+# Updates per second of the live counter-joint angle and velocity, 0 leaves them out
+METRICS_LIVE_RATE = float(os.environ.get('METRICS_LIVE_RATE', '2'))
+
+# rep_analytics fields that change on every frame, with the step they are rounded to
+LIVE_FIELDS = {'angle': 1.0, 'velocity': 10.0}
+
+
+def _quantize(value, step):
+    if value is None or not math.isfinite(value):
+        return None
+    return round(value / step) * step
+
+
+def merge_patch(old, new):
+    """JSON merge patch (RFC 7396) turning ``old`` into ``new``, None when nothing changed"""
+    patch = {}
+    for key, value in new.items():
+        before = old.get(key)
+        if value == before:
+            continue
+        if isinstance(value, dict) and isinstance(before, dict):
+            # Nested dicts only carry the keys that changed
+            value = merge_patch(before, value)
+            if value is None:
+                continue
+        patch[key] = value
+    for key, value in old.items():
+        if key not in new and value is not None:
+            patch[key] = None
+    return patch or None
+
+
+class MetricsStream:
+    """Sends one client its session's metrics when they change instead of with every frame.
+
+    A subscription starts with a snapshot of the metrics and the exercise's
+    feedback message table, after which feedback goes out as indices into
+    the table. Every frame's metrics replace the stream's current state, and
+    ``poll`` returns the JSON merge patch from what the client has to it, or
+    None when nothing changed or the client's rate limit holds it back.
+    Changes held back go out with a later frame. Messages missing from the
+    table are appended to it and announced with the update that first uses
+    them. Multi-person sessions keep each person's metrics under ``people``
+    by person ID, so someone missing from a frame keeps their last state.
+
+    The live angle and velocity in rep_analytics change on every frame, so
+    they are kept out of the metrics and go out rounded, as a patch of their
+    own at the lower ``live_rate`` through ``poll_live``. Frames that change
+    neither reps, stage nor feedback then produce no update at all.
+
+    Streams are only touched from green threads on the event loop, so they
+    need no lock.
+    """
+
+    __slots__ = (
+        'sid', 'rate', 'interval', 'live_rate', 'live_interval', 'messages', 'codes', 'announced',
+        'current', 'sent', 'next_update', 'live', 'live_sent', 'next_live',
+    )
+
+    def __init__(self, sid, messages, rate=METRICS_RATE, live_rate=METRICS_LIVE_RATE):
+        self.sid = sid
+        self.rate = rate
+        self.interval = 1.0 / rate if rate > 0 else 0.0
+        self.live_rate = live_rate
+        self.live_interval = 1.0 / live_rate if live_rate > 0 else None
+        self.messages = list(messages)
+        self.codes = {message: code for code, message in enumerate(self.messages)}
+        self.announced = len(self.messages)
+        self.current = {}
+        self.sent = {}
+        self.next_update = 0.0
+        self.live = {}
+        self.live_sent = {}
+        self.next_live = 0.0
+
+    def set(self, metrics, person_id=None):
+        """Replace the current metrics, of one person in multi-person sessions"""
+        encoded = dict(metrics, feedback=[self._code(message) for message in metrics['feedback']])
+        live = {}
+        analytics = metrics.get('rep_analytics')
+        if analytics:
+            encoded['rep_analytics'] = {key: value for key, value in analytics.items() if key not in LIVE_FIELDS}
+            live = {key: _quantize(analytics.get(key), step) for key, step in LIVE_FIELDS.items()}
+        if person_id is None:
+            self.current = encoded
+            self.live = live
+        else:
+            # New dicts each time, so ``sent`` can keep referring to the old ones
+            people = dict(self.current.get('people') or {})
+            people[str(person_id)] = encoded
+            self.current = {'people': people}
+            people = dict(self.live.get('people') or {})
+            people[str(person_id)] = live
+            self.live = {'people': people}
+
+    def snapshot(self, now=None):
+        """Everything a newly subscribed client needs, the metrics sent so far start over from it"""
+        now = time.monotonic() if now is None else now
+        self.sent = self.current
+        self.announced = len(self.messages)
+        self.next_update = now + self.interval
+        snapshot = {'rate': self.rate, 'live_rate': self.live_rate, 'messages': list(self.messages),
+                    'metrics': self.current}
+        if self.live_interval is not None:
+            self.live_sent = self.live
+            self.next_live = now + self.live_interval
+            snapshot['live'] = self.live
+        return snapshot
+
+    def poll(self, now=None):
+        """The update due for the client, or None"""
+        now = time.monotonic() if now is None else now
+        if now < self.next_update:
+            return None
+        patch = merge_patch(self.sent, self.current)
+        if patch is None:
+            return None
+        update = {'metrics': patch}
+        if len(self.messages) > self.announced:
+            # Codes continue where the client's table ends
+            update['messages'] = self.messages[self.announced:]
+            self.announced = len(self.messages)
+        self.sent = self.current
+        self.next_update = now + self.interval
+        return update
+
+    def poll_live(self, now=None):
+        """Patch of the live angle and velocity due for the client, or None"""
+        now = time.monotonic() if now is None else now
+        if self.live_interval is None or now < self.next_live:
+            return None
+        patch = merge_patch(self.live_sent, self.live)
+        if patch is None:
+            return None
+        self.live_sent = self.live
+        self.next_live = now + self.live_interval
+        return patch
+
+    def _code(self, message):
+        code = self.codes.get(message)
+        if code is None:
+            code = self.codes[message] = len(self.messages)
+            self.messages.append(message)
+        return code
@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+
+import os
+
+import cv2
+import numpy as np
+
+# Thumbnail width the change detector compares, frames are shrunk to this many pixels across
+MOTION_THUMBNAIL_WIDTH = int(os.environ.get('MOTION_THUMBNAIL_WIDTH', '64'))
+
+# A thumbnail pixel counts as changed when its gray level moved by more than this
+MOTION_PIXEL_DELTA = int(os.environ.get('MOTION_PIXEL_DELTA', '12'))
+
+# Frames with a smaller fraction of changed pixels than this reuse the last result
+MOTION_THRESHOLD = float(os.environ.get('MOTION_THRESHOLD', '0.002'))
+
+# Inference runs at least once every this many frames, even on a static scene
+MOTION_MAX_SKIPPED = int(os.environ.get('MOTION_MAX_SKIPPED', '30'))
+
+
+def motion_thumbnail(buffer):
+    """Tiny grayscale thumbnail of JPEG bytes, decoded by libjpeg at 1/8 scale"""
+    small = cv2.imdecode(buffer, cv2.IMREAD_REDUCED_GRAYSCALE_8)
+    if small is None:
+        raise ValueError("Could not decode image")
+
+    height, width = small.shape
+    if width > MOTION_THUMBNAIL_WIDTH:
+        small = cv2.resize(small, (MOTION_THUMBNAIL_WIDTH, max(1, round(height * MOTION_THUMBNAIL_WIDTH / width))),
+                           interpolation=cv2.INTER_AREA)
+    return small
+
+
+class MotionGate:
+    """Skips pose inference on frames where nothing moved.
+
+    Every frame is reduced to a thumbnail of a few thousand gray pixels and
+    compared with the thumbnail of the last frame that ran inference, not the
+    previous frame, so slow movement adds up until it opens the gate. Below
+    the threshold the frame is answered from the last landmarks and angles,
+    which the caller still feeds through the exercise engine so hold timers
+    keep running. Annotating sessions also keep the decoded reference frame
+    and the feedback its overlay was drawn with, so a static frame whose
+    feedback changed gets the overlay redrawn rather than inferred.
+    """
+
+    __slots__ = (
+        'threshold', 'pixel_delta', 'max_skipped', 'reference', 'points', 'angles',
+        'frame', 'processed_frame', 'feedback', 'skipped_in_row', 'skipped', 'inferred', 'last_change',
+    )
+
+    def __init__(self, threshold=MOTION_THRESHOLD, pixel_delta=MOTION_PIXEL_DELTA,
+                 max_skipped=MOTION_MAX_SKIPPED):
+        self.threshold = threshold
+        self.pixel_delta = pixel_delta
+        self.max_skipped = max_skipped
+        self.skipped = 0
+        self.inferred = 0
+        self.last_change = None
+        self.reset()
+
+    def reset(self):
+        """Forget the reference frame, the next frame runs inference"""
+        self.reference = None
+        self.points = None
+        self.angles = None
+        self.frame = None
+        self.processed_frame = None
+        self.feedback = None
+        self.skipped_in_row = 0
+
+    def static(self, thumbnail):
+        """Whether a frame can reuse the last result, counting it as skipped if so"""
+        if self.reference is None or self.reference.shape != thumbnail.shape:
+            return False
+
+        changed = cv2.absdiff(self.reference, thumbnail) > self.pixel_delta
+        self.last_change = float(np.count_nonzero(changed)) / changed.size
+        if self.last_change >= self.threshold or self.skipped_in_row >= self.max_skipped:
+            return False
+
+        self.skipped_in_row += 1
+        self.skipped += 1
+        return True
+
+    def remember(self, thumbnail, points, angles, frame=None, processed_frame=None, feedback=None):
+        """Make an inferred frame the new reference, ``points`` is None without a pose"""
+        self.reference = thumbnail
+        self.points = points
+        self.angles = angles
+        self.frame = frame
+        self.processed_frame = processed_frame
+        self.feedback = feedback
+        self.skipped_in_row = 0
+        self.inferred += 1
+
+    def stats(self):
+        """Skip counters of the gate"""
+        return {
+            'motion_skipped': self.skipped,
+            'motion_inferred': self.inferred,
+            'motion_change': self.last_change
+        }
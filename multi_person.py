@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+
+import collections
+import os
+
+import numpy as np
+
+# People detected per frame in multi-person sessions
+MAX_PEOPLE = int(os.environ.get('MAX_PEOPLE', '4'))
+
+# Boxes of one person in consecutive frames overlap at least this much (intersection over union)
+PERSON_MATCH_IOU = float(os.environ.get('PERSON_MATCH_IOU', '0.3'))
+
+# Frames a person may go undetected before their ID is retired
+PERSON_MAX_MISSED = int(os.environ.get('PERSON_MAX_MISSED', '15'))
+
+# Retired people whose state is kept for the workout summary
+PERSON_HISTORY_SIZE = 32
+
+# Landmarks at or above this visibility define a person's box
+VISIBILITY_THRESHOLD = 0.5
+
+
+def landmarker_points(result):
+    """(N, 33, 4) landmark array of everyone in a PoseLandmarker result"""
+    return np.array(
+        [[(lm.x, lm.y, lm.z, lm.visibility) for lm in pose] for pose in result.pose_landmarks],
+        dtype=np.float32
+    ).reshape(-1, 33, 4)
+
+
+def landmark_boxes(points):
+    """(N, 4) x0, y0, x1, y1 boxes around each person's visible landmarks"""
+    boxes = np.empty((len(points), 4), dtype=np.float32)
+    for i, person in enumerate(points):
+        visible = person[person[:, 3] >= VISIBILITY_THRESHOLD, :2]
+        if not len(visible):
+            visible = person[:, :2]
+        boxes[i, :2] = visible.min(axis=0)
+        boxes[i, 2:] = visible.max(axis=0)
+    return boxes
+
+
+def box_iou(a, b):
+    """(len(a), len(b)) intersection over union of two box arrays"""
+    top_left = np.maximum(a[:, None, :2], b[None, :, :2])
+    bottom_right = np.minimum(a[:, None, 2:], b[None, :, 2:])
+    intersection = np.prod(np.clip(bottom_right - top_left, 0, None), axis=2)
+    area_a = np.prod(a[:, 2:] - a[:, :2], axis=1)
+    area_b = np.prod(b[:, 2:] - b[:, :2], axis=1)
+    union = area_a[:, None] + area_b[None, :] - intersection
+    return np.where(union > 0, intersection / np.maximum(union, 1e-9), 0.0)
+
+
+class Person:
+    """One tracked trainee and their own workout state"""
+
+    __slots__ = ('person_id', 'state', 'box', 'points', 'missed')
+
+    def __init__(self, person_id, state):
+        self.person_id = person_id
+        self.state = state
+        self.box = None
+        self.points = None
+        self.missed = 0
+
+
+class PersonTracker:
+    """Stable person IDs across frames of a multi-person session.
+
+    Detections are matched to the people of the previous frame greedily by
+    the overlap of their landmark boxes, which is enough at camera frame
+    rates where a person barely moves between frames. Unmatched detections
+    become new people with fresh workout state from ``new_state(person_id)``,
+    and people missing for more than PERSON_MAX_MISSED frames are retired.
+    """
+
+    __slots__ = ('max_people', 'new_state', 'people', 'retired', 'next_id', 'timestamp')
+
+    def __init__(self, new_state, max_people=MAX_PEOPLE):
+        self.max_people = max_people
+        self.new_state = new_state
+        self.people = []
+        self.retired = collections.deque(maxlen=PERSON_HISTORY_SIZE)
+        self.next_id = 1
+        self.timestamp = 0
+
+    def next_timestamp(self, seconds):
+        """Strictly increasing millisecond timestamp for the landmarker's video mode"""
+        self.timestamp = max(self.timestamp + 1, int(seconds * 1000))
+        return self.timestamp
+
+    def update(self, points):
+        """Assign one frame's (N, 33, 4) detections to people, returns those seen in it"""
+        boxes = landmark_boxes(points)
+        matched = {}
+        if self.people and len(points):
+            iou = box_iou(np.array([person.box for person in self.people]), boxes)
+            # Best overlaps first, each person and detection used once
+            for flat in np.argsort(iou, axis=None)[::-1]:
+                i, j = (int(k) for k in np.unravel_index(flat, iou.shape))
+                if iou[i, j] < PERSON_MATCH_IOU:
+                    break
+                if i not in matched.values() and j not in matched:
+                    matched[j] = i
+
+        seen = []
+        for j in range(len(points)):
+            if j in matched:
+                person = self.people[matched[j]]
+            else:
+                person = Person(self.next_id, self.new_state(self.next_id))
+                self.next_id += 1
+                self.people.append(person)
+            person.box = boxes[j]
+            person.points = points[j]
+            person.missed = 0
+            seen.append(person)
+
+        remaining = []
+        for person in self.people:
+            if person not in seen:
+                person.missed += 1
+                if person.missed > PERSON_MAX_MISSED:
+                    self.retired.append(person)
+                    continue
+            remaining.append(person)
+        self.people = remaining
+        return seen
+
+    def summaries(self):
+        """Workout summary of every person tracked, retired ones included"""
+        return {str(person.person_id): person.state.summary()
+                for person in list(self.retired) + self.people}
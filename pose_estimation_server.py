@@ -1,16 +1,47 @@
 #!/usr/bin/env python3
 
+import time
+
+# Process start, for the startup timings reported by /ready
+STARTED = time.perf_counter()
+
+import io
 import os
+import sqlite3
 import cv2
-import mediapipe as mp
 import numpy as np
-import base64
 import json
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, send_file
 from flask_cors import CORS
 from flask_socketio import SocketIO, emit
-import time
+import functools
 import threading
+import tempfile
+
+from frame_codec import (
+    FRAME_JPEG_QUALITY, decode_buffer, decode_landmarks, decode_reduction, encode_frame,
+    image_buffer, input_format, is_binary, landmarks_format
+)
+from exercise_engine import REP_GOOD, REP_NONE, ExerciseEngine
+from joint_angles import compute_angles, landmarks_to_array
+from landmark_tracking import LandmarkTracker, tracking_image
+from latency_slo import LATENCY_TARGET_MS, MAX_LATENCY_TARGET_MS, MIN_LATENCY_TARGET_MS, LatencyController
+from metrics_stream import METRICS_LIVE_RATE, METRICS_RATE, MetricsStream
+from motion_gate import MotionGate, motion_thumbnail
+from multi_person import MAX_PEOPLE, PersonTracker, landmarker_points
+from pose_roi import RegionOfInterest
+from session_log import SessionLog, prune_logs
+from cpu_budget import CpuBudget
+from frame_pipeline import FrameJob, FramePipeline
+from frame_workers import FRAME_WORKER_THREADS, FrameWorkers
+from pose_metrics import PipelineMetrics
+from pose_pool import POSE_LANDMARKER_MODEL, POSE_POOL_MAX_SESSIONS, POSE_WARM_POOL, PosePool, landmarker_available
+from shared_sessions import (
+    FORWARDED_HEADER, WORKER_COUNT, WORKER_INDEX, connect_store, forward_request, restore_state, session_state,
+    worker_address
+)
+from workout_history import WorkoutHistory, week_start
+from workout_sessions import SessionRegistry, WorkoutSession
 
 # Set environment variables to prevent GUI issues
 os.environ['DISPLAY'] = ':0'
@@ -18,371 +49,1213 @@ os.environ['QT_QPA_PLATFORM'] = 'offscreen'
 
 app = Flask(__name__)
 CORS(app, origins=["*"])
-socketio = SocketIO(app, cors_allowed_origins="*", async_mode='eventlet')
-
-# Global variables for workout session
-workout_state = {
-    'active': False,
-    'exercise': None,
-    'counter': 0,
-    'stage': 'down',
-    'good_reps': 0,
-    'feedback': [],
-    'start_time': None
-}
-
-# Initialize MediaPipe
-mp_drawing = mp.solutions.drawing_utils
-mp_pose = mp.solutions.pose
-
-def calculate_angle(a, b, c):
-    """Calculate angle between three points"""
-    a = np.array(a)
-    b = np.array(b) 
-    c = np.array(c)
-    
-    radians = np.arctan2(c[1] - b[1], c[0] - b[0]) - np.arctan2(a[1] - b[1], a[0] - b[0])
-    angle = np.abs(radians * 180.0 / np.pi)
-    
-    if angle > 180.0:
-        angle = 360 - angle
-        
-    return angle
+if WORKER_INDEX is None:
+    socketio = SocketIO(app, cors_allowed_origins="*", async_mode='eventlet')
+else:
+    # Workers share the port, so a client's connection must stay on one TCP stream
+    socketio = SocketIO(app, cors_allowed_origins="*", async_mode='eventlet', transports=['websocket'])
+
+POSE_SERVER_PORT = int(os.environ.get('POSE_SERVER_PORT', '3001'))
+
+# Workout sessions, one per trainee
+sessions = SessionRegistry()
+
+# Session records shared with the other workers of start_pose_server.py, None when running alone
+shared_store = connect_store()
+
+# Last (counter, stage, good_reps) each session published to the store
+published_states = {}
+
+# Seconds spent in each startup phase, set once /ready flips
+startup = {'imports': round(time.perf_counter() - STARTED, 3)}
+server_ready = threading.Event()
+
+# This process's share of the cores, set before any native thread starts
+cpu_budget = CpuBudget(worker_index=WORKER_INDEX, num_workers=WORKER_COUNT)
+cpu_budget.apply()
+
+# Warm Pose instances, one per admitted session, plus spares built at boot
+pose_pool = PosePool(POSE_POOL_MAX_SESSIONS or cpu_budget.capacity)
+POSE_POOL_SWEEP_INTERVAL = 30
+
+# Sessions overlap decode, inference and encode of consecutive frames unless they opt out
+FRAME_PIPELINE = os.environ.get('FRAME_PIPELINE', '1') == '1'
+
+# Native threads for decode, inference and encode, pipelined sessions keep one busy per stage
+frame_workers = FrameWorkers(socketio.async_mode, FRAME_WORKER_THREADS
+                             or cpu_budget.frame_threads(3 if FRAME_PIPELINE else 1))
+
+# Stage latency histograms and frame counters for /metrics
+pipeline_metrics = PipelineMetrics()
+
+# Rep counting and form rules compiled from exercise_specs.json
+exercise_engine = ExerciseEngine.from_file()
+
+# Sessions run inference on every frame unless they opt into keyframes
+KEYFRAME_INFERENCE = os.environ.get('KEYFRAME_INFERENCE', '0') == '1'
+
+# Sessions infer on the whole frame unless they opt into cropping around the trainee
+ROI_CROP = os.environ.get('ROI_CROP', '0') == '1'
+
+# Sessions trade quality for latency under load unless they opt out
+LATENCY_SLO = os.environ.get('LATENCY_SLO', '1') == '1'
+
+# Sessions skip inference on frames where nothing moved unless they opt out
+MOTION_GATE = os.environ.get('MOTION_GATE', '1') == '1'
+
+# Sessions keep an append-only log of every scored frame unless they opt out
+SESSION_LOG = os.environ.get('SESSION_LOG', '1') == '1'
+
+# Finished workouts are kept in the history store unless it is turned off
+WORKOUT_HISTORY = os.environ.get('WORKOUT_HISTORY', '1') == '1'
+workout_history = WorkoutHistory() if WORKOUT_HISTORY else None
+
+# Latency of all sessions together, new sessions start at its quality level
+global_slo = LatencyController()
+
+def get_request_session_id():
+    """Read the session id from a REST request's JSON body or query string"""
+    data = request.get_json(silent=True) or {}
+    return data.get('session_id') or request.args.get('session_id')
+
+def get_frame_session(data):
+    """Find the session a socket event belongs to and bind it to the sender"""
+    session_id = data.get('session_id') if isinstance(data, dict) else None
+    if session_id:
+        session = sessions.get(session_id)
+        if shared_store is not None and (session is None or session.sid != request.sid):
+            # A new connection may bring a session another worker started or owned
+            session = claim_session(session_id, session)
+    else:
+        # Clients may use their Socket.IO sid as the session id
+        session = sessions.get_by_sid(request.sid) or sessions.get(request.sid)
+    
+    if session is not None and session.sid != request.sid:
+        sessions.bind(session, request.sid)
+    return session
 
-def check_bicep_curl_form(landmarks, elbow_angle, stage):
-    """Check bicep curl form and return feedback"""
-    feedback = []
+def draw_pose(frame, points):
+    """Draw a landmark array's skeleton onto a frame"""
+    # Imported on first use, MediaPipe's drawing utilities pull in matplotlib
+    from mediapipe.framework.formats import landmark_pb2
+    from mediapipe.python.solutions import drawing_utils, pose as mp_pose
     
-    # Get key landmarks
-    shoulder = landmarks[mp_pose.PoseLandmark.LEFT_SHOULDER.value]
-    elbow = landmarks[mp_pose.PoseLandmark.LEFT_ELBOW.value]
-    hip = landmarks[mp_pose.PoseLandmark.LEFT_HIP.value]
+    landmarks = landmark_pb2.NormalizedLandmarkList(landmark=[
+        landmark_pb2.NormalizedLandmark(x=x, y=y, z=z, visibility=visibility)
+        for x, y, z, visibility in points.tolist()
+    ])
+    drawing_utils.draw_landmarks(frame, landmarks, mp_pose.POSE_CONNECTIONS)
+
+def draw_overlay(frame, points, feedback):
+    """Copy of a frame with the skeleton and feedback text drawn on it"""
+    annotated_frame = frame.copy()
+    draw_pose(annotated_frame, points)
+    
+    y_offset = 30
+    for message in feedback:
+        color = (0, 255, 0) if message == "Good form!" else (0, 0, 255)
+        cv2.putText(annotated_frame, message, (10, y_offset), 
+                   cv2.FONT_HERSHEY_SIMPLEX, 0.7, color, 2, cv2.LINE_AA)
+        y_offset += 30
+    return annotated_frame
+
+def open_session(data):
+    """Create a session from /start_workout options"""
+    exercise = data.get('exercise')
+    session_id = data.get('session_id')
+    
+    # Release what a session being restarted under the same id holds
+    if session_id:
+        release_session(session_id, sessions.get(session_id))
     
-    # Check form
-    if stage == "up" and elbow_angle > 45:
-        feedback.append("Lift higher for a full contraction!")
-    if stage == "down" and elbow_angle < 150:
-        feedback.append("Lower your arm completely!")
-    if abs(shoulder.x - hip.x) > 0.08:
-        feedback.append("Avoid swinging your body.")
-    if (elbow.x - shoulder.x) > 0.08:
-        feedback.append("Keep elbows tucked in.")
+    session = sessions.create(
+        exercise, session_id,
+        stage=exercise_engine.initial_stage(exercise),
+        timed=exercise_engine.is_timed(exercise),
+        annotate=bool(data.get('annotate')),
+        profile=bool(data.get('profile')),
+        user_id=str(data['user_id']) if data.get('user_id') is not None else None
+    )
+    if data.get('log', SESSION_LOG):
+        session.log = SessionLog(session)
+    people = requested_people(data)
+    if people:
+        # One landmarker finds everyone, the single-person shortcuts below do not apply
+        session.people = PersonTracker(lambda person_id: person_state(session, person_id), people)
+        cpu_budget.admit(session.session_id)
+        pose_pool.acquire(session.session_id, num_poses=people)
+        if data.get('pipeline', FRAME_PIPELINE):
+            session.pipeline = frame_pipeline(session)
+        return session
+    session.analytics = exercise_engine.rep_analytics(exercise)
+    if data.get('keyframes', KEYFRAME_INFERENCE):
+        session.tracker = LandmarkTracker()
+    if data.get('roi', ROI_CROP):
+        session.roi = RegionOfInterest()
+    if data.get('slo', LATENCY_SLO):
+        session.slo = LatencyController(requested_latency_target(data), global_slo.level)
+    if data.get('motion_gate', MOTION_GATE) and not data.get('client_landmarks'):
+        session.motion_gate = MotionGate()
+    
+    # Warm up the session's Pose instance before the first frame arrives,
+    # clients sending their own landmarks never need one
+    if not data.get('client_landmarks'):
+        cpu_budget.admit(session.session_id)
+        pose_pool.acquire(session.session_id)
+        if data.get('pipeline', FRAME_PIPELINE):
+            session.pipeline = frame_pipeline(session)
+    else:
+        cpu_budget.release(session.session_id)
+    return session
+
+def requested_people(data):
+    """People a session wants tracked, 0 for the single-person pipeline"""
+    people = data.get('people')
+    if isinstance(people, bool):
+        return MAX_PEOPLE if people else 0
+    people = int(people or 0)
+    if not 0 <= people <= MAX_PEOPLE:
+        raise ValueError(f"people must be between 1 and {MAX_PEOPLE}")
+    return people
+
+def requested_latency_target(data):
+    """End-to-end latency target in ms a session asks for"""
+    target = data.get('latency_target_ms')
+    if target is None:
+        return LATENCY_TARGET_MS
+    target = float(target)
+    if not MIN_LATENCY_TARGET_MS <= target <= MAX_LATENCY_TARGET_MS:
+        raise ValueError(f"latency_target_ms must be between {MIN_LATENCY_TARGET_MS:g} and {MAX_LATENCY_TARGET_MS:g}")
+    return target
+
+def person_state(session, person_id):
+    """Workout state of one person in a multi-person session"""
+    state = WorkoutSession(
+        f'{session.session_id}/{person_id}', session.exercise,
+        stage=exercise_engine.initial_stage(session.exercise),
+        timed=exercise_engine.is_timed(session.exercise)
+    )
+    state.analytics = exercise_engine.rep_analytics(session.exercise)
+    if session.log is not None:
+        state.log = session.log.person(person_id)
+    return state
+
+def claim_session(session_id, session=None):
+    """Take a shared session over from the store, ``session`` is this worker's copy if any"""
+    record = frame_workers.run(shared_store.claim, session_id, WORKER_INDEX)
+    if record is None:
+        # Ended on another worker
+        if session is not None:
+            close_session(session_id)
+        return None
+    if session is not None and record['owner'] == WORKER_INDEX:
+        return session
     
-    return feedback
+    # Continue from the state the previous owner published last
+    session = open_session(record['options'])
+    if record['state']:
+        with session.lock:
+            restore_state(session, record['state'])
+            if session.log is not None:
+                session.log.note_start(session)
+    return session
+
+def close_session(session_id):
+    """Drop a session of this worker and free its Pose instance"""
+    session = sessions.remove(session_id)
+    release_session(session_id, session)
+    published_states.pop(session_id, None)
+    return session
+
+def release_session(session_id, session=None):
+    """Free the Pose instance, CPU slot, log and pipeline of a session leaving this worker"""
+    if session is not None:
+        session.active = False
+        if session.log is not None:
+            session.log.close()
+        if session.pipeline is not None:
+            session.pipeline.close()
+    pose_pool.release(session_id)
+    cpu_budget.release(session_id)
+
+def publish_session(session):
+    """Share a session's state with the other workers when it changed.
+
+    Like every call into the store, the publish is a blocking socket round
+    trip to the supervisor, so it runs on a worker thread off the event loop.
+    """
+    state = (session.counter, session.stage, session.good_reps)
+    if published_states.get(session.session_id) == state:
+        return
+    published_states[session.session_id] = state
+    with session.lock:
+        shared = session_state(session)
+    if not frame_workers.run(shared_store.publish, session.session_id, WORKER_INDEX, shared):
+        # Another worker took the session over
+        close_session(session.session_id)
 
-def check_squat_form(knee_angle, hip_angle, stage):
-    """Check squat form and return feedback"""
-    feedback = []
+def route_to_owner(session_id):
+    """Answer of the worker owning a shared session, or None to handle the request here"""
+    if shared_store is None or not session_id:
+        return None
+    record = frame_workers.run(shared_store.get, session_id)
+    if record is None:
+        # Ended on another worker, forget any stale copy
+        if sessions.get(session_id) is not None:
+            close_session(session_id)
+        return None
     
-    if stage == "down" and knee_angle > 100:
-        feedback.append("Squat deeper for full range of motion.")
-    if hip_angle < 80:
-        feedback.append("Keep your chest up and back straight.")
+    if record['owner'] != WORKER_INDEX and not request.headers.get(FORWARDED_HEADER):
+        try:
+            return frame_workers.run(forward_request, record['owner'], request.method, request.full_path,
+                                     request.get_data(), request.content_type)
+        except OSError as e:
+            print(f"Error forwarding to worker {record['owner']}: {e}")
     
-    return feedback
+    # Ours, or the owner is gone and this worker carries on from its last state
+    if sessions.get(session_id) is None or record['owner'] != WORKER_INDEX:
+        claim_session(session_id, sessions.get(session_id))
+    return None
 
-def check_pushup_form(shoulder_angle, elbow_angle, stage):
-    """Check pushup form and return feedback"""
-    feedback = []
+@app.route('/start_workout', methods=['POST'])
+def start_workout():
+    """Start a workout session"""
+    data = request.get_json(silent=True) or {}
+    try:
+        people = requested_people(data)
+    except (TypeError, ValueError):
+        return jsonify({'error': f'people must be true or a number of people from 1 to {MAX_PEOPLE}'}), 400
+    try:
+        requested_latency_target(data)
+    except (TypeError, ValueError):
+        return jsonify({
+            'error': f'latency_target_ms must be a number of ms from {MIN_LATENCY_TARGET_MS:g} to {MAX_LATENCY_TARGET_MS:g}'
+        }), 400
+    if people and not landmarker_available():
+        return jsonify({'error': f'Multi-person mode needs the pose landmarker model at {POSE_LANDMARKER_MODEL}'}), 400
+    if not data.get('client_landmarks') and not cpu_budget.has_room(data.get('session_id')):
+        # Turn the session away rather than slow down every running one
+        return jsonify({
+            'error': 'Server at capacity, no CPU left for another inference session. '
+                     'Retry later or send client landmarks.',
+            'capacity': cpu_budget.stats()
+        }), 503
     
-    if stage == "down" and elbow_angle > 120:
-        feedback.append("Lower yourself more for full range.")
-    if shoulder_angle < 160:
-        feedback.append("Keep your body straight.")
+    session = open_session(data)
+    if shared_store is not None:
+        frame_workers.run(shared_store.create, session.session_id, dict(data, session_id=session.session_id), WORKER_INDEX)
     
-    return feedback
+    return jsonify({
+        'status': 'started',
+        'exercise': session.exercise,
+        'session_id': session.session_id,
+        'annotate': session.annotate,
+        'keyframes': session.tracker is not None,
+        'roi': session.roi is not None,
+        'motion_gate': session.motion_gate is not None,
+        'log': session.log is not None,
+        'pipeline': session.pipeline is not None,
+        'people': session.people.max_people if session.people else None,
+        'latency_target_ms': 1000.0 * session.slo.target if session.slo else None,
+        'input': input_format(),
+        'landmarks': landmarks_format()
+    })
 
-def process_bicep_curl(landmarks):
-    """Process bicep curl exercise"""
-    global workout_state
+@app.route('/end_workout', methods=['POST'])
+def end_workout():
+    """End workout session"""
+    session_id = get_request_session_id()
+    if not session_id:
+        return jsonify({'error': 'session_id is required'}), 400
     
-    try:
-        # Get coordinates
-        shoulder = [landmarks[mp_pose.PoseLandmark.LEFT_SHOULDER.value].x,
-                   landmarks[mp_pose.PoseLandmark.LEFT_SHOULDER.value].y]
-        elbow = [landmarks[mp_pose.PoseLandmark.LEFT_ELBOW.value].x,
-                landmarks[mp_pose.PoseLandmark.LEFT_ELBOW.value].y]
-        wrist = [landmarks[mp_pose.PoseLandmark.LEFT_WRIST.value].x,
-                landmarks[mp_pose.PoseLandmark.LEFT_WRIST.value].y]
-        
-        # Calculate angle
-        elbow_angle = calculate_angle(shoulder, elbow, wrist)
+    forwarded = route_to_owner(session_id)
+    if forwarded is not None:
+        return forwarded
+    
+    session = sessions.remove(session_id)
+    if session is None:
+        return jsonify({'error': f'Unknown session: {session_id}'}), 404
+    
+    with session.lock:
+        session.active = False
+        summary = session.summary()
+    release_session(session_id, session)
+    if shared_store is not None:
+        frame_workers.run(shared_store.remove, session_id)
+        published_states.pop(session_id, None)
+    
+    if workout_history is not None:
+        try:
+            summary['history_id'] = frame_workers.run(archive_workout, session, summary)
+        except sqlite3.Error as e:
+            print(f"Error saving workout history: {e}")
+    
+    return jsonify({'status': 'ended', 'session_id': session_id, 'summary': summary})
+
+def archive_workout(session, summary):
+    """Store an ended session in the workout history (runs on a worker thread)"""
+    reps, good_reps = summary['reps'], summary['good_reps']
+    if 'people' in summary:
+        # Multi-person sessions count everyone's reps
+        reps = sum(person['reps'] for person in summary['people'].values())
+        good_reps = sum(person['good_reps'] for person in summary['people'].values())
+    return workout_history.record(session.session_id, session.user_id, session.exercise,
+                                  session.created, time.time(), reps, good_reps,
+                                  summary['frames']['processed'])
+
+@app.route('/session/<session_id>', methods=['GET'])
+def get_session(session_id):
+    """Current metrics of a workout session"""
+    forwarded = route_to_owner(session_id)
+    if forwarded is not None:
+        return forwarded
+    
+    session = sessions.get(session_id)
+    if session is None:
+        return jsonify({'error': f'Unknown session: {session_id}'}), 404
+    
+    with session.lock:
+        return jsonify({
+            'session_id': session_id,
+            'active': session.active,
+            'exercise': session.exercise,
+            'metrics': session.metrics(),
+            'frames': session.frame_stats()
+        })
+
+def server_timestamps(timestamps, count, received):
+    """Map a batch's client timestamps (ms) onto the server clock, its last frame at ``received``"""
+    if timestamps is None:
+        return None
+    seconds = np.asarray(timestamps, dtype=np.float64) / 1000.0
+    if seconds.shape != (count,):
+        raise ValueError(f"Expected {count} timestamps, got {seconds.size}")
+    return received - (seconds[-1] - seconds)
+
+def analyze_landmarks(session, points, timestamps=None):
+    """Run landmark frames straight through the exercise engine.
+
+    ``points`` is an (N, 33, 4) array and ``timestamps`` optional server-clock
+    seconds per frame. Returns the session metrics and the reps counted.
+    """
+    angles = compute_angles(points)
+    rep_list = []
+    with session.lock:
+        for i in range(len(points)):
+            now = timestamps[i] if timestamps is not None else None
+            outcome = exercise_engine.update(session, points[i], angles[i], now)
+            if outcome != REP_NONE:
+                rep_list.append({'index': i, 'rep': session.counter, 'good': outcome == REP_GOOD})
+        metrics = session.metrics()
+    
+    session.last_seen = time.monotonic()
+    session.count_frames(len(points))
+    pipeline_metrics.count('client_landmarks', len(points))
+    return metrics, rep_list
+
+def frame_payload(session, data, points, metrics):
+    """pose_analysis payload of one frame's landmarks and metrics"""
+    payload = {
+        'session_id': session.session_id,
+        'landmarks': points.astype('<f4', copy=False).tobytes(),
+        'metrics': metrics
+    }
+    if 'frame_id' in data:
+        # Lets clients match replies to frames and measure round trips
+        payload['frame_id'] = data['frame_id']
+    return payload
+
+def reuse_frame(session, data, gate, settings, timings):
+    """Answer a static frame with the landmarks and annotated frame of the last inferred one"""
+    if gate is None:
+        return None
+    
+    # The same pose again only advances time-based state such as hold timers
+    clock = time.perf_counter
+    started = clock()
+    with session.lock:
+        points = gate.points
+        if points is None:
+            return None
+        exercise_engine.update(session, points, gate.angles)
+        metrics = session.metrics()
+        frame, processed_frame, feedback = gate.frame, gate.processed_frame, gate.feedback
+    timings['analysis'] = clock() - started
+    
+    payload = frame_payload(session, data, points, metrics)
+    if not session.annotate or frame is None or (settings and not settings['annotate']):
+        return payload
+    
+    binary = is_binary(data['image'])
+    if feedback != metrics['feedback'] or is_binary(processed_frame) != binary:
+        # Hold timers and stage-bound rules change the feedback of the same pose, redraw the overlay
+        started = clock()
+        annotated_frame = draw_overlay(frame, points, metrics['feedback'])
+        encoded = clock()
+        timings['annotate'] = encoded - started
+        jpeg_quality = settings['jpeg_quality'] if settings else FRAME_JPEG_QUALITY
+        processed_frame = encode_frame(annotated_frame, binary=binary, quality=jpeg_quality)
+        timings['jpeg_encode'] = clock() - encoded
+        with session.lock:
+            if gate.frame is frame:
+                gate.processed_frame, gate.feedback = processed_frame, metrics['feedback']
+    payload['processed_frame'] = processed_frame
+    return payload
+
+def decode_frame(session, job):
+    """First stage: decode a frame, unless the motion gate finds it static (runs on a worker thread)"""
+    clock = time.perf_counter
+    timings = job.timings
+    slo = session.slo
+    settings = job.settings = slo.quality if slo is not None else None
+    
+    # Decode the binary attachment or legacy base64 data URL
+    started = clock()
+    buffer = image_buffer(job.data['image'])
+    decoded = clock()
+    timings['base64_decode'] = decoded - started
+    
+    gate = session.motion_gate if session.people is None else None
+    if gate is not None:
+        # Compare a tiny thumbnail before paying for the full decode
+        job.thumbnail = motion_thumbnail(buffer)
+        with session.lock:
+            job.static = gate.static(job.thumbnail)
+        timings['motion_gate'] = clock() - decoded
+        if job.static:
+            pipeline_metrics.count('motion_skipped')
+            return
+        decoded = clock()
+    
+    reduction = 1
+    if settings and settings['input_size'] and slo.source_size:
+        # Lower quality levels let libjpeg scale the frame down while decoding
+        reduction = decode_reduction(*slo.source_size, settings['input_size'])
+    frame = job.frame = decode_buffer(buffer, reduction)
+    timings['jpeg_decode'] = clock() - decoded
+    if slo is not None:
+        slo.source_size = (frame.shape[1] * reduction, frame.shape[0] * reduction)
+
+def infer_frame(session, job):
+    """Second stage: find the pose in a decoded frame (runs on a worker thread)"""
+    if job.static:
+        return
+    if session.people is not None:
+        return infer_people(session, job)
+    
+    clock = time.perf_counter
+    timings = job.timings
+    settings = job.settings
+    frame = job.frame
+    
+    def run_pose(rgb_frame):
+        # Process with the session's long-lived MediaPipe instance
+        complexity = settings['model_complexity'] if settings else None
+        with pose_pool.lease(session.session_id, complexity) as pose:
+            started = clock()
+            results = pose.process(rgb_frame)
+            timings['inference'] = timings.get('inference', 0.0) + clock() - started
+        if not results.pose_landmarks:
+            return None
+        return landmarks_to_array(results.pose_landmarks.landmark)
+    
+    def infer():
+        started = clock()
+        if roi is not None:
+            # Crop around the trainee and shrink before colour conversion
+            points = roi.locate(frame, run_pose)
+            timings['color_convert'] = clock() - started - timings['inference']
+            return points
         
-        # Check form
-        feedback = check_bicep_curl_form(landmarks, elbow_angle, workout_state['stage'])
+        # Convert BGR to RGB
+        rgb_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+        timings['color_convert'] = clock() - started
+        return run_pose(rgb_frame)
+    
+    roi = session.roi
+    tracker = session.tracker
+    if tracker is None:
+        points = infer()
+    else:
+        # Infer on keyframes only and follow the landmarks with optical flow in between
+        started = clock()
+        points, inferred = tracker.update(tracking_image(frame), time.monotonic(), infer)
+        timings['tracking'] = (clock() - started - timings.get('color_convert', 0.0)
+                               - timings.get('inference', 0.0))
+        if not inferred:
+            pipeline_metrics.count('tracked')
+    
+    if points is None:
+        return
+    if roi is not None:
+        roi.update(points)
+    
+    # All joint angles in one vectorized pass
+    job.points = points
+    job.angles = compute_angles(points)
+
+def render_frame(session, job):
+    """Third stage: score the pose and build the reply, annotated if asked (runs on a worker thread)"""
+    if job.static:
+        job.payload = reuse_frame(session, job.data, session.motion_gate, job.settings, job.timings)
+        return
+    if session.people is not None:
+        return render_people(session, job)
+    if job.points is None:
+        remember_frame(session, job)
+        return
+    
+    clock = time.perf_counter
+    timings = job.timings
+    settings = job.settings
+    points = job.points
+    started = clock()
+    with session.lock:
+        exercise_engine.update(session, points, job.angles)
+        metrics = session.metrics()
+    timings['analysis'] = clock() - started
+    
+    payload = job.payload = frame_payload(session, job.data, points, metrics)
+    if not session.annotate or (settings and not settings['annotate']):
+        # The client draws the overlay from the landmarks itself
+        remember_frame(session, job)
+        return
+    
+    # Draw pose landmarks and feedback text
+    started = clock()
+    annotated_frame = draw_overlay(job.frame, points, metrics['feedback'])
+    encoded = clock()
+    timings['annotate'] = encoded - started
+    
+    # Reply in the same transport the client used
+    jpeg_quality = settings['jpeg_quality'] if settings else FRAME_JPEG_QUALITY
+    payload['processed_frame'] = encode_frame(annotated_frame, binary=is_binary(job.data['image']), quality=jpeg_quality)
+    timings['jpeg_encode'] = clock() - encoded
+    remember_frame(session, job, payload['processed_frame'], metrics['feedback'])
+
+def remember_frame(session, job, processed_frame=None, feedback=None):
+    """Make an inferred frame the motion gate's reference, with the annotated frame it got.
+
+    Only the last stage changes the reference, and only under the session
+    lock, so static frames always reuse landmarks and image of the same frame.
+    """
+    gate = session.motion_gate
+    if gate is not None and job.thumbnail is not None:
+        with session.lock:
+            frame = job.frame if processed_frame is not None else None
+            gate.remember(job.thumbnail, job.points, job.angles, frame, processed_frame, feedback)
+
+def process_frame(session, job):
+    """Decode, analyse and annotate one frame in a row (runs on a worker thread)
+
+    Stage durations in seconds are recorded into ``job.timings``.
+    """
+    for stage in FRAME_STAGES:
+        stage(session, job)
+    return job.payload
+
+def infer_people(session, job):
+    """Find everyone in a multi-person session's frame"""
+    import mediapipe as mp
+    
+    clock = time.perf_counter
+    people = session.people
+    started = clock()
+    image = mp.Image(image_format=mp.ImageFormat.SRGB, data=cv2.cvtColor(job.frame, cv2.COLOR_BGR2RGB))
+    job.timings['color_convert'] = clock() - started
+    
+    # A single landmarker pass per frame, however many people are in it
+    with pose_pool.lease(session.session_id, num_poses=people.max_people) as landmarker:
+        started = clock()
+        result = landmarker.detect_for_video(image, people.next_timestamp(time.monotonic()))
+        job.timings['inference'] = clock() - started
+    job.points = landmarker_points(result)
+
+def render_people(session, job):
+    """Track and score everyone found in a multi-person session's frame"""
+    clock = time.perf_counter
+    timings = job.timings
+    settings = job.settings
+    started = clock()
+    seen = session.people.update(job.points)
+    if not seen:
+        return
+    
+    # Joint angles of everyone in one vectorized pass
+    angles = compute_angles(np.stack([person.points for person in seen]))
+    persons = []
+    with session.lock:
+        for person, person_angles in zip(seen, angles):
+            exercise_engine.update(person.state, person.points, person_angles)
+            person.state.count_frames()
+            persons.append({
+                'person_id': person.person_id,
+                'landmarks': person.points.astype('<f4', copy=False).tobytes(),
+                'metrics': person.state.metrics()
+            })
+    timings['analysis'] = clock() - started
+    
+    payload = job.payload = {'session_id': session.session_id, 'people': persons}
+    if 'frame_id' in job.data:
+        payload['frame_id'] = job.data['frame_id']
+    if not session.annotate or (settings and not settings['annotate']):
+        return
+    
+    # Draw everyone's landmarks, labelled with their ID and reps
+    started = clock()
+    annotated_frame = job.frame.copy()
+    height, width = annotated_frame.shape[:2]
+    for person, entry in zip(seen, persons):
+        draw_pose(annotated_frame, person.points)
+        x0, y0 = int(person.box[0] * width), max(20, int(person.box[1] * height) - 10)
+        cv2.putText(annotated_frame, f"#{person.person_id}: {entry['metrics']['reps']}", (x0, y0),
+                    cv2.FONT_HERSHEY_SIMPLEX, 0.7, (255, 255, 0), 2, cv2.LINE_AA)
+    encoded = clock()
+    timings['annotate'] = encoded - started
+    
+    jpeg_quality = settings['jpeg_quality'] if settings else FRAME_JPEG_QUALITY
+    payload['processed_frame'] = encode_frame(annotated_frame, binary=is_binary(job.data['image']), quality=jpeg_quality)
+    timings['jpeg_encode'] = clock() - encoded
+
+# Decode, inference and encode, run in a row or overlapped by a session's FramePipeline
+FRAME_STAGES = (decode_frame, infer_frame, render_frame)
+
+def frame_pipeline(session):
+    """FramePipeline running a session's frames through FRAME_STAGES"""
+    return FramePipeline(
+        [functools.partial(stage, session) for stage in FRAME_STAGES],
+        functools.partial(deliver_frame, session),
+        frame_workers.run, socketio.server.eio.create_queue, socketio.start_background_task
+    )
+
+def next_frame(session, sid):
+    """Take a session's newest frame as a FrameJob, skipping frames that can no longer be answered in time"""
+    while True:
+        item = session.take_frame()
+        if item is None:
+            return None
+        if not session.active:
+            continue
         
-        # Count reps
-        if elbow_angle > 160:
-            workout_state['stage'] = "down"
-        if elbow_angle < 30 and workout_state['stage'] == 'down':
-            workout_state['stage'] = "up"
-            workout_state['counter'] += 1
+        data, captured = item
+        slo = session.slo
+        if slo is not None and slo.expired(captured, time.time()):
+            # Answering this frame would already blow the latency budget
+            session.drop_frame()
+            pipeline_metrics.count('expired')
+            continue
+        return FrameJob(data, captured, sid)
+
+def drain_frames(session, sid):
+    """Process a session's newest frames until its mailbox runs empty"""
+    idle = False
+    try:
+        while True:
+            job = next_frame(session, sid)
+            if job is None:
+                # take_frame already marked the mailbox idle
+                idle = True
+                return
             
-            # Check if rep had good form
-            if not check_bicep_curl_form(landmarks, elbow_angle, "up"):
-                workout_state['good_reps'] += 1
-        
-        workout_state['feedback'] = feedback if feedback else ["Good form!"]
-        
-    except Exception as e:
-        print(f"Error processing bicep curl: {e}")
+            session.last_seen = time.monotonic()
+            pipeline = session.pipeline
+            if pipeline is not None:
+                # The pipeline delivers the reply once the frame passed all stages
+                if not pipeline.submit(job):
+                    return
+                continue
+            
+            try:
+                frame_workers.run(process_frame, session, job)
+            except Exception as e:
+                job.error = e
+            deliver_frame(session, job)
+    finally:
+        if not idle:
+            # Let the next frame start a new drain
+            session.stop_draining()
 
-def process_squats(landmarks):
-    """Process squats exercise"""
-    global workout_state
-    
+def deliver_frame(session, job):
+    """Send a processed frame's reply and record its timings"""
+    sid = job.sid
+    timings = job.timings
     try:
-        # Get coordinates
-        shoulder = [landmarks[mp_pose.PoseLandmark.LEFT_SHOULDER.value].x,
-                   landmarks[mp_pose.PoseLandmark.LEFT_SHOULDER.value].y]
-        hip = [landmarks[mp_pose.PoseLandmark.LEFT_HIP.value].x,
-              landmarks[mp_pose.PoseLandmark.LEFT_HIP.value].y]
-        knee = [landmarks[mp_pose.PoseLandmark.LEFT_KNEE.value].x,
-               landmarks[mp_pose.PoseLandmark.LEFT_KNEE.value].y]
-        ankle = [landmarks[mp_pose.PoseLandmark.LEFT_ANKLE.value].x,
-                landmarks[mp_pose.PoseLandmark.LEFT_ANKLE.value].y]
-        
-        # Calculate angles
-        knee_angle = calculate_angle(hip, knee, ankle)
-        hip_angle = calculate_angle(shoulder, hip, knee)
+        if job.error is not None:
+            raise job.error
+        session.frames_processed += 1
+        pipeline_metrics.count('processed')
         
-        # Check form
-        feedback = check_squat_form(knee_angle, hip_angle, workout_state['stage'])
+        # Send updated data back to client
+        payload = job.payload
+        if payload is None:
+            pipeline_metrics.count('no_pose')
+        else:
+            if shared_store is not None:
+                publish_session(session)
+            stream_metrics(session, payload, sid)
+            payload['frames'] = session.frame_stats()
+            if session.profile:
+                payload['timings'] = {stage: 1000.0 * seconds for stage, seconds in timings.items()}
+            emitted = time.perf_counter()
+            socketio.emit('pose_analysis', payload, to=sid)
+            timings['emit'] = time.perf_counter() - emitted
         
-        # Count reps
-        if knee_angle > 160:
-            workout_state['stage'] = "up"
-        if knee_angle < 100 and workout_state['stage'] == "up":
-            workout_state['stage'] = "down"
-            workout_state['counter'] += 1
+        timings['total'] = time.perf_counter() - job.started
+        timings['end_to_end'] = time.time() - job.captured
+        slo = session.slo
+        if slo is not None:
+            global_slo.observe(timings['end_to_end'])
+            if slo.observe(timings['end_to_end']):
+                # Clients can lower their capture rate and size to match
+                socketio.emit('quality_level', dict(slo.quality, session_id=session.session_id,
+                                                    level=slo.level), to=sid)
+        pipeline_metrics.observe(timings)
             
-            # Check if rep had good form
-            if not check_squat_form(knee_angle, hip_angle, "down"):
-                workout_state['good_reps'] += 1
-        
-        workout_state['feedback'] = feedback if feedback else ["Good form!"]
-        
     except Exception as e:
-        print(f"Error processing squats: {e}")
+        pipeline_metrics.count('errors')
+        print(f"Error processing frame: {e}")
+        socketio.emit('error', {'message': str(e)}, to=sid)
+
+def stream_metrics(session, payload, sid):
+    """Move a reply's metrics into the session's metrics stream and emit the update due, if any"""
+    stream = session.metrics_stream
+    if stream is None or stream.sid != sid:
+        # Not subscribed, the metrics stay in the reply
+        return
+    if 'people' in payload:
+        for person in payload['people']:
+            stream.set(person.pop('metrics'), person['person_id'])
+    else:
+        stream.set(payload.pop('metrics'))
+    update = stream.poll()
+    if update is not None:
+        update['session_id'] = session.session_id
+        socketio.emit('metrics_update', update, to=sid)
+        pipeline_metrics.count('metrics_updates')
+    live = stream.poll_live()
+    if live is not None:
+        socketio.emit('metrics_live', {'session_id': session.session_id, 'live': live}, to=sid)
+
+@socketio.on('video_frame')
+def handle_video_frame(data):
+    """Queue a video frame for pose analysis"""
+    session = get_frame_session(data)
+    if session is None or not session.active:
+        return
+    
+    if not isinstance(data, dict) or 'image' not in data:
+        emit('error', {'message': 'video_frame requires an image'})
+        return
+    
+    if session.session_id not in cpu_budget:
+        # Sessions started with client landmarks hold no inference slot, take one now if there is room
+        if not cpu_budget.has_room(session.session_id):
+            emit('error', {'message': 'Server at capacity, no CPU left for inference. Send client landmarks.',
+                           'capacity': cpu_budget.stats()})
+            return
+        cpu_budget.admit(session.session_id)
+    
+    # Map the client's capture time onto the server clock
+    received = time.time()
+    slo = session.slo
+    captured = slo.capture_time(data.get('ts'), received) if slo is not None else received
+    pipeline_metrics.count('received')
+    if slo is not None and not slo.accept(received):
+        # The session's quality level caps its frame rate
+        pipeline_metrics.count('throttled')
+        return
+    
+    # Only the newest frame is kept, so a slow session never builds a backlog
+    dropped = session.frames_dropped
+    start_drain = session.offer_frame((data, captured))
+    if session.frames_dropped != dropped:
+        pipeline_metrics.count('dropped')
+    if start_drain:
+        socketio.start_background_task(drain_frames, session, request.sid)
 
-def process_pushups(landmarks):
-    """Process pushups exercise"""
-    global workout_state
+@socketio.on('landmarks_frame')
+def handle_landmarks_frame(data):
+    """Analyse landmarks the client detected itself, no image involved"""
+    session = get_frame_session(data)
+    if session is None or not session.active:
+        return
+    
+    if not isinstance(data, dict) or 'landmarks' not in data:
+        emit('error', {'message': 'landmarks_frame requires landmarks'})
+        return
     
     try:
-        # Get coordinates
-        shoulder = [landmarks[mp_pose.PoseLandmark.LEFT_SHOULDER.value].x,
-                   landmarks[mp_pose.PoseLandmark.LEFT_SHOULDER.value].y]
-        elbow = [landmarks[mp_pose.PoseLandmark.LEFT_ELBOW.value].x,
-                landmarks[mp_pose.PoseLandmark.LEFT_ELBOW.value].y]
-        wrist = [landmarks[mp_pose.PoseLandmark.LEFT_WRIST.value].x,
-                landmarks[mp_pose.PoseLandmark.LEFT_WRIST.value].y]
-        hip = [landmarks[mp_pose.PoseLandmark.LEFT_HIP.value].x,
-              landmarks[mp_pose.PoseLandmark.LEFT_HIP.value].y]
-        
-        # Calculate angles
-        elbow_angle = calculate_angle(shoulder, elbow, wrist)
-        shoulder_angle = calculate_angle(elbow, shoulder, hip)
-        
-        # Check form
-        feedback = check_pushup_form(shoulder_angle, elbow_angle, workout_state['stage'])
-        
-        # Count reps
-        if elbow_angle > 160:
-            workout_state['stage'] = "up"
-        if elbow_angle < 90 and workout_state['stage'] == "up":
-            workout_state['stage'] = "down"
-            workout_state['counter'] += 1
-            
-            # Check if rep had good form
-            if not check_pushup_form(shoulder_angle, elbow_angle, "down"):
-                workout_state['good_reps'] += 1
-        
-        workout_state['feedback'] = feedback if feedback else ["Good form!"]
-        
-    except Exception as e:
-        print(f"Error processing pushups: {e}")
+        points = decode_landmarks(data['landmarks'])
+        timestamps = server_timestamps(data.get('timestamps'), len(points), time.time())
+        metrics, rep_list = analyze_landmarks(session, points, timestamps)
+    except ValueError as e:
+        emit('error', {'message': str(e)})
+        return
+    if shared_store is not None:
+        publish_session(session)
+    
+    payload = {'session_id': session.session_id, 'metrics': metrics, 'frames': session.frame_stats()}
+    if 'frame_id' in data:
+        payload['frame_id'] = data['frame_id']
+    if rep_list:
+        payload['rep_events'] = rep_list
+    stream_metrics(session, payload, request.sid)
+    emit('pose_analysis', payload)
+
+@socketio.on('connect')
+def handle_connect():
+    """Tell the client which frame size and transports the server expects"""
+    emit('server_config', {'input': input_format(), 'landmarks': landmarks_format(), 'metrics_rate': METRICS_RATE})
 
-def process_lunges(landmarks):
-    """Process lunges exercise"""
-    global workout_state
+@socketio.on('session_options')
+def handle_session_options(data=None):
+    """Change options of the sender's session while it is running"""
+    session = get_frame_session(data)
+    if session is None:
+        emit('error', {'message': 'No active session for this client'})
+        return
+    
+    if not isinstance(data, dict):
+        emit('error', {'message': 'session_options requires an options object'})
+        return
     
+    if 'annotate' in data:
+        session.annotate = bool(data['annotate'])
+    if 'profile' in data:
+        session.profile = bool(data['profile'])
+    if 'keyframes' in data and bool(data['keyframes']) != (session.tracker is not None):
+        session.tracker = LandmarkTracker() if data['keyframes'] else None
+    if 'roi' in data and bool(data['roi']) != (session.roi is not None):
+        session.roi = RegionOfInterest() if data['roi'] else None
+    if 'slo' in data and bool(data['slo']) != (session.slo is not None):
+        session.slo = LatencyController(level=global_slo.level) if data['slo'] else None
+    if 'motion_gate' in data and bool(data['motion_gate']) != (session.motion_gate is not None):
+        session.motion_gate = MotionGate() if data['motion_gate'] else None
+    emit('session_options', {
+        'session_id': session.session_id,
+        'annotate': session.annotate,
+        'profile': session.profile,
+        'keyframes': session.tracker is not None,
+        'roi': session.roi is not None,
+        'slo': session.slo is not None,
+        'motion_gate': session.motion_gate is not None
+    })
+
+@socketio.on('subscribe_metrics')
+def handle_subscribe_metrics(data):
+    """Stream the sender's session metrics as a snapshot followed by changes, at most ``rate`` per second"""
+    session = get_frame_session(data)
+    if session is None:
+        emit('error', {'message': 'No active session for this client'})
+        return
+    
+    options = data if isinstance(data, dict) else {}
     try:
-        # Get coordinates for right leg (front leg)
-        hip = [landmarks[mp_pose.PoseLandmark.RIGHT_HIP.value].x,
-              landmarks[mp_pose.PoseLandmark.RIGHT_HIP.value].y]
-        knee = [landmarks[mp_pose.PoseLandmark.RIGHT_KNEE.value].x,
-               landmarks[mp_pose.PoseLandmark.RIGHT_KNEE.value].y]
-        ankle = [landmarks[mp_pose.PoseLandmark.RIGHT_ANKLE.value].x,
-                landmarks[mp_pose.PoseLandmark.RIGHT_ANKLE.value].y]
-        
-        # Calculate angle
-        knee_angle = calculate_angle(hip, knee, ankle)
-        
-        # Count reps
-        if knee_angle > 160:
-            workout_state['stage'] = "up"
-        if knee_angle < 120 and workout_state['stage'] == "up":
-            workout_state['stage'] = "down"
-            workout_state['counter'] += 1
-            workout_state['good_reps'] += 1
-        
-        workout_state['feedback'] = ["Good form!"]
-        
+        rate = float(options.get('rate', METRICS_RATE))
+        live_rate = float(options.get('live_rate', METRICS_LIVE_RATE))
+        if not (rate >= 0 and live_rate >= 0):
+            raise ValueError
+    except (TypeError, ValueError):
+        emit('error', {'message': 'rate and live_rate must be non-negative numbers of updates per second'})
+        return
+    
+    stream = MetricsStream(request.sid, exercise_engine.messages(session.exercise), rate, live_rate)
+    with session.lock:
+        if session.people is None:
+            stream.set(session.metrics())
+        else:
+            for person in session.people.people:
+                stream.set(person.state.metrics(), person.person_id)
+    session.metrics_stream = stream
+    emit('metrics_snapshot', dict(stream.snapshot(), session_id=session.session_id))
+
+@socketio.on('unsubscribe_metrics')
+def handle_unsubscribe_metrics(data):
+    """Go back to metrics in every pose_analysis"""
+    session = get_frame_session(data)
+    if session is not None:
+        session.metrics_stream = None
+
+@socketio.on('disconnect')
+def handle_disconnect():
+    """Release the session's Pose instance and CPU slot when its client goes away"""
+    session = sessions.unbind_sid(request.sid)
+    if session is not None:
+        session.metrics_stream = None
+        pose_pool.release(session.session_id)
+        # A reconnecting client takes a slot again with its next video frame, if there is room
+        cpu_budget.release(session.session_id)
+
+def sweep_pose_pool():
+    """Periodically drop idle sessions and close their Pose instances"""
+    while True:
+        socketio.sleep(POSE_POOL_SWEEP_INTERVAL)
+        for session in sessions.evict_idle():
+            release_session(session.session_id, session)
+            if shared_store is not None:
+                frame_workers.run(shared_store.remove, session.session_id, WORKER_INDEX)
+                published_states.pop(session.session_id, None)
+        if shared_store is not None:
+            # Copies of sessions that moved to another worker
+            owners = frame_workers.run(shared_store.owners)
+            for session in sessions:
+                if owners.get(session.session_id) != WORKER_INDEX:
+                    close_session(session.session_id)
+        evicted = pose_pool.evict_idle()
+        if evicted:
+            print(f"Evicted {evicted} idle pose instance(s)")
+        for session in sessions:
+            # Bound what a crash can lose of a slow session's log
+            if session.log is not None:
+                session.log.flush()
+        if SESSION_LOG:
+            # Keep old logs from filling the disk
+            active_logs = {session.log.path for session in sessions if session.log is not None}
+            frame_workers.run(prune_logs, keep=active_logs)
+        if server_ready.is_set():
+            # Replace spares taken by new sessions
+            frame_workers.run(pose_pool.warm, POSE_WARM_POOL)
+
+def warm_up():
+    """Build and warm the spare Pose instances, then report the server ready"""
+    started = time.perf_counter()
+    try:
+        frame_workers.run(pose_pool.warm, POSE_WARM_POOL)
     except Exception as e:
-        print(f"Error processing lunges: {e}")
+        print(f"Error warming up pose models: {e}")
+    startup['warm_up'] = round(time.perf_counter() - started, 3)
+    startup['ready'] = round(time.perf_counter() - STARTED, 3)
+    server_ready.set()
+    print(f"Ready after {startup['ready']}s (imports {startup['imports']}s, "
+          f"warm-up of {POSE_WARM_POOL} pose model(s) {startup['warm_up']}s)")
 
-def process_plank(landmarks):
-    """Process plank exercise (time-based)"""
-    global workout_state
+@app.route('/analyze_video', methods=['POST'])
+def analyze_uploaded_video():
+    """Score an uploaded workout video"""
+    from analyze_video import analyze_video, rep_events, save_csv, save_npz
     
-    try:
-        # For plank, we track time held rather than reps
-        if workout_state['start_time'] is None:
-            workout_state['start_time'] = time.time()
-        
-        # Calculate hold time
-        hold_time = time.time() - workout_state['start_time']
-        workout_state['counter'] = int(hold_time)
+    upload = request.files.get('video')
+    exercise = request.form.get('exercise') or request.args.get('exercise')
+    output_format = request.args.get('format', 'json')
+    
+    if upload is None:
+        return jsonify({'error': 'Upload the video as multipart field "video"'}), 400
+    if exercise not in exercise_engine:
+        return jsonify({'error': f'Unknown exercise: {exercise}'}), 400
+    if output_format not in ('json', 'npz', 'csv'):
+        return jsonify({'error': f'Unknown format: {output_format}'}), 400
+    
+    # A video holds an inference slot for as long as a live session would
+    slot = f'analyze_video/{os.urandom(8).hex()}'
+    if not cpu_budget.has_room():
+        return jsonify({
+            'error': 'Server at capacity, no CPU left to analyse a video. Retry later.',
+            'capacity': cpu_budget.stats()
+        }), 503
+    cpu_budget.admit(slot)
+    
+    suffix = os.path.splitext(upload.filename or '')[1] or '.mp4'
+    with tempfile.TemporaryDirectory() as workdir:
+        video_path = os.path.join(workdir, 'upload' + suffix)
+        upload.save(video_path)
         
-        # Simple form check - body should be straight
-        shoulder = landmarks[mp_pose.PoseLandmark.LEFT_SHOULDER.value]
-        hip = landmarks[mp_pose.PoseLandmark.LEFT_HIP.value]
-        knee = landmarks[mp_pose.PoseLandmark.LEFT_KNEE.value]
+        # Decoding and inference run on a worker thread, off the event loop
+        try:
+            result = frame_workers.run(analyze_video, video_path, exercise, exercise_engine)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        finally:
+            cpu_budget.release(slot)
         
-        shoulder_hip_knee_angle = calculate_angle(
-            [shoulder.x, shoulder.y],
-            [hip.x, hip.y], 
-            [knee.x, knee.y]
-        )
+        summary = result['summary']
+        summary['video'] = upload.filename
+        if output_format == 'json':
+            return jsonify({'summary': summary, 'rep_events': rep_events(result)})
         
-        if shoulder_hip_knee_angle > 160:
-            workout_state['feedback'] = ["Good form! Keep holding!"]
-            workout_state['good_reps'] += 1 if int(hold_time) > workout_state['good_reps'] else 0
+        output_path = os.path.join(workdir, 'analysis.' + output_format)
+        if output_format == 'csv':
+            save_csv(result, output_path)
         else:
-            workout_state['feedback'] = ["Keep your body straight!"]
-        
-        workout_state['stage'] = f"Hold: {int(hold_time)}s"
-        
-    except Exception as e:
-        print(f"Error processing plank: {e}")
-
-@app.route('/start_workout', methods=['POST'])
-def start_workout():
-    """Start a workout session"""
-    global workout_state
-    
-    data = request.get_json()
-    exercise = data.get('exercise') if data else None
-    
-    # Reset workout state
-    workout_state = {
-        'active': True,
-        'exercise': exercise,
-        'counter': 0,
-        'stage': 'down' if exercise != 'plank' else 'ready',
-        'good_reps': 0,
-        'feedback': [],
-        'start_time': time.time() if exercise == 'plank' else None
-    }
+            save_npz(result, output_path)
+        with open(output_path, 'rb') as f:
+            data = f.read()
     
-    return jsonify({'status': 'started', 'exercise': exercise})
+    return send_file(io.BytesIO(data), download_name='analysis.' + output_format, as_attachment=True)
 
-@app.route('/end_workout', methods=['POST'])
-def end_workout():
-    """End workout session"""
-    global workout_state
+@app.route('/analyze_landmarks', methods=['POST'])
+def analyze_landmarks_endpoint():
+    """Score a batch of client landmark frames, for a session or on their own"""
+    data = request.get_json(silent=True) or {}
+    session_id = data.get('session_id')
+    exercise = data.get('exercise')
     
-    duration = time.time() - (workout_state['start_time'] or time.time())
+    if 'landmarks' not in data:
+        return jsonify({'error': 'landmarks are required'}), 400
+    if session_id:
+        forwarded = route_to_owner(session_id)
+        if forwarded is not None:
+            return forwarded
+        session = sessions.get(session_id)
+        if session is None:
+            return jsonify({'error': f'Unknown session: {session_id}'}), 404
+    elif exercise in exercise_engine:
+        # One-off scoring, hold timers run on the batch's own timestamps
+        session = WorkoutSession('batch', exercise, stage=exercise_engine.initial_stage(exercise))
+        session.analytics = exercise_engine.rep_analytics(exercise)
+    else:
+        return jsonify({'error': 'Pass a session_id or a known exercise'}), 400
     
-    summary = {
-        'reps': workout_state['counter'],
-        'good_reps': workout_state['good_reps'],
-        'duration': duration,
-        'exercise': workout_state['exercise']
-    }
+    try:
+        points = decode_landmarks(data['landmarks'])
+        timestamps = server_timestamps(data.get('timestamps'), len(points), time.time())
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     
-    workout_state['active'] = False
+    metrics, rep_list = analyze_landmarks(session, points, timestamps)
+    if session_id and shared_store is not None:
+        publish_session(session)
+    result = {
+        'session_id': session_id,
+        'exercise': session.exercise,
+        'frames': len(points),
+        'metrics': metrics,
+        'rep_events': rep_list
+    }
+    if not session_id and session.analytics is not None:
+        result['rep_breakdown'] = session.analytics.breakdown()
+    return jsonify(result)
+
+def history_unavailable(error=None):
+    """Error response of a history endpoint, the store is disabled without ``error``"""
+    if error is None:
+        return jsonify({'error': 'Workout history is disabled'}), 503
+    print(f"Error querying workout history: {error}")
+    return jsonify({'error': 'Workout history query failed'}), 500
+
+@app.route('/history', methods=['GET'])
+def workout_history_endpoint():
+    """Stored workouts, filtered by user, exercise and end time"""
+    if workout_history is None:
+        return history_unavailable()
+    try:
+        since = float(request.args['since']) if 'since' in request.args else None
+        until = float(request.args['until']) if 'until' in request.args else None
+        limit = int(request.args.get('limit', '50'))
+    except ValueError:
+        return jsonify({'error': 'since, until and limit must be numbers'}), 400
+    order = request.args.get('order', 'recent')
+    if order not in ('recent', 'reps'):
+        return jsonify({'error': f'Unknown order: {order}'}), 400
     
-    return jsonify({'status': 'ended', 'summary': summary})
+    # Queries run on a worker thread, off the event loop
+    query = functools.partial(workout_history.workouts, user_id=request.args.get('user_id'),
+                              exercise=request.args.get('exercise'), since=since, until=until,
+                              order=order, limit=limit)
+    try:
+        return jsonify({'workouts': frame_workers.run(query)})
+    except sqlite3.Error as e:
+        return history_unavailable(e)
 
-@socketio.on('video_frame')
-def handle_video_frame(data):
-    """Process video frame and return pose analysis"""
-    global workout_state
+@app.route('/history/<user_id>/bests', methods=['GET'])
+def personal_bests(user_id):
+    """A user's personal bests and totals per exercise"""
+    if workout_history is None:
+        return history_unavailable()
+    try:
+        return jsonify({'user_id': user_id, 'bests': frame_workers.run(workout_history.bests, user_id)})
+    except sqlite3.Error as e:
+        return history_unavailable(e)
+
+@app.route('/history/<user_id>/weekly', methods=['GET'])
+def weekly_totals(user_id):
+    """A user's weekly reps and good-rep ratio, for form trends"""
+    if workout_history is None:
+        return history_unavailable()
+    try:
+        weeks = int(request.args.get('weeks', '12'))
+    except ValueError:
+        return jsonify({'error': 'weeks must be a number'}), 400
     
-    if not workout_state['active']:
-        return
+    try:
+        totals = frame_workers.run(workout_history.weekly, user_id, request.args.get('exercise'), weeks)
+    except sqlite3.Error as e:
+        return history_unavailable(e)
+    return jsonify({'user_id': user_id, 'weeks': totals})
+
+@app.route('/leaderboard', methods=['GET'])
+def leaderboard():
+    """Users with the most reps of an exercise in a week, the current one by default"""
+    if workout_history is None:
+        return history_unavailable()
+    exercise = request.args.get('exercise')
+    if exercise not in exercise_engine:
+        return jsonify({'error': f'Unknown exercise: {exercise}'}), 400
+    try:
+        limit = int(request.args.get('limit', '10'))
+    except ValueError:
+        return jsonify({'error': 'limit must be a number'}), 400
+    week = request.args.get('week') or week_start(time.time())
     
     try:
-        # Decode base64 image
-        image_data = base64.b64decode(data['image'].split(',')[1])
-        nparr = np.frombuffer(image_data, np.uint8)
-        frame = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
-        
-        # Convert BGR to RGB
-        rgb_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-        
-        # Process with MediaPipe
-        with mp_pose.Pose(min_detection_confidence=0.5, min_tracking_confidence=0.5) as pose:
-            results = pose.process(rgb_frame)
-            
-            if results.pose_landmarks:
-                landmarks = results.pose_landmarks.landmark
-                
-                # Process based on exercise type
-                if workout_state['exercise'] == 'bicep_curl':
-                    process_bicep_curl(landmarks)
-                elif workout_state['exercise'] == 'squats':
-                    process_squats(landmarks)
-                elif workout_state['exercise'] == 'pushups':
-                    process_pushups(landmarks)
-                elif workout_state['exercise'] == 'lunges':
-                    process_lunges(landmarks)
-                elif workout_state['exercise'] == 'plank':
-                    process_plank(landmarks)
-                # Add more exercises as needed
-                
-                # Draw pose landmarks
-                annotated_frame = cv2.cvtColor(rgb_frame, cv2.COLOR_RGB2BGR)
-                mp_drawing.draw_landmarks(
-                    annotated_frame, 
-                    results.pose_landmarks, 
-                    mp_pose.POSE_CONNECTIONS
-                )
-                
-                # Add feedback text
-                y_offset = 30
-                for feedback in workout_state['feedback']:
-                    color = (0, 255, 0) if feedback == "Good form!" else (0, 0, 255)
-                    cv2.putText(annotated_frame, feedback, (10, y_offset), 
-                               cv2.FONT_HERSHEY_SIMPLEX, 0.7, color, 2, cv2.LINE_AA)
-                    y_offset += 30
-                
-                # Encode frame back to base64
-                _, buffer = cv2.imencode('.jpg', annotated_frame)
-                encoded_frame = base64.b64encode(buffer.tobytes()).decode('utf-8')
-                
-                # Send updated data back to client
-                emit('pose_analysis', {
-                    'processed_frame': f'data:image/jpeg;base64,{encoded_frame}',
-                    'metrics': {
-                        'reps': workout_state['counter'],
-                        'stage': workout_state['stage'],
-                        'good_reps': workout_state['good_reps'],
-                        'feedback': workout_state['feedback']
-                    }
-                })
-                
-    except Exception as e:
-        print(f"Error processing frame: {e}")
-        emit('error', {'message': str(e)})
+        leaders = frame_workers.run(workout_history.leaderboard, exercise, week, limit)
+    except sqlite3.Error as e:
+        return history_unavailable(e)
+    return jsonify({'exercise': exercise, 'week': week, 'leaders': leaders})
+
+@app.route('/exercises', methods=['GET'])
+def list_exercises():
+    """Exercises the server can count"""
+    return jsonify({'exercises': sorted(exercise_engine.exercises)})
+
+@app.route('/metrics', methods=['GET'])
+def metrics_endpoint():
+    """Stage latencies and frame counters in Prometheus text format"""
+    if request.args.get('format') == 'json':
+        return jsonify(pipeline_metrics.summary())
+    
+    body = pipeline_metrics.prometheus({
+        'pose_active_sessions': ('Workout sessions currently registered.', len(sessions)),
+        'pose_pooled_models': ('Warm Pose instances in the pool.', len(pose_pool)),
+        'pose_inference_slots': ('Sessions holding a slot of the CPU budget.', len(cpu_budget)),
+        'pose_inference_capacity': ('Inference sessions the CPU budget admits.', cpu_budget.capacity),
+        'pose_spare_models': ('Warmed Pose instances waiting for a new session.', pose_pool.spares),
+        'pose_quality_level': ('Quality level new sessions start at, 0 is best.', global_slo.level),
+        'pose_degraded_sessions': ('Sessions running below the best quality level.',
+                                   sum(1 for s in sessions if s.slo is not None and s.slo.level > 0)),
+    })
+    return body, 200, {'Content-Type': 'text/plain; version=0.0.4; charset=utf-8'}
 
 @app.route('/health', methods=['GET'])
 def health_check():
     """Health check endpoint"""
     return jsonify({'status': 'healthy', 'service': 'pose_estimation'})
 
+@app.route('/ready', methods=['GET'])
+def readiness_check():
+    """Readiness probe, 503 until the pose models are warmed up"""
+    if not server_ready.is_set():
+        return jsonify({'status': 'warming_up', 'startup': startup}), 503
+    return jsonify({'status': 'ready', 'startup': startup, 'spare_models': pose_pool.spares})
+
+def serve_worker():
+    """Serve as one of the worker processes of start_pose_server.py"""
+    import eventlet
+    import eventlet.wsgi
+    
+    # Every worker listens on the public port and the kernel spreads connections between them
+    listener = eventlet.listen(('0.0.0.0', POSE_SERVER_PORT), reuse_port=True)
+    
+    # Other workers forward REST calls for this worker's sessions here
+    socketio.start_background_task(eventlet.wsgi.server, eventlet.listen(worker_address(WORKER_INDEX)), app,
+                                   log_output=False)
+    print(f"Pose worker {WORKER_INDEX} (pid {os.getpid()}) serving on port {POSE_SERVER_PORT}...")
+    eventlet.wsgi.server(listener, app, log_output=True)
+
 if __name__ == '__main__':
-    print("Starting Pose Estimation Server on port 3001...")
-    socketio.run(app, host='0.0.0.0', port=3001, debug=False, allow_unsafe_werkzeug=True, use_reloader=False, log_output=True)
\ No newline at end of file
+    socketio.start_background_task(warm_up)
+    socketio.start_background_task(sweep_pose_pool)
+    if WORKER_INDEX is not None:
+        serve_worker()
+    else:
+        print(f"Starting Pose Estimation Server on port {POSE_SERVER_PORT}...")
+        socketio.run(app, host='0.0.0.0', port=POSE_SERVER_PORT, debug=False, allow_unsafe_werkzeug=True, use_reloader=False, log_output=True)
\ No newline at end of file
@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+
+import bisect
+import threading
+
+# Histogram bucket upper bounds in seconds, shared by every stage
+LATENCY_BUCKETS = (
+    0.0005, 0.001, 0.002, 0.005, 0.01, 0.015, 0.02, 0.03, 0.05,
+    0.075, 0.1, 0.15, 0.25, 0.5, 1.0, 2.5,
+)
+
+# Stages of handle_video_frame in pipeline order, then capture-to-emit latency
+FRAME_STAGES = (
+    'base64_decode', 'motion_gate', 'jpeg_decode', 'color_convert', 'inference', 'tracking',
+    'analysis', 'annotate', 'jpeg_encode', 'emit', 'total', 'end_to_end',
+)
+
+FRAME_COUNTERS = ('received', 'throttled', 'processed', 'dropped', 'expired', 'no_pose', 'motion_skipped', 'tracked', 'client_landmarks', 'metrics_updates', 'errors')
+
+
+class LatencyHistogram:
+    """Fixed-bucket latency histogram with cheap percentile estimates"""
+
+    __slots__ = ('counts', 'total', 'count', 'lock')
+
+    def __init__(self):
+        self.counts = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.total = 0.0
+        self.count = 0
+        self.lock = threading.Lock()
+
+    def observe(self, seconds):
+        """Record one observation"""
+        index = bisect.bisect_left(LATENCY_BUCKETS, seconds)
+        with self.lock:
+            self.counts[index] += 1
+            self.total += seconds
+            self.count += 1
+
+    def snapshot(self):
+        """Consistent copy of (counts, total, count)"""
+        with self.lock:
+            return list(self.counts), self.total, self.count
+
+    @staticmethod
+    def quantile(counts, count, q):
+        """Estimate a quantile by interpolating inside its bucket"""
+        if count == 0:
+            return 0.0
+
+        rank = q * count
+        seen = 0
+        for i, bucket_count in enumerate(counts):
+            if seen + bucket_count >= rank and bucket_count:
+                lower = LATENCY_BUCKETS[i - 1] if i > 0 else 0.0
+                # Observations past the last bound are reported at that bound
+                upper = LATENCY_BUCKETS[i] if i < len(LATENCY_BUCKETS) else LATENCY_BUCKETS[-1]
+                return lower + (upper - lower) * (rank - seen) / bucket_count
+            seen += bucket_count
+        return LATENCY_BUCKETS[-1]
+
+
+class PipelineMetrics:
+    """Per-stage latency histograms and frame counters of the pose server"""
+
+    def __init__(self):
+        self.stages = {stage: LatencyHistogram() for stage in FRAME_STAGES}
+        self.counters = dict.fromkeys(FRAME_COUNTERS, 0)
+        self._counter_lock = threading.Lock()
+
+    def observe(self, timings):
+        """Record the stage timings (seconds) of one frame"""
+        for stage, seconds in timings.items():
+            self.stages[stage].observe(seconds)
+
+    def count(self, counter, amount=1):
+        """Increment a frame counter"""
+        with self._counter_lock:
+            self.counters[counter] += amount
+
+    def summary(self):
+        """p50, p95 and p99 per stage in milliseconds, plus the counters"""
+        stages = {}
+        for stage, histogram in self.stages.items():
+            counts, total, count = histogram.snapshot()
+            stages[stage] = {
+                'count': count,
+                'mean_ms': 1000.0 * total / count if count else 0.0,
+                'p50_ms': 1000.0 * histogram.quantile(counts, count, 0.50),
+                'p95_ms': 1000.0 * histogram.quantile(counts, count, 0.95),
+                'p99_ms': 1000.0 * histogram.quantile(counts, count, 0.99),
+            }
+        return {'stages': stages, 'frames': dict(self.counters)}
+
+    def prometheus(self, gauges=None):
+        """Render everything in the Prometheus text exposition format"""
+        lines = [
+            '# HELP pose_stage_latency_seconds Latency of each frame processing stage.',
+            '# TYPE pose_stage_latency_seconds histogram',
+        ]
+        quantile_lines = [
+            '# HELP pose_stage_latency_quantile_seconds Estimated latency percentiles per stage.',
+            '# TYPE pose_stage_latency_quantile_seconds gauge',
+        ]
+
+        for stage, histogram in self.stages.items():
+            counts, total, count = histogram.snapshot()
+            cumulative = 0
+            for bound, bucket_count in zip(LATENCY_BUCKETS, counts):
+                cumulative += bucket_count
+                lines.append(f'pose_stage_latency_seconds_bucket{{stage="{stage}",le="{bound}"}} {cumulative}')
+            lines.append(f'pose_stage_latency_seconds_bucket{{stage="{stage}",le="+Inf"}} {count}')
+            lines.append(f'pose_stage_latency_seconds_sum{{stage="{stage}"}} {total:.6f}')
+            lines.append(f'pose_stage_latency_seconds_count{{stage="{stage}"}} {count}')
+
+            for q in (0.5, 0.95, 0.99):
+                value = histogram.quantile(counts, count, q)
+                quantile_lines.append(
+                    f'pose_stage_latency_quantile_seconds{{stage="{stage}",quantile="{q}"}} {value:.6f}'
+                )
+
+        lines.extend(quantile_lines)
+
+        lines.append('# HELP pose_frames_total Frames by outcome.')
+        lines.append('# TYPE pose_frames_total counter')
+        for counter, value in self.counters.items():
+            lines.append(f'pose_frames_total{{outcome="{counter}"}} {value}')
+
+        for name, (help_text, value) in (gauges or {}).items():
+            lines.append(f'# HELP {name} {help_text}')
+            lines.append(f'# TYPE {name} gauge')
+            lines.append(f'{name} {value}')
+
+        return '\n'.join(lines) + '\n'
@@ -0,0 +1,270 @@
+#!/usr/bin/env python3
+
+import importlib.util
+import os
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+import numpy as np
+
+from cpu_budget import INFERENCE_THREADS, CpuBudget
+
+# Pool limits (overridable from the environment), 0 sessions sizes the pool from the CPU budget
+POSE_POOL_MAX_SESSIONS = int(os.environ.get('POSE_POOL_MAX_SESSIONS', '0'))
+POSE_POOL_IDLE_TIMEOUT = float(os.environ.get('POSE_POOL_IDLE_TIMEOUT', '120'))
+
+# Pose instances kept built and warmed ahead of new sessions
+POSE_WARM_POOL = int(os.environ.get('POSE_WARM_POOL', '2'))
+
+# Blank frame pushed through new instances so the graph and models are initialized before a session needs them
+WARM_UP_FRAME_SHAPE = (480, 640, 3)
+
+# Model files MediaPipe looks up for each model_complexity
+POSE_MODELS = {0: 'pose_landmark_lite.tflite', 1: 'pose_landmark_full.tflite', 2: 'pose_landmark_heavy.tflite'}
+
+# Model bundle of the multi-person PoseLandmarker, it is not shipped with the mediapipe package
+POSE_LANDMARKER_MODEL = os.environ.get(
+    'POSE_LANDMARKER_MODEL',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'models', 'pose_landmarker_full.task')
+)
+
+
+def _mediapipe_dir():
+    # Found without importing mediapipe, which is most of the server's import time
+    return os.path.dirname(importlib.util.find_spec('mediapipe').origin)
+
+
+def model_available(complexity):
+    """Whether a pose model is on disk, MediaPipe would otherwise download it"""
+    path = os.path.join(_mediapipe_dir(), 'modules', 'pose_landmark', POSE_MODELS[complexity])
+    return os.path.exists(path)
+
+
+def landmarker_available():
+    """Whether the multi-person PoseLandmarker model is on disk"""
+    return os.path.exists(POSE_LANDMARKER_MODEL)
+
+
+def create_landmarker(num_poses, min_confidence=0.5):
+    """PoseLandmarker in video mode detecting up to ``num_poses`` people per frame"""
+    import mediapipe as mp
+
+    vision = mp.tasks.vision
+    options = vision.PoseLandmarkerOptions(
+        base_options=mp.tasks.BaseOptions(model_asset_path=POSE_LANDMARKER_MODEL),
+        running_mode=vision.RunningMode.VIDEO,
+        num_poses=num_poses,
+        min_pose_detection_confidence=min_confidence,
+        min_pose_presence_confidence=min_confidence,
+        min_tracking_confidence=min_confidence
+    )
+    return vision.PoseLandmarker.create_from_options(options)
+
+
+class _PoseEntry:
+    """A pooled Pose instance and its bookkeeping"""
+
+    __slots__ = ('pose', 'model', 'last_used', 'leases', 'retired')
+
+    def __init__(self, pose, model, last_used):
+        self.pose = pose
+        self.model = model
+        self.last_used = last_used
+        self.leases = 0
+        self.retired = False
+
+
+class PosePool:
+    """Warm MediaPipe Pose instances, one bound to each active session.
+
+    Instances are created in video (tracking) mode so that consecutive frames
+    of a session reuse the previous landmarks instead of re-running the person
+    detector. Sessions idle for longer than ``idle_timeout`` seconds are closed,
+    and the least recently used session is evicted when ``max_sessions`` is hit.
+    By default that is the number of inference slots in the CPU budget, so
+    admitted sessions never push each other out.
+    An instance that is evicted or released while leased to a worker is only
+    closed once the lease ends. Asking for a session's instance with another
+    ``model_complexity`` replaces it. Sessions passing ``num_poses`` get a
+    multi-person PoseLandmarker instead of a Pose instance. Pose instances run
+    on ``num_threads`` threads each.
+
+    ``warm`` builds spare Pose instances ahead of time and runs a blank frame
+    through each, so a new session takes over an initialized graph instead
+    of paying for construction and the first inference itself.
+    """
+
+    def __init__(self, max_sessions=None,
+                 idle_timeout=POSE_POOL_IDLE_TIMEOUT, num_threads=INFERENCE_THREADS, **pose_options):
+        self.max_sessions = max_sessions or POSE_POOL_MAX_SESSIONS or CpuBudget().capacity
+        self.idle_timeout = idle_timeout
+        self.num_threads = num_threads
+        self.pose_options = {
+            'static_image_mode': False,
+            'min_detection_confidence': 0.5,
+            'min_tracking_confidence': 0.5,
+        }
+        self.pose_options.update(pose_options)
+        self._entries = OrderedDict()  # session_id -> _PoseEntry, LRU first
+        self._spares = {}  # model_complexity -> warmed Pose instances
+        self._lock = threading.Lock()
+
+    def acquire(self, session_id, model_complexity=None, num_poses=None):
+        """Return the session's Pose instance, creating it if needed"""
+        return self._checkout(session_id, lease=False, model=self._model(model_complexity, num_poses)).pose
+
+    @contextmanager
+    def lease(self, session_id, model_complexity=None, num_poses=None):
+        """Use the session's Pose instance without it being closed underneath"""
+        entry = self._checkout(session_id, lease=True, model=self._model(model_complexity, num_poses))
+        try:
+            yield entry.pose
+        finally:
+            with self._lock:
+                entry.leases -= 1
+                close = entry.retired and entry.leases == 0
+            if close:
+                self._close([entry.pose])
+
+    def warm(self, count=POSE_WARM_POOL, model_complexity=None):
+        """Build and warm spare Pose instances until ``count`` are ready, returns how many were built"""
+        model = self._model(model_complexity, None)
+        built = 0
+        while True:
+            with self._lock:
+                if len(self._spares.get(model, ())) >= count:
+                    return built
+            pose = self._create(model)
+            pose.process(np.zeros(WARM_UP_FRAME_SHAPE, dtype=np.uint8))
+            with self._lock:
+                self._spares.setdefault(model, []).append(pose)
+            built += 1
+
+    @property
+    def spares(self):
+        """Warm Pose instances waiting for a session"""
+        return sum(len(poses) for poses in self._spares.values())
+
+    def release(self, session_id):
+        """Close the Pose instance bound to a session"""
+        with self._lock:
+            entry = self._entries.pop(session_id, None)
+            stale = self._retire([entry] if entry is not None else [])
+
+        self._close(stale)
+
+    def evict_idle(self):
+        """Close every session that has been idle past the timeout"""
+        with self._lock:
+            evicted = self._pop_idle(time.monotonic())
+            stale = self._retire(evicted)
+
+        self._close(stale)
+        return len(evicted)
+
+    def close_all(self):
+        """Close every pooled instance"""
+        with self._lock:
+            stale = self._retire(list(self._entries.values()))
+            self._entries.clear()
+            stale.extend(pose for poses in self._spares.values() for pose in poses)
+            self._spares.clear()
+
+        self._close(stale)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, session_id):
+        return session_id in self._entries
+
+    def _model(self, complexity, num_poses):
+        # Pose instances are keyed by model_complexity, landmarkers by their pose count
+        if num_poses:
+            return ('landmarker', num_poses)
+        if complexity is None:
+            return self.pose_options.get('model_complexity', 1)
+        return complexity
+
+    def _create(self, model):
+        if isinstance(model, tuple):
+            return create_landmarker(model[1], self.pose_options['min_detection_confidence'])
+        from threaded_pose import ThreadedPose
+        return ThreadedPose(self.num_threads, **dict(self.pose_options, model_complexity=model))
+
+    def _checkout(self, session_id, lease, model):
+        now = time.monotonic()
+        evicted = []
+
+        with self._lock:
+            entry = self._entries.get(session_id)
+            if entry is not None and entry.model == model:
+                entry.last_used = now
+                entry.leases += lease
+                self._entries.move_to_end(session_id)
+                return entry
+            if entry is not None:
+                # The session switched models, the old graph goes once unleased
+                evicted.append(self._entries.pop(session_id))
+
+            evicted.extend(self._pop_idle(now))
+            while len(self._entries) >= self.max_sessions:
+                evicted.append(self._entries.popitem(last=False)[1])
+            stale = self._retire(evicted)
+            spares = self._spares.get(model)
+            spare = spares.pop() if spares else None
+
+        self._close(stale)
+
+        # Build the graph outside the lock, it takes a while
+        entry = _PoseEntry(spare or self._create(model), model, now)
+        entry.leases += lease
+
+        with self._lock:
+            existing = self._entries.get(session_id)
+            if existing is None or existing.model != model:
+                self._entries[session_id] = entry
+                self._entries.move_to_end(session_id)
+                stale = self._retire([existing] if existing is not None else [])
+            else:
+                # Another caller created one for this session meanwhile
+                existing.leases += lease
+                existing.last_used = now
+                stale = None
+
+        if stale is not None:
+            self._close(stale)
+            return entry
+        self._close([entry.pose])
+        return existing
+
+    def _pop_idle(self, now):
+        # Entries are kept in LRU order, so idle ones sit at the front
+        evicted = []
+        while self._entries:
+            session_id, entry = next(iter(self._entries.items()))
+            if now - entry.last_used < self.idle_timeout:
+                break
+            del self._entries[session_id]
+            evicted.append(entry)
+        return evicted
+
+    @staticmethod
+    def _retire(entries):
+        # Leased instances are closed by whoever returns the last lease
+        stale = []
+        for entry in entries:
+            entry.retired = True
+            if entry.leases == 0:
+                stale.append(entry.pose)
+        return stale
+
+    @staticmethod
+    def _close(poses):
+        for pose in poses:
+            try:
+                pose.close()
+            except Exception as e:
+                print(f"Error closing pose instance: {e}")
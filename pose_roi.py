@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+
+import os
+
+import cv2
+
+# Fraction of the landmark box added on every side of the crop window
+ROI_PADDING = float(os.environ.get('ROI_PADDING', '0.8'))
+
+# The window only moves once the pose comes this close (fraction of the window) to its edge
+ROI_MARGIN = float(os.environ.get('ROI_MARGIN', '0.05'))
+
+# Pixels kept across the trainee when downscaling, the landmark model runs at 256x256
+POSE_INPUT_SIZE = int(os.environ.get('POSE_INPUT_SIZE', '256'))
+
+# Landmarks at or above this visibility define the box
+VISIBILITY_THRESHOLD = 0.5
+
+# Fewer visible landmarks than this, or a window covering more of the frame, means no crop
+ROI_MIN_LANDMARKS = 8
+ROI_MAX_COVERAGE = 0.8
+
+FULL_WINDOW = (0.0, 0.0, 1.0, 1.0)
+
+
+class RegionOfInterest:
+    """Crop window and downscale factor that follow the trainee.
+
+    The window is the landmark bounding box of an earlier frame, padded and
+    kept in normalized frame coordinates. Frames are cropped to it and shrunk
+    by an integer factor that still leaves POSE_INPUT_SIZE pixels across the
+    trainee, both before colour conversion, so conversion and the copy into
+    the MediaPipe graph only touch the pixels inference needs.
+
+    MediaPipe tracks its own region from the previous frame's landmarks in
+    input coordinates, so the window is sticky: it only moves when the pose
+    nears its edge or has shrunk well inside it. Without a tracked pose the
+    full frame is used at full resolution.
+    """
+
+    __slots__ = ('box', 'factor', 'shape')
+
+    def __init__(self):
+        self.box = None
+        self.factor = 1
+        self.shape = None
+
+    def reset(self):
+        """Forget the window, the next frame is processed in full"""
+        self.box = None
+        self.factor = 1
+
+    def update(self, points):
+        """Follow the trainee to a frame's full-frame landmarks"""
+        visible = points[points[:, 3] >= VISIBILITY_THRESHOLD, :2]
+        if len(visible) < ROI_MIN_LANDMARKS or self.shape is None:
+            self.reset()
+            return
+
+        (x0, y0), (x1, y1) = visible.min(axis=0), visible.max(axis=0)
+        height, width = self.shape[:2]
+        self.factor = max(1, int(max((x1 - x0) * width, (y1 - y0) * height) // POSE_INPUT_SIZE))
+
+        pad_x, pad_y = ROI_PADDING * (x1 - x0), ROI_PADDING * (y1 - y0)
+        if self.box is not None:
+            left, top, right, bottom = self.box
+            margin_x, margin_y = ROI_MARGIN * (right - left), ROI_MARGIN * (bottom - top)
+            inside = (x0 >= left + margin_x and y0 >= top + margin_y
+                      and x1 <= right - margin_x and y1 <= bottom - margin_y)
+            oversized = (right - left) * (bottom - top) > 4 * (x1 - x0 + 2 * pad_x) * (y1 - y0 + 2 * pad_y)
+            if inside and not oversized:
+                return
+
+        box = (max(0.0, x0 - pad_x), max(0.0, y0 - pad_y), min(1.0, x1 + pad_x), min(1.0, y1 + pad_y))
+        if (box[2] - box[0]) * (box[3] - box[1]) > ROI_MAX_COVERAGE:
+            self.box = None
+        else:
+            self.box = tuple(float(v) for v in box)
+
+    def prepare(self, frame, code=cv2.COLOR_BGR2RGB):
+        """Crop, shrink and colour-convert a frame for inference.
+
+        Returns the model input and the window it covers as normalized
+        (x0, y0, x1, y1) frame coordinates. ``code=None`` skips conversion.
+        """
+        self.shape = frame.shape
+        height, width = frame.shape[:2]
+        if self.box is None:
+            left, top, right, bottom = 0, 0, width, height
+        else:
+            left, top = int(self.box[0] * width), int(self.box[1] * height)
+            right, bottom = int(self.box[2] * width + 0.5), int(self.box[3] * height + 0.5)
+
+        # Whole multiples of the factor keep cv2.resize on its fast INTER_AREA path
+        factor = self.factor
+        right -= (right - left) % factor
+        bottom -= (bottom - top) % factor
+        image = frame[top:bottom, left:right]
+        if factor > 1:
+            image = cv2.resize(image, ((right - left) // factor, (bottom - top) // factor),
+                               interpolation=cv2.INTER_AREA)
+        if code is not None:
+            image = cv2.cvtColor(image, code)
+        return image, (left / width, top / height, right / width, bottom / height)
+
+    def locate(self, frame, process, code=cv2.COLOR_BGR2RGB):
+        """Full-frame landmarks of the trainee, searching the window first.
+
+        ``process`` runs the model on an image and returns landmarks
+        normalized to it, or None. When the crop loses the trainee the full
+        frame is searched before giving up.
+        """
+        image, window = self.prepare(frame, code)
+        points = process(image)
+        if points is None and window != FULL_WINDOW:
+            self.reset()
+            image, window = self.prepare(frame, code)
+            points = process(image)
+
+        if points is None:
+            self.reset()
+            return None
+        return self.to_frame(points, window)
+
+    @staticmethod
+    def to_frame(points, window):
+        """Map landmarks normalized to a window back to the full frame"""
+        if window == FULL_WINDOW:
+            return points
+        x0, y0, x1, y1 = window
+        mapped = points.copy()
+        mapped[:, 0] = x0 + points[:, 0] * (x1 - x0)
+        mapped[:, 1] = y0 + points[:, 1] * (y1 - y0)
+        # MediaPipe scales depth like x
+        mapped[:, 2] = points[:, 2] * (x1 - x0)
+        return mapped
@@ -0,0 +1,175 @@
+#!/usr/bin/env python3
+
+import collections
+import os
+
+import numpy as np
+
+# Frames back the angular velocity is measured over
+VELOCITY_FRAMES = 5
+
+# Frames of timestamped joint angles kept per session, just enough for the velocity
+ANGLE_HISTORY_SIZE = VELOCITY_FRAMES + 1
+
+# Completed reps kept for the per-rep breakdown, older ones only count towards the averages
+REP_HISTORY_SIZE = int(os.environ.get('REP_HISTORY_SIZE', '500'))
+
+# Movement phases of the counter joint
+_REST, _LEAVING, _ACTIVE, _RETURNING = range(4)
+
+
+class AngleHistory:
+    """Fixed-size ring buffer of timestamped joint angles"""
+
+    __slots__ = ('times', 'angles', 'index', 'count')
+
+    def __init__(self, num_joints, size=ANGLE_HISTORY_SIZE):
+        self.times = np.zeros(size, dtype=np.float64)
+        self.angles = np.zeros((size, num_joints), dtype=np.float32)
+        self.index = 0
+        self.count = 0
+
+    def push(self, timestamp, angles):
+        """Append one frame, overwriting the oldest once the buffer is full"""
+        self.times[self.index] = timestamp
+        self.angles[self.index] = angles
+        self.index = (self.index + 1) % len(self.times)
+        self.count = min(self.count + 1, len(self.times))
+
+    def latest(self, back=0):
+        """(timestamp, angles) of the frame ``back`` frames before the newest"""
+        i = (self.index - 1 - back) % len(self.times)
+        return self.times[i], self.angles[i]
+
+    def velocity(self, joint, frames=VELOCITY_FRAMES):
+        """Angular velocity of a joint in degrees per second over the last frames"""
+        back = min(frames, self.count - 1)
+        if back < 1:
+            return 0.0
+        t1, a1 = self.latest()
+        t0, a0 = self.latest(back)
+        if t1 <= t0:
+            return 0.0
+        return float(a1[joint] - a0[joint]) / (t1 - t0)
+
+
+class RepAnalytics:
+    """Per-rep movement metrics of the counter joint, updated in O(1) per frame.
+
+    Every frame is appended to an AngleHistory, and the counter joint's
+    angle drives a four-phase cycle: in the rest zone, leaving it, in the
+    active zone and returning. A rep spans from re-entering the rest zone after
+    the previous rep to re-entering it after this one, so its extremes cover
+    the full extension. Tempo is the time between leaving one zone and
+    reaching the other, and time under tension is the time spent outside the
+    rest zone. Only running extremes and phase timestamps are kept per rep,
+    and the breakdown retains the last REP_HISTORY_SIZE reps.
+    """
+
+    __slots__ = (
+        'joint', 'concentric_to_active', 'history', 'reps', 'count', 'totals',
+        'phase', 'rep_start', 'active_start', 'active_end', 'peak', 'trough', 'good',
+    )
+
+    def __init__(self, joint, num_joints, concentric_to_active=True):
+        self.joint = joint
+        self.concentric_to_active = concentric_to_active
+        self.history = AngleHistory(num_joints)
+        self.reps = collections.deque(maxlen=REP_HISTORY_SIZE)
+        self.count = 0
+        self.totals = dict.fromkeys(('range_of_motion', 'concentric', 'eccentric', 'time_under_tension'), 0.0)
+        self.phase = _REST
+        self.rep_start = None
+        self.active_start = None
+        self.active_end = None
+        self.peak = None
+        self.trough = None
+        self.good = False
+
+    def update(self, angles, timestamp, in_rest, in_active, counted=False, good=False):
+        """Advance by one frame.
+
+        ``in_rest`` and ``in_active`` say whether the counter angle is past
+        the rest and active thresholds, ``counted`` whether the engine counted
+        a rep on this frame and ``good`` whether it was a good one.
+        """
+        self.history.push(timestamp, angles)
+        angle = float(angles[self.joint])
+        if self.peak is None:
+            self.peak = self.trough = angle
+        else:
+            self.peak = max(self.peak, angle)
+            self.trough = min(self.trough, angle)
+
+        if counted:
+            self.phase = _ACTIVE
+            self.active_start = self.active_end = timestamp
+            self.good = good
+            if self.rep_start is None:
+                self.rep_start = timestamp
+        elif self.phase == _REST:
+            if in_rest or self.rep_start is None:
+                self.rep_start = timestamp
+            else:
+                self.phase = _LEAVING
+        elif self.phase == _LEAVING:
+            if in_rest:
+                # Turned back before the active zone, not a rep
+                self.phase = _REST
+                self.rep_start = timestamp
+        elif self.phase == _ACTIVE:
+            if in_active:
+                self.active_end = timestamp
+            else:
+                self.phase = _RETURNING
+
+        if self.phase in (_ACTIVE, _RETURNING) and in_rest:
+            self._complete(timestamp)
+            self.phase = _REST
+            self.rep_start = timestamp
+            self.peak = self.trough = angle
+
+    def _record(self, end):
+        """Metrics of the current rep if it ended at ``end``"""
+        to_active = self.active_start - self.rep_start
+        to_rest = end - self.active_end if end is not None else None
+        concentric, eccentric = (to_active, to_rest) if self.concentric_to_active else (to_rest, to_active)
+        return {
+            'rep': self.count + 1,
+            'good': self.good,
+            'range_of_motion': self.peak - self.trough,
+            'peak': self.peak,
+            'trough': self.trough,
+            'concentric': concentric,
+            'eccentric': eccentric,
+            'hold': self.active_end - self.active_start,
+            'time_under_tension': (end if end is not None else self.active_end) - self.rep_start,
+            'start': self.rep_start,
+            'complete': end is not None
+        }
+
+    def _complete(self, end):
+        record = self._record(end)
+        self.reps.append(record)
+        self.count += 1
+        for key in self.totals:
+            self.totals[key] += record[key]
+
+    def live(self):
+        """Current angle and velocity of the counter joint and the last completed rep"""
+        if not self.history.count:
+            return None
+        _, angles = self.history.latest()
+        return {
+            'angle': float(angles[self.joint]),
+            'velocity': self.history.velocity(self.joint),
+            'last_rep': self.reps[-1] if self.reps else None
+        }
+
+    def breakdown(self):
+        """Retained reps, a rep still in progress, and averages over all completed reps"""
+        reps = list(self.reps)
+        if self.phase in (_ACTIVE, _RETURNING):
+            reps.append(self._record(None))
+        averages = {key: total / self.count for key, total in self.totals.items()} if self.count else None
+        return {'reps': reps, 'completed': self.count, 'averages': averages}
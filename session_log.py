@@ -0,0 +1,393 @@
+#!/usr/bin/env python3
+"""Append-only binary logs of workout sessions, and their replay.
+
+Every frame a session scores is appended as one fixed-size record, so a
+log can be memory-mapped and re-run through the exercise engine, for
+instance to audit a disputed rep count or to re-score old sessions after
+the thresholds in exercise_specs.json changed.
+
+Usage:
+    python session_log.py data/session_logs/*.poselog --events
+"""
+
+import argparse
+import atexit
+import json
+import os
+import queue
+import re
+import struct
+import threading
+import time
+
+import numpy as np
+
+from exercise_engine import EXERCISE_SPECS_PATH, REP_GOOD, REP_NONE, ExerciseEngine
+from joint_angles import JOINT_NAMES, NUM_LANDMARKS, compute_angles
+from workout_sessions import POSE_DATA_DIR, WorkoutSession
+
+# Directory new session logs are written to
+SESSION_LOG_DIR = os.environ.get('SESSION_LOG_DIR', os.path.join(POSE_DATA_DIR, 'session_logs'))
+
+# Logs older than this many days, or the oldest ones beyond this many MB in total, are deleted, 0 keeps them
+SESSION_LOG_MAX_AGE_DAYS = float(os.environ.get('SESSION_LOG_MAX_AGE_DAYS', '7'))
+SESSION_LOG_MAX_MB = float(os.environ.get('SESSION_LOG_MAX_MB', '1024'))
+
+# Records buffered per session before they are handed to the writer thread
+SESSION_LOG_BATCH = int(os.environ.get('SESSION_LOG_BATCH', '64'))
+
+# A log starts with a fixed-size header: magic, JSON length, JSON, padding
+LOG_MAGIC = b'POSELOG1'
+LOG_HEADER_SIZE = 4096
+LOG_SUFFIX = '.poselog'
+
+# Stages longer than this are truncated in the log
+STAGE_BYTES = 16
+
+
+def record_dtype(num_joints=len(JOINT_NAMES)):
+    """Packed NumPy dtype of one frame record"""
+    return np.dtype([
+        ('time', '<f8'),
+        ('landmarks', '<f4', (NUM_LANDMARKS, 4)),
+        ('angles', '<f4', (num_joints,)),
+        ('stage', f'S{STAGE_BYTES}'),
+        ('reps', '<i4'),
+        ('good_reps', '<i4'),
+        ('rep_event', 'i1'),
+        ('person', '<u2'),
+    ])
+
+
+def _pack_header(header):
+    body = json.dumps(header).encode()
+    if len(body) > LOG_HEADER_SIZE - len(LOG_MAGIC) - 4:
+        raise ValueError("Session log header too large")
+    return (LOG_MAGIC + struct.pack('<I', len(body)) + body).ljust(LOG_HEADER_SIZE, b' ')
+
+
+class LogWriter:
+    """Background thread appending record batches to log files.
+
+    Sessions only copy finished batches into the queue, so the frame path
+    never waits on the disk.
+    """
+
+    def __init__(self):
+        self._queue = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def submit(self, path, data, close=False):
+        """Queue bytes to append to ``path``, closing the file afterwards if ``close``"""
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='session-log-writer', daemon=True)
+                self._thread.start()
+        self._queue.put((path, data, close))
+
+    def stop(self):
+        """Write everything queued and stop the thread"""
+        with self._lock:
+            thread, self._thread = self._thread, None
+        if thread is not None:
+            self._queue.put(None)
+            thread.join()
+
+    def _run(self):
+        files = {}
+        while True:
+            item = self._queue.get()
+            if item is None:
+                break
+            path, data, close = item
+            try:
+                f = files.get(path)
+                if f is None:
+                    f = files[path] = open(path, 'ab')
+                f.write(data)
+                if close:
+                    files.pop(path).close()
+                elif self._queue.empty():
+                    f.flush()
+            except OSError as e:
+                print(f"Error writing session log {path}: {e}")
+        for f in files.values():
+            f.close()
+
+
+log_writer = LogWriter()
+atexit.register(log_writer.stop)
+
+
+class SessionLog:
+    """Frame records of one session, written in batches.
+
+    The header is written with the first batch, so state restored into the
+    session before its first frame (see ``note_start``) ends up in it.
+    """
+
+    __slots__ = ('path', 'header', 'batch', 'count', 'written', 'closed', 'lock')
+
+    def __init__(self, session, directory=SESSION_LOG_DIR, batch_size=SESSION_LOG_BATCH):
+        os.makedirs(directory, exist_ok=True)
+        name = re.sub(r'[^A-Za-z0-9_.-]', '_', session.session_id)
+        self.path = os.path.join(directory, f'{name}-{int(time.time() * 1000)}-{os.getpid()}{LOG_SUFFIX}')
+        self.header = {
+            'version': 1,
+            'session_id': session.session_id,
+            'exercise': session.exercise,
+            'created': time.time(),
+            'joint_names': list(JOINT_NAMES),
+            'record_size': record_dtype().itemsize,
+        }
+        self.note_start(session)
+        self.batch = np.zeros(batch_size, dtype=record_dtype())
+        self.count = 0
+        self.written = 0
+        self.closed = False
+        self.lock = threading.Lock()
+
+    def note_start(self, session):
+        """Record the state the session starts from, replay begins there"""
+        self.header.update({
+            'start_time': session.start_time,
+            'stage': session.stage,
+            'reps': session.counter,
+            'good_reps': session.good_reps,
+        })
+
+    def append(self, timestamp, points, angles, state, rep_event, person=0):
+        """Add the record of a frame ``state`` was just updated with"""
+        with self.lock:
+            if self.closed:
+                return
+            # One tuple assignment is several times faster than setting the fields one by one
+            self.batch[self.count] = (timestamp, points, angles, str(state.stage).encode()[:STAGE_BYTES],
+                                      state.counter, state.good_reps, rep_event, person)
+            self.count += 1
+            if self.count == len(self.batch):
+                self._submit()
+
+    def person(self, person_id):
+        """Log of one person of a multi-person session, sharing this file"""
+        return PersonLog(self, person_id)
+
+    def flush(self):
+        """Hand buffered records to the writer"""
+        with self.lock:
+            if self.count and not self.closed:
+                self._submit()
+
+    def close(self):
+        """Write the remaining records and close the file"""
+        with self.lock:
+            if self.closed:
+                return
+            self.closed = True
+            self._submit(close=True)
+
+    def _submit(self, close=False):
+        data = self.batch[:self.count].tobytes()
+        if not self.written and not data and close:
+            # Nothing was logged, leave no file behind
+            return
+        if not self.written:
+            data = _pack_header(self.header) + data
+        log_writer.submit(self.path, data, close)
+        self.written += self.count
+        self.count = 0
+
+
+class PersonLog:
+    """SessionLog view tagging records with a person ID"""
+
+    __slots__ = ('log', 'person_id')
+
+    def __init__(self, log, person_id):
+        self.log = log
+        self.person_id = person_id
+
+    def append(self, timestamp, points, angles, state, rep_event):
+        self.log.append(timestamp, points, angles, state, rep_event, self.person_id)
+
+
+def prune_logs(directory=SESSION_LOG_DIR, max_age_days=SESSION_LOG_MAX_AGE_DAYS,
+               max_mb=SESSION_LOG_MAX_MB, keep=()):
+    """Delete logs past the age limit, then the oldest until the rest fit the size limit.
+
+    Logs in ``keep``, those of running sessions, are never deleted. Returns
+    the number of logs deleted.
+    """
+    logs = []
+    try:
+        with os.scandir(directory) as entries:
+            for entry in entries:
+                if entry.name.endswith(LOG_SUFFIX) and entry.path not in keep:
+                    stat = entry.stat()
+                    logs.append((stat.st_mtime, stat.st_size, entry.path))
+    except FileNotFoundError:
+        return 0
+
+    logs.sort()
+    cutoff = time.time() - max_age_days * 86400 if max_age_days else None
+    budget = max_mb * 2 ** 20 if max_mb else None
+    total = sum(size for _, size, _ in logs)
+    deleted = 0
+    for modified, size, path in logs:
+        if (cutoff is None or modified >= cutoff) and (budget is None or total <= budget):
+            break
+        try:
+            os.remove(path)
+            deleted += 1
+        except FileNotFoundError:
+            # Another worker pruned it first
+            pass
+        total -= size
+    return deleted
+
+
+def open_log(path):
+    """Header and memory-mapped records of a session log.
+
+    A record cut short by a crash at the end of the file is ignored.
+    """
+    with open(path, 'rb') as f:
+        head = f.read(LOG_HEADER_SIZE)
+    if len(head) < LOG_HEADER_SIZE or not head.startswith(LOG_MAGIC):
+        raise ValueError(f"Not a session log: {path}")
+    length, = struct.unpack_from('<I', head, len(LOG_MAGIC))
+    header = json.loads(head[len(LOG_MAGIC) + 4:len(LOG_MAGIC) + 4 + length])
+
+    dtype = record_dtype(len(header['joint_names']))
+    if dtype.itemsize != header['record_size']:
+        raise ValueError(f"{path}: records of {header['record_size']} bytes, expected {dtype.itemsize}")
+    count = (os.path.getsize(path) - LOG_HEADER_SIZE) // dtype.itemsize
+    if not count:
+        return header, np.zeros(0, dtype=dtype)
+    return header, np.memmap(path, dtype=dtype, mode='r', offset=LOG_HEADER_SIZE, shape=(count,))
+
+
+def replay_log(path, engine=None, exercise=None, recompute_angles=False):
+    """Re-run a session log through the exercise engine.
+
+    Returns per-record columns (time, person, stage, reps, good_reps,
+    rep_event) as scored now, and a summary comparing them with the logged
+    ones. ``recompute_angles`` derives angles from the logged landmarks
+    instead of using the logged angles, for when joint definitions changed.
+    """
+    engine = engine or ExerciseEngine.from_file()
+    header, records = open_log(path)
+    exercise = exercise or header['exercise']
+    if exercise not in engine:
+        raise ValueError(f"Unknown exercise: {exercise}")
+
+    count = len(records)
+    times = records['time']
+    points = records['landmarks']
+    persons = records['person']
+    angles = compute_angles(np.asarray(points)) if recompute_angles else records['angles']
+    columns = {
+        'time': np.array(times),
+        'person': np.array(persons),
+        'stage': np.empty(count, dtype=f'S{STAGE_BYTES}'),
+        'reps': np.empty(count, dtype=np.int32),
+        'good_reps': np.empty(count, dtype=np.int32),
+        'rep_event': np.empty(count, dtype=np.int8),
+    }
+
+    def new_state(person):
+        state = WorkoutSession(f"{header['session_id']}/{person}", exercise, stage=engine.initial_stage(exercise))
+        if person == 0:
+            # Single-person sessions may start from restored or timed state
+            state.start_time = header.get('start_time')
+            state.counter = header.get('reps', 0)
+            state.good_reps = header.get('good_reps', 0)
+            state.stage = header.get('stage') or state.stage
+        return state
+
+    states = {}
+    started = time.perf_counter()
+    for i in range(count):
+        person = int(persons[i])
+        state = states.get(person)
+        if state is None:
+            state = states[person] = new_state(person)
+        columns['rep_event'][i] = engine.update(state, points[i], angles[i], now=float(times[i]))
+        columns['stage'][i] = str(state.stage).encode()[:STAGE_BYTES]
+        columns['reps'][i] = state.counter
+        columns['good_reps'][i] = state.good_reps
+    elapsed = time.perf_counter() - started
+
+    people = {}
+    for person, state in states.items():
+        last = np.flatnonzero(persons == person)[-1]
+        people[str(person)] = {
+            'reps': state.counter,
+            'good_reps': state.good_reps,
+            'logged_reps': int(records['reps'][last]),
+            'logged_good_reps': int(records['good_reps'][last]),
+        }
+    summary = {
+        'log': path,
+        'session_id': header['session_id'],
+        'exercise': exercise,
+        'frames': count,
+        'duration': float(times[-1] - times[0]) if count else 0.0,
+        'reps': sum(p['reps'] for p in people.values()),
+        'good_reps': sum(p['good_reps'] for p in people.values()),
+        'logged_reps': sum(p['logged_reps'] for p in people.values()),
+        'logged_good_reps': sum(p['logged_good_reps'] for p in people.values()),
+        'changed_events': int(np.count_nonzero(columns['rep_event'] != records['rep_event'])),
+        'replay_fps': count / elapsed if elapsed > 0 else 0.0,
+    }
+    if len(people) > 1 or (people and '0' not in people):
+        summary['people'] = people
+    columns['summary'] = summary
+    return columns
+
+
+def replay_events(result):
+    """List the records at which the replay counted reps"""
+    return [
+        {
+            'index': int(i),
+            'time': float(result['time'][i]),
+            'person': int(result['person'][i]),
+            'rep': int(result['reps'][i]),
+            'good': bool(result['rep_event'][i] == REP_GOOD)
+        }
+        for i in np.flatnonzero(result['rep_event'] != REP_NONE)
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Re-score logged workout sessions")
+    parser.add_argument('logs', nargs='+', help="Session log files")
+    parser.add_argument('--exercise', help="Score as this exercise instead of the logged one")
+    parser.add_argument('--specs', default=EXERCISE_SPECS_PATH, help="Exercise specs to score with")
+    parser.add_argument('--recompute-angles', action='store_true',
+                        help="Derive joint angles from the logged landmarks")
+    parser.add_argument('--events', action='store_true', help="List every rep the replay counted")
+    args = parser.parse_args()
+
+    engine = ExerciseEngine.from_file(args.specs)
+    for path in args.logs:
+        try:
+            result = replay_log(path, engine, args.exercise, args.recompute_angles)
+        except (OSError, ValueError) as e:
+            print(f"{path}: failed ({e})")
+            continue
+        summary = result['summary']
+        print(f"{path}: {summary['exercise']}, {summary['frames']} frames, "
+              f"{summary['reps']} reps ({summary['good_reps']} good), logged "
+              f"{summary['logged_reps']} ({summary['logged_good_reps']} good), "
+              f"{summary['changed_events']} rep events changed, at {summary['replay_fps']:.0f} fps")
+        if args.events:
+            for event in replay_events(result):
+                print(f"  {event['time']:.3f}s person {event['person']}: rep {event['rep']}"
+                      f"{'' if event['good'] else ' (bad form)'}")
+
+
+if __name__ == '__main__':
+    main()
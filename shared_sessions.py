@@ -0,0 +1,152 @@
+#!/usr/bin/env python3
+
+import os
+import threading
+import urllib.error
+import urllib.request
+from multiprocessing.managers import BaseManager
+
+# Set by start_pose_server.py for its workers, absent when the server runs on its own
+SESSION_STORE_ADDRESS = os.environ.get('POSE_SESSION_STORE')
+SESSION_STORE_KEY = os.environ.get('POSE_SESSION_STORE_KEY', '')
+WORKER_INDEX = int(os.environ['POSE_WORKER_INDEX']) if os.environ.get('POSE_WORKER_INDEX') else None
+WORKER_COUNT = int(os.environ.get('POSE_WORKER_COUNT', '1'))
+
+# Worker i also listens on localhost at this port + i, for requests forwarded by other workers
+WORKER_PORT_BASE = int(os.environ.get('POSE_WORKER_PORT_BASE', '3101'))
+
+# Marks a forwarded request so it is never passed on a second time
+FORWARDED_HEADER = 'X-Pose-Forwarded'
+FORWARD_TIMEOUT = 10
+
+# Session fields copied into the store so another worker can take a session over
+SHARED_STATE_FIELDS = ('counter', 'stage', 'good_reps', 'feedback', 'start_time', 'created')
+
+
+class SessionRecords:
+    """Session records of all workers, living in the store process.
+
+    A record holds the options a session was started with, the index of the
+    worker that owns its live state, and the last state that worker
+    published. Every method runs under one lock, so claiming a session is
+    atomic across workers.
+    """
+
+    def __init__(self):
+        self._records = {}
+        self._lock = threading.Lock()
+
+    def create(self, session_id, options, owner):
+        """Register a new session, replacing any previous one with the same id"""
+        with self._lock:
+            self._records[session_id] = {'options': options, 'owner': owner, 'state': None}
+
+    def get(self, session_id):
+        """Copy of a session's record, or None"""
+        with self._lock:
+            record = self._records.get(session_id)
+            return dict(record) if record is not None else None
+
+    def claim(self, session_id, owner):
+        """Make a worker the owner of a session, returns the record as it was before or None"""
+        with self._lock:
+            record = self._records.get(session_id)
+            if record is None:
+                return None
+            previous = dict(record)
+            record['owner'] = owner
+            return previous
+
+    def publish(self, session_id, owner, state):
+        """Store the owner's latest state, ignored once another worker claimed the session"""
+        with self._lock:
+            record = self._records.get(session_id)
+            if record is None or record['owner'] != owner:
+                return False
+            record['state'] = state
+            return True
+
+    def remove(self, session_id, owner=None):
+        """Forget a session, only if ``owner`` still owns it when given"""
+        with self._lock:
+            record = self._records.get(session_id)
+            if record is None or (owner is not None and record['owner'] != owner):
+                return None
+            return self._records.pop(session_id)
+
+    def owners(self):
+        """Owner of every session, by session id"""
+        with self._lock:
+            return {session_id: record['owner'] for session_id, record in self._records.items()}
+
+    def __len__(self):
+        return len(self._records)
+
+
+_records = SessionRecords()
+
+
+def _get_records():
+    return _records
+
+
+class _StoreManager(BaseManager):
+    pass
+
+
+_StoreManager.register('records', callable=_get_records, exposed=(
+    'create', 'get', 'claim', 'publish', 'remove', 'owners', '__len__',
+))
+
+
+def start_store(address=('127.0.0.1', 0), authkey=None):
+    """Start the store in a child process and return its manager, for the supervisor"""
+    manager = _StoreManager(address, authkey or os.urandom(16))
+    manager.start()
+    return manager
+
+
+def connect_store(address=SESSION_STORE_ADDRESS, authkey=SESSION_STORE_KEY):
+    """Proxy to the supervisor's SessionRecords, or None when not running as a worker"""
+    if not address:
+        return None
+    host, _, port = address.rpartition(':')
+    manager = _StoreManager((host, int(port)), bytes.fromhex(authkey))
+    manager.connect()
+    return manager.records()
+
+
+def worker_address(index):
+    """Localhost address a worker takes forwarded requests on"""
+    return ('127.0.0.1', WORKER_PORT_BASE + index)
+
+
+def forward_request(index, method, path, body, content_type):
+    """Replay a REST request on another worker and return (body, status, headers).
+
+    Raises OSError when the worker cannot be reached.
+    """
+    host, port = worker_address(index)
+    headers = {FORWARDED_HEADER: '1'}
+    if content_type:
+        headers['Content-Type'] = content_type
+    forwarded = urllib.request.Request(f'http://{host}:{port}{path}', data=body or None,
+                                       headers=headers, method=method)
+    try:
+        with urllib.request.urlopen(forwarded, timeout=FORWARD_TIMEOUT) as response:
+            return response.read(), response.status, {'Content-Type': response.headers.get('Content-Type')}
+    except urllib.error.HTTPError as e:
+        # Error answers of the owner are still its answers
+        return e.read(), e.code, {'Content-Type': e.headers.get('Content-Type')}
+
+
+def session_state(session):
+    """Fields of a WorkoutSession worth carrying over to another worker"""
+    return {field: getattr(session, field) for field in SHARED_STATE_FIELDS}
+
+
+def restore_state(session, state):
+    """Apply published state to a session a worker takes over"""
+    for field in SHARED_STATE_FIELDS:
+        if field in state:
+            setattr(session, field, state[field])
@@ -9,6 +9,9 @@ from flask import Flask, request, jsonify
 from flask_cors import CORS
 from flask_socketio import SocketIO, emit
 import time
+import uuid
+
+from pose_pool import PosePool
 
 # Set environment variables to prevent GUI issues
 os.environ['DISPLAY'] = ':0'
@@ -26,13 +29,18 @@ workout_state = {
     'stage': 'down',
     'good_reps': 0,
     'feedback': [],
-    'start_time': None
+    'start_time': None,
+    'session_id': None,
+    'sid': None
 }
 
 # Initialize MediaPipe
 mp_drawing = mp.solutions.drawing_utils
 mp_pose = mp.solutions.pose
 
+# Warm Pose instances, one per active session
+pose_pool = PosePool()
+
 def calculate_angle(a, b, c):
     """Calculate angle between three points"""
     a = np.array(a)
@@ -119,6 +127,10 @@ def start_workout():
         data = request.get_json()
         exercise = data.get('exercise') if data else 'bicep_curl'
         
+        # Release the previous session's model before replacing it
+        if workout_state['session_id']:
+            pose_pool.release(workout_state['session_id'])
+        
         # Reset workout state
         workout_state = {
             'active': True,
@@ -127,11 +139,14 @@ def start_workout():
             'stage': 'down',
             'good_reps': 0,
             'feedback': [],
-            'start_time': time.time()
+            'start_time': time.time(),
+            'session_id': uuid.uuid4().hex,
+            'sid': None
         }
+        pose_pool.acquire(workout_state['session_id'])
         
         print(f"Started workout: {exercise}")
-        return jsonify({'status': 'started', 'exercise': exercise})
+        return jsonify({'status': 'started', 'exercise': exercise, 'session_id': workout_state['session_id']})
     except Exception as e:
         print(f"Error starting workout: {e}")
         return jsonify({'error': str(e)}), 500
@@ -151,6 +166,8 @@ def end_workout():
     }
     
     workout_state['active'] = False
+    if workout_state['session_id']:
+        pose_pool.release(workout_state['session_id'])
     print(f"Ended workout. Summary: {summary}")
     
     return jsonify({'status': 'ended', 'summary': summary})
@@ -172,54 +189,61 @@ def handle_video_frame(data):
         # Convert BGR to RGB
         rgb_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
         
-        # Process with MediaPipe
-        with mp_pose.Pose(min_detection_confidence=0.5, min_tracking_confidence=0.5) as pose:
-            results = pose.process(rgb_frame)
+        # Process with the session's long-lived MediaPipe instance
+        workout_state['sid'] = request.sid
+        pose = pose_pool.acquire(workout_state['session_id'])
+        results = pose.process(rgb_frame)
+        
+        if results.pose_landmarks:
+            landmarks = results.pose_landmarks.landmark
+            
+            # Process based on exercise type
+            if workout_state['exercise'] == 'bicep_curl':
+                process_bicep_curl(landmarks)
+            elif workout_state['exercise'] == 'squats':
+                process_squats(landmarks)
+            
+            # Draw pose landmarks
+            annotated_frame = cv2.cvtColor(rgb_frame, cv2.COLOR_RGB2BGR)
+            mp_drawing.draw_landmarks(
+                annotated_frame, 
+                results.pose_landmarks, 
+                mp_pose.POSE_CONNECTIONS
+            )
+            
+            # Add feedback text
+            y_offset = 30
+            for feedback in workout_state['feedback']:
+                color = (0, 255, 0) if feedback == "Good form!" else (0, 0, 255)
+                cv2.putText(annotated_frame, feedback, (10, y_offset), 
+                           cv2.FONT_HERSHEY_SIMPLEX, 0.7, color, 2, cv2.LINE_AA)
+                y_offset += 30
+            
+            # Encode frame back to base64
+            _, buffer = cv2.imencode('.jpg', annotated_frame)
+            encoded_frame = base64.b64encode(buffer.tobytes()).decode('utf-8')
+            
+            # Send updated data back to client
+            emit('pose_analysis', {
+                'processed_frame': f'data:image/jpeg;base64,{encoded_frame}',
+                'metrics': {
+                    'reps': workout_state['counter'],
+                    'stage': workout_state['stage'],
+                    'good_reps': workout_state['good_reps'],
+                    'feedback': workout_state['feedback']
+                }
+            })
             
-            if results.pose_landmarks:
-                landmarks = results.pose_landmarks.landmark
-                
-                # Process based on exercise type
-                if workout_state['exercise'] == 'bicep_curl':
-                    process_bicep_curl(landmarks)
-                elif workout_state['exercise'] == 'squats':
-                    process_squats(landmarks)
-                
-                # Draw pose landmarks
-                annotated_frame = cv2.cvtColor(rgb_frame, cv2.COLOR_RGB2BGR)
-                mp_drawing.draw_landmarks(
-                    annotated_frame, 
-                    results.pose_landmarks, 
-                    mp_pose.POSE_CONNECTIONS
-                )
-                
-                # Add feedback text
-                y_offset = 30
-                for feedback in workout_state['feedback']:
-                    color = (0, 255, 0) if feedback == "Good form!" else (0, 0, 255)
-                    cv2.putText(annotated_frame, feedback, (10, y_offset), 
-                               cv2.FONT_HERSHEY_SIMPLEX, 0.7, color, 2, cv2.LINE_AA)
-                    y_offset += 30
-                
-                # Encode frame back to base64
-                _, buffer = cv2.imencode('.jpg', annotated_frame)
-                encoded_frame = base64.b64encode(buffer.tobytes()).decode('utf-8')
-                
-                # Send updated data back to client
-                emit('pose_analysis', {
-                    'processed_frame': f'data:image/jpeg;base64,{encoded_frame}',
-                    'metrics': {
-                        'reps': workout_state['counter'],
-                        'stage': workout_state['stage'],
-                        'good_reps': workout_state['good_reps'],
-                        'feedback': workout_state['feedback']
-                    }
-                })
-                
     except Exception as e:
         print(f"Error processing frame: {e}")
         emit('error', {'message': str(e)})
 
+@socketio.on('disconnect')
+def handle_disconnect():
+    """Release the session's Pose instance when its client goes away"""
+    if workout_state['sid'] == request.sid and workout_state['session_id']:
+        pose_pool.release(workout_state['session_id'])
+
 if __name__ == '__main__':
     print("🚀 Starting Pose Estimation Server on port 3001...")
     print("🏋️ Ready to process workouts!")
@@ -1,19 +1,132 @@
 #!/usr/bin/env python3
 
+import argparse
 import os
+import signal
+import subprocess
 import sys
+import time
 
 # Set environment variables to prevent GUI issues
 os.environ['DISPLAY'] = ':0'
 os.environ['QT_QPA_PLATFORM'] = 'offscreen'
 
+ROOT = os.path.dirname(os.path.abspath(__file__))
+SERVER_SCRIPT = os.path.join(ROOT, 'pose_estimation_server.py')
+
 # Add current directory to Python path
-sys.path.insert(0, '/home/runner/workspace')
+sys.path.insert(0, ROOT)
+
+from shared_sessions import start_store  # noqa: E402
+
+# Worker processes, more than one is opt-in as workers only accept websocket clients
+POSE_WORKERS = int(os.environ.get('POSE_WORKERS', '1'))
+
+# A worker dying sooner than this after its start counts as a crash loop and backs off
+WORKER_MIN_UPTIME = 10.0
+WORKER_MAX_BACKOFF = 30.0
+
+
+class Worker:
+    """One pose server process and its restart bookkeeping"""
+
+    __slots__ = ('index', 'process', 'started', 'backoff', 'restart_at')
+
+    def __init__(self, index):
+        self.index = index
+        self.process = None
+        self.started = 0.0
+        self.backoff = 1.0
+        self.restart_at = 0.0
+
+    def start(self, env):
+        self.process = subprocess.Popen([sys.executable, SERVER_SCRIPT], cwd=ROOT,
+                                        env=dict(env, POSE_WORKER_INDEX=str(self.index)))
+        self.started = time.monotonic()
+
+    def stop(self):
+        if self.process is not None and self.process.poll() is None:
+            self.process.terminate()
+
+
+def supervise(num_workers, port):
+    """Run the pose server as worker processes sharing one port, restarting any that exit.
+
+    Workers bind the port with SO_REUSEPORT, so the kernel hands each new
+    connection to one of them. Socket.IO runs websocket-only in worker mode,
+    which keeps every client on the worker that accepted its connection.
+    Sessions are registered in a store process, so REST calls for a session
+    are answered by whichever worker owns it, and a worker that receives a
+    session's frames takes it over.
+    """
+    authkey = os.urandom(16)
+    store = start_store(authkey=authkey)
+    host, store_port = store.address
+    env = dict(os.environ, POSE_SESSION_STORE=f'{host}:{store_port}',
+               POSE_SESSION_STORE_KEY=authkey.hex(), POSE_SERVER_PORT=str(port),
+               POSE_WORKER_COUNT=str(num_workers))
+
+    stopping = []
+    signal.signal(signal.SIGTERM, lambda *_: stopping.append(True))
+    signal.signal(signal.SIGINT, lambda *_: stopping.append(True))
+
+    workers = [Worker(i) for i in range(num_workers)]
+    for worker in workers:
+        worker.start(env)
+    print(f"Supervising {num_workers} pose server workers on port {port}...")
+
+    try:
+        while not stopping:
+            time.sleep(0.5)
+            now = time.monotonic()
+            for worker in workers:
+                if worker.process is None:
+                    if now >= worker.restart_at:
+                        worker.start(env)
+                    continue
+
+                code = worker.process.poll()
+                if code is None:
+                    continue
+
+                # Back off exponentially while a worker keeps crashing right after starting
+                if now - worker.started < WORKER_MIN_UPTIME:
+                    worker.backoff = min(worker.backoff * 2, WORKER_MAX_BACKOFF)
+                else:
+                    worker.backoff = 1.0
+                print(f"Worker {worker.index} exited with code {code}, restarting in {worker.backoff:.0f}s")
+                worker.process = None
+                worker.restart_at = now + worker.backoff
+    finally:
+        for worker in workers:
+            worker.stop()
+        for worker in workers:
+            if worker.process is not None:
+                try:
+                    worker.process.wait(10)
+                except subprocess.TimeoutExpired:
+                    worker.process.kill()
+        store.shutdown()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Start the pose estimation server")
+    parser.add_argument('--workers', type=int, default=POSE_WORKERS,
+                        help="Worker processes, 1 runs a single server process")
+    parser.add_argument('--port', type=int, default=int(os.environ.get('POSE_SERVER_PORT', '3001')))
+    args = parser.parse_args()
+
+    if args.workers <= 1:
+        # A single process keeps every transport, including long-polling
+        os.environ['POSE_SERVER_PORT'] = str(args.port)
+        os.execv(sys.executable, [sys.executable, SERVER_SCRIPT])
+    supervise(args.workers, args.port)
+
 
 # Start the pose estimation server
 if __name__ == '__main__':
     try:
-        import pose_estimation_server
+        main()
     except Exception as e:
         print(f"Error starting pose estimation server: {e}")
-        sys.exit(1)
\ No newline at end of file
+        sys.exit(1)
@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+
+import os
+import sys
+
+import numpy as np
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from exercise_engine import REP_BAD, REP_GOOD, REP_NONE, ExerciseEngine, SpecError
+from joint_angles import JOINT, JOINT_NAMES, NUM_LANDMARKS
+from workout_sessions import WorkoutSession
+
+CURL = {
+    'counter': {
+        'joint': 'left_elbow',
+        'rest': {'stage': 'down', 'above': 160},
+        'active': {'stage': 'up', 'below': 30}
+    },
+    'rules': [
+        {'angle': 'left_knee', 'stage': 'up', 'below': 90, 'message': 'Stand up straight.'},
+        {'angle': 'left_hip', 'below': 45, 'message': 'Keep your back straight.'}
+    ]
+}
+
+PLANK = {
+    'hold': True,
+    'ok_message': 'Keep holding!',
+    'rules': [{'angle': 'left_hip', 'at_most': 160, 'message': 'Hips up!'}]
+}
+
+
+def frame(elbow, knee=180.0, hip=180.0):
+    angles = np.full(len(JOINT_NAMES), 180.0, dtype=np.float32)
+    angles[JOINT['left_elbow']] = elbow
+    angles[JOINT['left_knee']] = knee
+    angles[JOINT['left_hip']] = hip
+    return np.zeros((NUM_LANDMARKS, 4), dtype=np.float32), angles
+
+
+def new_session(engine, exercise):
+    session = WorkoutSession('test', exercise, stage=engine.initial_stage(exercise),
+                             timed=engine.is_timed(exercise))
+    session.analytics = engine.rep_analytics(exercise)
+    return session
+
+
+def test_shipped_specs_compile():
+    engine = ExerciseEngine.from_file()
+    assert 'bicep_curl' in engine
+    assert engine.is_timed('plank')
+    assert engine.messages('plank')[0] == 'Good form! Keep holding!'
+
+
+@pytest.mark.parametrize('spec', [
+    {'rules': []},
+    dict(CURL, counter=dict(CURL['counter'], joint='left_wrist')),
+    dict(CURL, counter=dict(CURL['counter'], concentric='sideways')),
+    dict(CURL, rules=[{'angle': 'left_knee', 'below': 90, 'above': 10, 'message': 'Two operators'}]),
+    dict(CURL, rules=[{'dx': ['left_shoulder', 'tail'], 'above': 0.1, 'message': 'Unknown landmark'}]),
+    dict(CURL, rules=[{'above': 0.1, 'message': 'No metric'}]),
+])
+def test_invalid_specs_raise_spec_error(spec):
+    with pytest.raises(SpecError):
+        ExerciseEngine({'broken': spec})
+
+
+def test_reps_count_on_entering_the_active_stage():
+    engine = ExerciseEngine({'curl': CURL})
+    session = new_session(engine, 'curl')
+    outcomes = []
+    elbows = [170, 100, 20, 20, 100, 170, 100, 20, 100, 20, 170, 50, 170]
+    knees = [180, 180, 180, 180, 180, 180, 180, 60, 180, 180, 180, 180, 180]
+    for i, (elbow, knee) in enumerate(zip(elbows, knees)):
+        outcomes.append(engine.update(session, *frame(elbow, knee), now=i / 10))
+
+    # The second rep breaks the up-stage rule, staying in the active zone or
+    # re-entering it without returning to rest counts nothing
+    assert [outcome for outcome in outcomes if outcome != REP_NONE] == [REP_GOOD, REP_BAD]
+    assert outcomes.index(REP_BAD) == 7
+    assert (session.counter, session.good_reps, session.stage) == (2, 1, 'down')
+    assert session.analytics.breakdown()['completed'] == 2
+
+
+def test_feedback_is_judged_against_the_current_stage():
+    engine = ExerciseEngine({'curl': CURL})
+    session = new_session(engine, 'curl')
+
+    # The knee rule only applies in the up stage
+    engine.update(session, *frame(170, knee=60), now=0.0)
+    assert session.feedback == ['Good form!']
+    engine.update(session, *frame(170, hip=30), now=0.1)
+    assert session.feedback == ['Keep your back straight.']
+
+
+def test_holds_count_seconds_held_in_good_form():
+    engine = ExerciseEngine({'plank': PLANK})
+    session = new_session(engine, 'plank')
+    session.start_time = None
+
+    engine.update(session, *frame(180), now=100.0)
+    engine.update(session, *frame(180), now=101.5)
+    engine.update(session, *frame(180, hip=150), now=102.5)
+    assert session.counter == 2
+    assert session.good_reps == 1
+    assert session.stage == 'Hold: 2s'
+    assert session.feedback == ['Hips up!']
@@ -0,0 +1,45 @@
+#!/usr/bin/env python3
+
+import base64
+import os
+import sys
+
+import numpy as np
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from frame_codec import LANDMARK_SHAPE, MAX_LANDMARK_BATCH, decode_landmarks
+
+
+def landmark_frames(count):
+    return np.random.default_rng(0).random((count, *LANDMARK_SHAPE), dtype=np.float32)
+
+
+def test_all_payload_forms_decode_alike():
+    frames = landmark_frames(3)
+    packed = frames.astype('<f4').tobytes()
+
+    for payload in (packed, base64.b64encode(packed).decode(), frames.tolist()):
+        np.testing.assert_array_equal(decode_landmarks(payload), frames)
+    assert decode_landmarks(frames[0].tolist()).shape == (1, *LANDMARK_SHAPE)
+
+
+@pytest.mark.parametrize('payload', [
+    [[{'x': 0.5}] * 4] * 33,
+    [[None, 'a']],
+    [[1.0, 2.0], [3.0]],
+    [1.0] * 5,
+    b'',
+    {'landmarks': []},
+])
+def test_malformed_landmarks_raise_value_error(payload):
+    with pytest.raises(ValueError):
+        decode_landmarks(payload)
+
+
+def test_batch_size_is_bounded():
+    values = LANDMARK_SHAPE[0] * LANDMARK_SHAPE[1]
+    with pytest.raises(ValueError):
+        decode_landmarks(np.zeros(values * (MAX_LANDMARK_BATCH + 1), dtype='<f4').tobytes())
@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+
+import os
+import sys
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from exercise_engine import ExerciseEngine
+from joint_angles import compute_angles
+from metrics_stream import MetricsStream
+from workout_sessions import WorkoutSession
+
+FIXTURE = os.path.join(ROOT, 'benchmarks', 'fixtures', 'landmarks_bicep_curl.npz')
+
+
+def load_fixture():
+    fixture = np.load(FIXTURE)
+    return str(fixture['exercise']), fixture['time'], fixture['landmarks']
+
+
+def new_session(engine, exercise):
+    session = WorkoutSession('test', exercise, stage=engine.initial_stage(exercise))
+    session.analytics = engine.rep_analytics(exercise)
+    return session
+
+
+def scored(engine, session, stream, points, now):
+    engine.update(session, points, compute_angles(points[None])[0], now=now)
+    stream.set(session.metrics())
+
+
+def test_static_frames_send_no_updates():
+    engine = ExerciseEngine.from_file()
+    exercise, times, landmarks = load_fixture()
+    session = new_session(engine, exercise)
+    stream = MetricsStream('sid', engine.messages(exercise), rate=0, live_rate=0)
+
+    # Settle the stage and analytics on the first pose, then subscribe
+    for i in range(10):
+        scored(engine, session, stream, landmarks[0], float(times[0]) + i / 30)
+    stream.snapshot(now=0.0)
+
+    for i in range(10, 300):
+        scored(engine, session, stream, landmarks[0], float(times[0]) + i / 30)
+        assert stream.poll(now=float(i)) is None
+        assert stream.poll_live(now=float(i)) is None
+
+
+def test_updates_follow_reps_stage_and_feedback_only():
+    engine = ExerciseEngine.from_file()
+    exercise, times, landmarks = load_fixture()
+    session = new_session(engine, exercise)
+    stream = MetricsStream('sid', engine.messages(exercise), rate=0)
+    snapshot = stream.snapshot(now=0.0)
+    client = dict(snapshot['metrics'])
+
+    updates, changes, last = 0, 0, None
+    for i in range(len(landmarks)):
+        scored(engine, session, stream, landmarks[i], float(times[i]))
+        state = (session.counter, session.stage, session.good_reps, tuple(session.feedback))
+        changes += state != last
+        last = state
+        update = stream.poll(now=float(i))
+        if update is not None:
+            updates += 1
+            client.update(update['metrics'])
+
+    # Live angle and velocity change every frame but never cause a metrics update
+    assert updates <= changes < len(landmarks)
+    assert client['reps'] == session.counter
+    assert client['stage'] == session.stage
+    assert [stream.messages[code] for code in client['feedback']] == session.feedback
@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+
+import os
+import sys
+
+import numpy as np
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from motion_gate import MOTION_THUMBNAIL_WIDTH, MotionGate, motion_thumbnail
+
+FRAME = os.path.join(ROOT, 'benchmarks', 'fixtures', 'frame_640x360.jpg')
+
+
+def thumbnail(changed=0, delta=50):
+    """Gray thumbnail with its first ``changed`` pixels moved by ``delta`` levels"""
+    image = np.full((36, 64), 100, dtype=np.uint8)
+    image.reshape(-1)[:changed] += delta
+    return image
+
+
+def test_thumbnails_are_small_and_gray():
+    with open(FRAME, 'rb') as f:
+        small = motion_thumbnail(np.frombuffer(f.read(), np.uint8))
+    assert small.ndim == 2
+    assert small.shape[1] <= MOTION_THUMBNAIL_WIDTH
+    with pytest.raises(ValueError):
+        motion_thumbnail(np.frombuffer(b'not a jpeg', np.uint8))
+
+
+def test_threshold_and_pixel_delta():
+    # 36 * 64 pixels, a threshold of 1% lets up to 23 changed pixels through
+    gate = MotionGate(threshold=0.01, pixel_delta=12, max_skipped=100)
+    assert not gate.static(thumbnail())
+    gate.remember(thumbnail(), None, None)
+
+    assert gate.static(thumbnail(23))
+    assert not gate.static(thumbnail(24))
+    # Changes within the pixel delta are sensor noise
+    assert gate.static(thumbnail(2000, delta=12))
+    assert not gate.static(thumbnail(2000, delta=13))
+    assert not gate.static(np.full((18, 32), 100, dtype=np.uint8))
+
+
+def test_slow_motion_adds_up_against_the_reference():
+    gate = MotionGate(threshold=0.01, pixel_delta=12, max_skipped=100)
+    gate.remember(thumbnail(), None, None)
+    # Each frame moves 10 more pixels, the reference stays until inference runs
+    assert [gate.static(thumbnail(changed)) for changed in (10, 20, 30)] == [True, True, False]
+    assert gate.stats()['motion_skipped'] == 2
+
+
+def test_inference_runs_at_least_every_max_skipped_frames():
+    gate = MotionGate(threshold=0.01, max_skipped=3)
+    gate.remember(thumbnail(), None, None)
+    assert [gate.static(thumbnail()) for _ in range(5)] == [True, True, True, False, False]
+    gate.remember(thumbnail(), None, None)
+    assert gate.static(thumbnail())
+
+    gate.reset()
+    assert not gate.static(thumbnail())
+    assert gate.frame is None and gate.processed_frame is None
@@ -0,0 +1,61 @@
+#!/usr/bin/env python3
+
+import os
+import sys
+
+import numpy as np
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from rep_analytics import ANGLE_HISTORY_SIZE, VELOCITY_FRAMES, AngleHistory, RepAnalytics
+
+
+def test_ring_buffer_keeps_the_newest_frames():
+    history = AngleHistory(2, size=4)
+    for i in range(6):
+        history.push(float(i), [i, -i])
+
+    assert history.count == 4
+    assert [history.latest(back)[0] for back in range(4)] == [5.0, 4.0, 3.0, 2.0]
+    np.testing.assert_array_equal(history.latest(3)[1], [2, -2])
+
+
+def test_velocity_spans_the_velocity_window():
+    history = AngleHistory(1)
+    assert history.velocity(0) == 0.0
+    history.push(0.0, [10.0])
+    assert history.velocity(0) == 0.0
+
+    # 30 degrees per second, also once older frames were overwritten
+    for i in range(1, ANGLE_HISTORY_SIZE * 2):
+        history.push(i / 10, [10.0 + 3.0 * i])
+        assert history.velocity(0) == pytest.approx(30.0)
+    assert ANGLE_HISTORY_SIZE > VELOCITY_FRAMES
+
+
+def test_rep_metrics_of_one_curl():
+    analytics = RepAnalytics(joint=0, num_joints=1, concentric_to_active=True)
+    # (time, angle, in_rest, in_active, counted)
+    frames = [
+        (0.0, 170, True, False, False),
+        (0.5, 120, False, False, False),
+        (1.0, 25, False, True, True),
+        (1.5, 20, False, True, False),
+        (2.0, 90, False, False, False),
+        (3.0, 165, True, False, False),
+    ]
+    for timestamp, angle, in_rest, in_active, counted in frames:
+        analytics.update(np.array([angle], dtype=np.float32), timestamp, in_rest, in_active,
+                         counted=counted, good=True)
+
+    breakdown = analytics.breakdown()
+    assert breakdown['completed'] == 1
+    rep = breakdown['reps'][0]
+    assert rep['complete'] and rep['good']
+    assert rep['range_of_motion'] == 150
+    assert (rep['concentric'], rep['hold'], rep['eccentric']) == (1.0, 0.5, 1.5)
+    assert rep['time_under_tension'] == 3.0
+    assert breakdown['averages']['range_of_motion'] == 150
+    assert analytics.live()['last_rep'] is rep
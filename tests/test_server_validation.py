@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+
+import os
+import sys
+import time
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# Keep the server's data out of the repo, tests that need history bring their own
+os.environ['WORKOUT_HISTORY'] = '0'
+os.environ['SESSION_LOG'] = '0'
+
+import pose_estimation_server as server
+from workout_history import WorkoutHistory
+
+
+@pytest.fixture
+def client():
+    return server.app.test_client()
+
+
+@pytest.fixture
+def history(tmp_path, monkeypatch):
+    history = WorkoutHistory(str(tmp_path / 'workouts.db'))
+    monkeypatch.setattr(server, 'workout_history', history)
+    return history
+
+
+def start(client, **options):
+    # Client landmarks need no inference slot or Pose instance
+    return client.post('/start_workout', json=dict(options, exercise='bicep_curl', client_landmarks=True))
+
+
+@pytest.mark.parametrize('target', ['fast', [100], 0, -5, 1e9, 'nan', 'inf'])
+def test_invalid_latency_targets_are_rejected(client, target):
+    response = start(client, session_id='slo-bad', slo=True, latency_target_ms=target)
+    assert response.status_code == 400
+    assert 'latency_target_ms' in response.get_json()['error']
+
+
+@pytest.mark.parametrize('target, expected', [(None, server.LATENCY_TARGET_MS), (250, 250.0), ('80', 80.0)])
+def test_valid_latency_targets_are_used(client, target, expected):
+    response = start(client, session_id='slo-ok', slo=True, latency_target_ms=target)
+    assert response.status_code == 200
+    assert response.get_json()['latency_target_ms'] == pytest.approx(expected)
+    client.post('/end_workout', json={'session_id': 'slo-ok'})
+
+
+@pytest.mark.parametrize('people', [-1, server.MAX_PEOPLE + 1, 'many'])
+def test_invalid_people_counts_are_rejected(client, people):
+    assert start(client, session_id='people-bad', people=people).status_code == 400
+
+
+def test_history_bounds_out_of_range_values(client, history):
+    history.record('s1', 'ana', 'squats', 0.0, time.time(), reps=5, good_reps=4)
+
+    for weeks in ('100000000', '-3', '0'):
+        response = client.get(f'/history/ana/weekly?weeks={weeks}')
+        assert response.status_code == 200
+        assert [row['reps'] for row in response.get_json()['weeks']] == [5]
+    assert len(client.get('/history?limit=-1').get_json()['workouts']) == 1
+
+
+@pytest.mark.parametrize('url', ['/history/ana/weekly?weeks=many', '/history?since=yesterday', '/history?limit=1.5'])
+def test_unparseable_history_arguments_are_rejected(client, history, url):
+    assert client.get(url).status_code == 400
@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+
+import os
+import sys
+import time
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from exercise_engine import ExerciseEngine
+from joint_angles import compute_angles
+from session_log import LOG_SUFFIX, SessionLog, log_writer, open_log, prune_logs, replay_events, replay_log
+from workout_sessions import WorkoutSession
+
+FIXTURE = os.path.join(ROOT, 'benchmarks', 'fixtures', 'landmarks_bicep_curl.npz')
+
+
+def logged_session(engine, directory):
+    fixture = np.load(FIXTURE)
+    exercise, times, landmarks = str(fixture['exercise']), fixture['time'], fixture['landmarks']
+    session = WorkoutSession('user/42', exercise, stage=engine.initial_stage(exercise))
+    session.log = SessionLog(session, str(directory), batch_size=16)
+    angles = compute_angles(landmarks)
+    for i in range(len(landmarks)):
+        engine.update(session, landmarks[i], angles[i], now=float(times[i]))
+    session.log.close()
+    # Joins the writer thread, the next log starts it again
+    log_writer.stop()
+    return session, len(landmarks)
+
+
+def test_replay_matches_the_logged_session(tmp_path):
+    engine = ExerciseEngine.from_file()
+    session, frames = logged_session(engine, tmp_path)
+    path = session.log.path
+    assert os.path.dirname(path) == str(tmp_path)
+    assert os.path.basename(path).startswith('user_42-')
+    assert session.counter > 0
+
+    header, records = open_log(path)
+    assert header['session_id'] == 'user/42'
+    assert len(records) == frames
+
+    result = replay_log(path, engine)
+    summary = result['summary']
+    assert summary['frames'] == frames
+    assert (summary['reps'], summary['good_reps']) == (session.counter, session.good_reps)
+    assert (summary['logged_reps'], summary['logged_good_reps']) == (session.counter, session.good_reps)
+    assert summary['changed_events'] == 0
+    assert len(replay_events(result)) == session.counter
+
+
+def test_partial_trailing_record_is_ignored(tmp_path):
+    session, frames = logged_session(ExerciseEngine.from_file(), tmp_path)
+    with open(session.log.path, 'ab') as f:
+        f.write(b'\0' * 10)
+    assert len(open_log(session.log.path)[1]) == frames
+
+
+def test_empty_sessions_leave_no_file(tmp_path):
+    log = SessionLog(WorkoutSession('idle', 'bicep_curl'), str(tmp_path))
+    log.close()
+    log_writer.stop()
+    assert os.listdir(tmp_path) == []
+
+
+def test_prune_by_age_then_size_sparing_running_sessions(tmp_path):
+    now = time.time()
+    paths = []
+    for i, age_days in enumerate((30, 3, 2, 1, 0)):
+        path = str(tmp_path / f'log{i}{LOG_SUFFIX}')
+        with open(path, 'wb') as f:
+            f.write(b'\0' * 2 ** 19)
+        os.utime(path, (now - age_days * 86400, now - age_days * 86400))
+        paths.append(path)
+    (tmp_path / 'notes.txt').write_text('not a log')
+
+    # The 30 day old log is past the age limit, then the oldest go until 1 MB is left
+    assert prune_logs(str(tmp_path), max_age_days=7, max_mb=1, keep={paths[1]}) == 2
+    assert sorted(os.listdir(tmp_path)) == ['log1.poselog', 'log3.poselog', 'log4.poselog', 'notes.txt']
+    assert prune_logs(str(tmp_path / 'missing'), max_age_days=7, max_mb=1) == 0
@@ -0,0 +1,57 @@
+#!/usr/bin/env python3
+
+import os
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from workout_history import HISTORY_MAX_LIMIT, WorkoutHistory, week_start
+
+
+def new_history(tmp_path):
+    return WorkoutHistory(str(tmp_path / 'history' / 'workouts.db'))
+
+
+def test_rollups_follow_recorded_workouts(tmp_path):
+    history = new_history(tmp_path)
+    now = time.time()
+    history.record('s1', 'ana', 'bicep_curl', now - 120, now - 60, reps=10, good_reps=8)
+    history.record('s2', 'ana', 'bicep_curl', now - 50, now - 10, reps=12, good_reps=6)
+    history.record('s3', None, 'bicep_curl', now - 50, now - 10, reps=30, good_reps=30)
+
+    best = history.bests('ana')['bicep_curl']
+    assert best['sessions'] == 2
+    assert best['total_reps'] == 22
+    assert best['best_reps'] == 12
+    assert best['best_session_id'] == 's2'
+    assert best['good_rep_ratio'] == 14 / 22
+
+    # Anonymous workouts are stored but roll up into no one's totals
+    assert len(history.workouts()) == 3
+    weekly = history.weekly('ana')
+    assert [(row['week'], row['reps']) for row in weekly] == [(week_start(now - 10), 22)]
+    assert [row['user_id'] for row in history.leaderboard('bicep_curl')] == ['ana']
+
+
+def test_limit_is_clamped(tmp_path):
+    history = new_history(tmp_path)
+    now = time.time()
+    for i in range(5):
+        history.record(f's{i}', 'ana', 'squat', now - 10, now - i, reps=i, good_reps=i)
+
+    # SQLite would read a negative limit as no limit at all
+    assert len(history.workouts(limit=-1)) == 1
+    assert len(history.workouts(limit=0)) == 1
+    assert len(history.workouts(limit=HISTORY_MAX_LIMIT * 10)) == 5
+    assert [row['reps'] for row in history.workouts(order='reps', limit=2)] == [4, 3]
+
+
+def test_weeks_is_clamped(tmp_path):
+    history = new_history(tmp_path)
+    now = time.time()
+    history.record('s1', 'ana', 'squat', now - 10, now, reps=5, good_reps=5)
+
+    for weeks in (-5, 0, 1, 100000000):
+        assert [row['reps'] for row in history.weekly('ana', weeks=weeks)] == [5]
@@ -0,0 +1,34 @@
+#!/usr/bin/env python3
+
+from mediapipe.calculators.tensor import inference_calculator_pb2
+from mediapipe.framework import thread_pool_executor_pb2
+from mediapipe.python.solutions import pose as mp_pose
+
+
+class ThreadedPose(mp_pose.Pose):
+    """MediaPipe Pose whose graph and TFLite inference run on a fixed number of threads.
+
+    Left alone, every graph sizes its executor and XNNPACK pool by the
+    number of cores, so a handful of sessions oversubscribe the machine.
+    mp_pose.Pose does not expose either setting, so they are written into the
+    expanded graph config in the hook SolutionBase calls before starting it.
+    """
+
+    def __init__(self, num_threads=1, **options):
+        self._num_threads = num_threads
+        super().__init__(**options)
+
+    def _modify_calculator_options(self, calculator_graph_config, calculator_params):
+        super()._modify_calculator_options(calculator_graph_config, calculator_params)
+
+        executor = next((e for e in calculator_graph_config.executor if not e.name), None)
+        if executor is None:
+            executor = calculator_graph_config.executor.add()
+        executor.type = 'ThreadPoolExecutor'
+        executor.options.Extensions[thread_pool_executor_pb2.ThreadPoolExecutorOptions.ext].num_threads = \
+            self._num_threads
+
+        for node in calculator_graph_config.node:
+            if node.calculator.startswith('InferenceCalculator'):
+                options = node.options.Extensions[inference_calculator_pb2.InferenceCalculatorOptions.ext]
+                options.delegate.xnnpack.num_threads = self._num_threads
@@ -0,0 +1,226 @@
+#!/usr/bin/env python3
+
+import datetime
+import os
+import sqlite3
+import threading
+import time
+
+from workout_sessions import POSE_DATA_DIR
+
+# SQLite file finished workouts are kept in, shared by all worker processes
+WORKOUT_HISTORY_PATH = os.environ.get('WORKOUT_HISTORY_PATH', os.path.join(POSE_DATA_DIR, 'workout_history.db'))
+
+# Rows a history query returns at most
+HISTORY_MAX_LIMIT = 500
+
+# Weeks of weekly totals a query covers at most, ten years
+HISTORY_MAX_WEEKS = 520
+
+# Seconds a writer waits for another process's transaction before failing
+HISTORY_BUSY_TIMEOUT = 5.0
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS workouts (
+    id INTEGER PRIMARY KEY,
+    session_id TEXT NOT NULL,
+    user_id TEXT,
+    exercise TEXT NOT NULL,
+    started REAL NOT NULL,
+    ended REAL NOT NULL,
+    duration REAL NOT NULL,
+    reps INTEGER NOT NULL,
+    good_reps INTEGER NOT NULL,
+    frames INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS workouts_time ON workouts (ended);
+CREATE INDEX IF NOT EXISTS workouts_user_time ON workouts (user_id, ended);
+CREATE INDEX IF NOT EXISTS workouts_user_exercise_time ON workouts (user_id, exercise, ended);
+CREATE INDEX IF NOT EXISTS workouts_exercise_time ON workouts (exercise, ended);
+CREATE INDEX IF NOT EXISTS workouts_exercise_reps ON workouts (exercise, reps, ended);
+
+CREATE TABLE IF NOT EXISTS personal_bests (
+    user_id TEXT NOT NULL,
+    exercise TEXT NOT NULL,
+    sessions INTEGER NOT NULL,
+    total_reps INTEGER NOT NULL,
+    total_good_reps INTEGER NOT NULL,
+    total_duration REAL NOT NULL,
+    best_reps INTEGER NOT NULL,
+    best_good_reps INTEGER NOT NULL,
+    best_session_id TEXT NOT NULL,
+    best_ended REAL NOT NULL,
+    last_ended REAL NOT NULL,
+    PRIMARY KEY (user_id, exercise)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS weekly_totals (
+    user_id TEXT NOT NULL,
+    exercise TEXT NOT NULL,
+    week TEXT NOT NULL,
+    sessions INTEGER NOT NULL,
+    reps INTEGER NOT NULL,
+    good_reps INTEGER NOT NULL,
+    duration REAL NOT NULL,
+    PRIMARY KEY (user_id, exercise, week)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS weekly_exercise_week_reps ON weekly_totals (exercise, week, reps);
+"""
+
+_WORKOUT_COLUMNS = 'session_id, user_id, exercise, started, ended, duration, reps, good_reps, frames'
+
+
+def week_start(timestamp):
+    """ISO date of the Monday (UTC) starting the week of a Unix timestamp"""
+    day = datetime.datetime.fromtimestamp(timestamp, datetime.timezone.utc).date()
+    return (day - datetime.timedelta(days=day.weekday())).isoformat()
+
+
+def _limit(limit):
+    # SQLite reads a negative LIMIT as no limit at all
+    return max(1, min(int(limit), HISTORY_MAX_LIMIT))
+
+
+def _weeks(weeks):
+    # Far enough back the start of the range leaves the datetime range
+    return max(1, min(int(weeks), HISTORY_MAX_WEEKS))
+
+
+def _ratio(good, total):
+    return good / total if total else None
+
+
+class WorkoutHistory:
+    """Finished workouts in an indexed SQLite file, with rollups kept up to date on insert.
+
+    Every workout is a row indexed by user, exercise and end time. Workouts
+    of known users also update their personal bests and weekly totals in the
+    same transaction, so bests, trends and weekly leaderboards are primary
+    key lookups however many workouts are stored. Each thread gets its own
+    connection, and WAL mode lets the worker processes of start_pose_server.py
+    share the file.
+    """
+
+    def __init__(self, path=WORKOUT_HISTORY_PATH):
+        self.path = path
+        self._local = threading.local()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with self._connect() as db:
+            db.executescript(_SCHEMA)
+
+    def _connect(self):
+        db = getattr(self._local, 'db', None)
+        if db is None:
+            db = sqlite3.connect(self.path, timeout=HISTORY_BUSY_TIMEOUT)
+            db.row_factory = sqlite3.Row
+            db.execute('PRAGMA journal_mode=WAL')
+            db.execute('PRAGMA synchronous=NORMAL')
+            self._local.db = db
+        return db
+
+    def record(self, session_id, user_id, exercise, started, ended, reps, good_reps, frames=0):
+        """Store a finished workout and fold it into the user's rollups, returns its row id"""
+        duration = max(0.0, ended - started)
+        with self._connect() as db:
+            row_id = db.execute(
+                f'INSERT INTO workouts ({_WORKOUT_COLUMNS}) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                (session_id, user_id, exercise, started, ended, duration, reps, good_reps, frames)
+            ).lastrowid
+            if user_id is None:
+                return row_id
+
+            db.execute("""
+                INSERT INTO personal_bests VALUES (?, ?, 1, ?, ?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT (user_id, exercise) DO UPDATE SET
+                    sessions = sessions + 1,
+                    total_reps = total_reps + excluded.total_reps,
+                    total_good_reps = total_good_reps + excluded.total_good_reps,
+                    total_duration = total_duration + excluded.total_duration,
+                    best_session_id = CASE WHEN excluded.best_reps > best_reps
+                                           THEN excluded.best_session_id ELSE best_session_id END,
+                    best_ended = CASE WHEN excluded.best_reps > best_reps
+                                      THEN excluded.best_ended ELSE best_ended END,
+                    best_reps = max(best_reps, excluded.best_reps),
+                    best_good_reps = max(best_good_reps, excluded.best_good_reps),
+                    last_ended = max(last_ended, excluded.last_ended)
+            """, (user_id, exercise, reps, good_reps, duration, reps, good_reps, session_id, ended, ended))
+            db.execute("""
+                INSERT INTO weekly_totals VALUES (?, ?, ?, 1, ?, ?, ?)
+                ON CONFLICT (user_id, exercise, week) DO UPDATE SET
+                    sessions = sessions + 1,
+                    reps = reps + excluded.reps,
+                    good_reps = good_reps + excluded.good_reps,
+                    duration = duration + excluded.duration
+            """, (user_id, exercise, week_start(ended), reps, good_reps, duration))
+        return row_id
+
+    def workouts(self, user_id=None, exercise=None, since=None, until=None, order='recent', limit=50):
+        """Stored workouts, newest first or with the most reps first when ``order`` is 'reps'"""
+        where, params = [], []
+        for clause, value in (('user_id = ?', user_id), ('exercise = ?', exercise),
+                              ('ended >= ?', since), ('ended < ?', until)):
+            if value is not None:
+                where.append(clause)
+                params.append(value)
+        sql = f'SELECT {_WORKOUT_COLUMNS} FROM workouts'
+        if where:
+            sql += ' WHERE ' + ' AND '.join(where)
+        sql += ' ORDER BY reps DESC, ended DESC' if order == 'reps' else ' ORDER BY ended DESC'
+        sql += ' LIMIT ?'
+        params.append(_limit(limit))
+        rows = self._connect().execute(sql, params).fetchall()
+        return [dict(row, good_rep_ratio=_ratio(row['good_reps'], row['reps'])) for row in rows]
+
+    def bests(self, user_id):
+        """Personal bests and all-time totals of a user, by exercise"""
+        rows = self._connect().execute(
+            'SELECT * FROM personal_bests WHERE user_id = ? ORDER BY exercise', (user_id,)
+        ).fetchall()
+        return {
+            row['exercise']: {
+                'sessions': row['sessions'],
+                'total_reps': row['total_reps'],
+                'total_good_reps': row['total_good_reps'],
+                'total_duration': row['total_duration'],
+                'good_rep_ratio': _ratio(row['total_good_reps'], row['total_reps']),
+                'best_reps': row['best_reps'],
+                'best_good_reps': row['best_good_reps'],
+                'best_session_id': row['best_session_id'],
+                'best_ended': row['best_ended'],
+                'last_ended': row['last_ended']
+            }
+            for row in rows
+        }
+
+    def weekly(self, user_id, exercise=None, weeks=12):
+        """Weekly totals and good-rep ratio of a user over the last ``weeks`` weeks, oldest first"""
+        first = week_start(time.time() - 7 * 86400 * (_weeks(weeks) - 1))
+        sql = 'SELECT * FROM weekly_totals WHERE user_id = ? AND week >= ?'
+        params = [user_id, first]
+        if exercise is not None:
+            # The primary key covers user, exercise and week
+            sql = 'SELECT * FROM weekly_totals WHERE user_id = ? AND exercise = ? AND week >= ?'
+            params = [user_id, exercise, first]
+        rows = self._connect().execute(sql + ' ORDER BY week, exercise', params).fetchall()
+        return [
+            {
+                'week': row['week'],
+                'exercise': row['exercise'],
+                'sessions': row['sessions'],
+                'reps': row['reps'],
+                'good_reps': row['good_reps'],
+                'duration': row['duration'],
+                'good_rep_ratio': _ratio(row['good_reps'], row['reps'])
+            }
+            for row in rows
+        ]
+
+    def leaderboard(self, exercise, week=None, limit=10):
+        """Users with the most reps of an exercise in a week, the current one by default"""
+        week = week or week_start(time.time())
+        rows = self._connect().execute(
+            'SELECT user_id, sessions, reps, good_reps FROM weekly_totals '
+            'WHERE exercise = ? AND week = ? ORDER BY reps DESC LIMIT ?',
+            (exercise, week, _limit(limit))
+        ).fetchall()
+        return [dict(row, good_rep_ratio=_ratio(row['good_reps'], row['reps'])) for row in rows]
@@ -0,0 +1,248 @@
+#!/usr/bin/env python3
+
+import os
+import threading
+import time
+import uuid
+
+# Directory the server keeps its data in, independent of the working directory
+POSE_DATA_DIR = os.environ.get('POSE_DATA_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data'))
+
+# Sessions without any activity for this long are dropped by the sweeper
+SESSION_IDLE_TIMEOUT = float(os.environ.get('SESSION_IDLE_TIMEOUT', '600'))
+
+
+class WorkoutSession:
+    """Workout state of a single trainee"""
+
+    __slots__ = (
+        'session_id', 'sid', 'user_id', 'active', 'exercise', 'counter', 'stage',
+        'good_reps', 'feedback', 'start_time', 'created', 'last_seen', 'lock',
+        'analytics', 'log', 'annotate', 'profile', 'tracker', 'roi', 'slo', 'motion_gate', 'people',
+        'pipeline', 'metrics_stream', 'pending_frame', 'draining', 'mailbox_lock',
+        'frames_received', 'frames_processed', 'frames_dropped',
+    )
+
+    def __init__(self, session_id, exercise, stage='down', timed=False, annotate=False,
+                 profile=False, user_id=None):
+        self.session_id = session_id
+        self.sid = None
+        self.user_id = user_id
+        self.active = True
+        self.exercise = exercise
+        self.counter = 0
+        self.stage = stage
+        self.good_reps = 0
+        self.feedback = []
+        self.start_time = time.time() if timed else None
+        self.created = time.time()
+        self.last_seen = time.monotonic()
+        self.lock = threading.Lock()
+
+        # RepAnalytics of rep exercises, fed by the exercise engine
+        self.analytics = None
+
+        # SessionLog recording every scored frame, None keeps no log
+        self.log = None
+
+        # Annotated frames are a debug mode, clients normally draw landmarks
+        self.annotate = annotate
+
+        # Profiled sessions get per-stage timings with every pose_analysis
+        self.profile = profile
+
+        # MetricsStream of a client that subscribed to metric changes, None sends metrics with every frame
+        self.metrics_stream = None
+
+        # LandmarkTracker of sessions in keyframe mode, None runs inference on every frame
+        self.tracker = None
+
+        # RegionOfInterest of sessions that crop frames around the trainee
+        self.roi = None
+
+        # LatencyController choosing the session's quality level, None keeps full quality
+        self.slo = None
+
+        # MotionGate reusing the last result on static frames, None infers every frame
+        self.motion_gate = None
+
+        # PersonTracker of multi-person sessions, each person then has their own state
+        self.people = None
+
+        # FramePipeline overlapping the stages of consecutive frames, None processes them in a row
+        self.pipeline = None
+
+        # One-slot frame mailbox, the newest frame always wins
+        self.pending_frame = None
+        self.draining = False
+        self.mailbox_lock = threading.Lock()
+        self.frames_received = 0
+        self.frames_processed = 0
+        self.frames_dropped = 0
+
+    def offer_frame(self, frame):
+        """Queue a frame, replacing a stale one that was not processed yet.
+
+        Returns True when no worker is draining the mailbox and the caller
+        has to start one.
+        """
+        with self.mailbox_lock:
+            self.frames_received += 1
+            if self.pending_frame is not None:
+                self.frames_dropped += 1
+            self.pending_frame = frame
+
+            if self.draining:
+                return False
+            self.draining = True
+            return True
+
+    def take_frame(self):
+        """Pop the pending frame, or mark the mailbox idle if there is none"""
+        with self.mailbox_lock:
+            frame = self.pending_frame
+            self.pending_frame = None
+            if frame is None:
+                self.draining = False
+            return frame
+
+    def drop_frame(self):
+        """Count a taken frame that was dropped instead of processed"""
+        with self.mailbox_lock:
+            self.frames_dropped += 1
+
+    def stop_draining(self):
+        """Mark the mailbox idle after a drain stopped early"""
+        with self.mailbox_lock:
+            self.draining = False
+
+    def count_frames(self, count=1):
+        """Count frames analysed straight from client landmarks, outside the mailbox"""
+        with self.mailbox_lock:
+            self.frames_received += count
+            self.frames_processed += count
+
+    def frame_stats(self):
+        """Frame counters of the session"""
+        stats = {
+            'received': self.frames_received,
+            'processed': self.frames_processed,
+            'dropped': self.frames_dropped
+        }
+        if self.tracker is not None:
+            stats.update(self.tracker.stats())
+        if self.motion_gate is not None:
+            stats.update(self.motion_gate.stats())
+        if self.people is not None:
+            stats['people'] = len(self.people.people)
+        return stats
+
+    def metrics(self):
+        """Live metrics sent with every pose_analysis event, or as changes through a MetricsStream"""
+        metrics = {
+            'reps': self.counter,
+            'stage': self.stage,
+            'good_reps': self.good_reps,
+            'feedback': self.feedback
+        }
+        if self.slo is not None:
+            metrics['quality_level'] = self.slo.level
+        if self.analytics is not None:
+            metrics['rep_analytics'] = self.analytics.live()
+        return metrics
+
+    def summary(self):
+        """Summary returned when the workout ends"""
+        duration = time.time() - (self.start_time or time.time())
+        summary = {
+            'reps': self.counter,
+            'good_reps': self.good_reps,
+            'duration': duration,
+            'exercise': self.exercise,
+            'frames': self.frame_stats()
+        }
+        if self.analytics is not None:
+            summary['rep_breakdown'] = self.analytics.breakdown()
+        if self.people is not None:
+            summary['people'] = self.people.summaries()
+        if self.log is not None:
+            # The file name within the log directory, clients have no business with server paths
+            summary['log'] = os.path.basename(self.log.path)
+        return summary
+
+
+class SessionRegistry:
+    """Thread-safe registry of workout sessions keyed by session id.
+
+    A session can additionally be bound to the Socket.IO sid that streams its
+    frames, so that socket events can find it without repeating the id and so
+    that a disconnect can clean up after the client.
+    """
+
+    def __init__(self, idle_timeout=SESSION_IDLE_TIMEOUT):
+        self.idle_timeout = idle_timeout
+        self._sessions = {}
+        self._by_sid = {}
+        self._lock = threading.Lock()
+
+    def create(self, exercise, session_id=None, **options):
+        """Start a new session, replacing any previous one with the same id"""
+        session = WorkoutSession(session_id or uuid.uuid4().hex, exercise, **options)
+        with self._lock:
+            previous = self._sessions.get(session.session_id)
+            if previous is not None and previous.sid is not None:
+                self._by_sid.pop(previous.sid, None)
+            self._sessions[session.session_id] = session
+        return session
+
+    def get(self, session_id):
+        """Return the session with the given id, or None"""
+        return self._sessions.get(session_id)
+
+    def get_by_sid(self, sid):
+        """Return the session streamed by a Socket.IO client, or None"""
+        session_id = self._by_sid.get(sid)
+        return self._sessions.get(session_id) if session_id else None
+
+    def bind(self, session, sid):
+        """Associate a session with the Socket.IO client sending its frames"""
+        with self._lock:
+            if session.sid is not None and session.sid != sid:
+                self._by_sid.pop(session.sid, None)
+            session.sid = sid
+            self._by_sid[sid] = session.session_id
+
+    def remove(self, session_id):
+        """Forget a session and return it, or None if it was unknown"""
+        with self._lock:
+            session = self._sessions.pop(session_id, None)
+            if session is not None and session.sid is not None:
+                self._by_sid.pop(session.sid, None)
+        return session
+
+    def unbind_sid(self, sid):
+        """Detach a disconnected client and return the session it streamed"""
+        with self._lock:
+            session_id = self._by_sid.pop(sid, None)
+            session = self._sessions.get(session_id) if session_id else None
+            if session is not None:
+                session.sid = None
+        return session
+
+    def evict_idle(self):
+        """Drop sessions idle past the timeout and return them"""
+        cutoff = time.monotonic() - self.idle_timeout
+        with self._lock:
+            stale = [s for s in self._sessions.values() if s.last_seen < cutoff]
+            for session in stale:
+                del self._sessions[session.session_id]
+                if session.sid is not None:
+                    self._by_sid.pop(session.sid, None)
+        return stale
+
+    def __len__(self):
+        return len(self._sessions)
+
+    def __iter__(self):
+        with self._lock:
+            return iter(list(self._sessions.values()))